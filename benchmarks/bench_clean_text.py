@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark cho clean_text
+So sánh chi phí mỗi lần gọi giữa cách cũ (luôn parse BeautifulSoup, regex
+biên dịch tại chỗ) và clean_text hiện tại, trên các mô tả RSS mẫu theo định
+dạng của các feed đang cấu hình.
+
+Chạy: python benchmarks/bench_clean_text.py [số lần lặp]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from clean_news_digest import clean_text
+
+# Mô tả RSS mẫu, giữ đúng định dạng của từng nguồn
+SAMPLE_DESCRIPTIONS = {
+    "vnexpress.net": (
+        '<a href="https://vnexpress.net/chay-nha-tro-o-ha-noi-4700001.html">'
+        '<img src="https://i1-vnexpress.vnecdn.net/2024/01/01/chay-1704067200.jpg?w=1200&h=0&q=100" >'
+        '</a></br>Đám cháy bùng phát lúc rạng sáng tại khu nhà trọ 5 tầng ở quận Cầu Giấy, '
+        'lực lượng PCCC mất hơn một giờ để khống chế, 12 người được giải cứu.'
+    ),
+    "tuoitre.vn": (
+        '<a href="https://tuoitre.vn/metro-so-1-chay-thu-20240101080000000.htm">'
+        '<img src="https://cdn.tuoitre.vn/thumb_w/480/2024/1/1/metro-1704067200.jpg" /></a>'
+        'Tuyến metro số 1 Bến Thành - Suối Tiên chạy thử toàn tuyến, dự kiến vận hành thương mại trong năm nay.'
+    ),
+    "baochinhphu.vn": (
+        'Thủ tướng yêu cầu các bộ, ngành rà soát, hoàn thiện quy định về phòng cháy, chữa cháy '
+        'đối với nhà ở kết hợp kinh doanh, cơ sở karaoke và chung cư mini trong quý I.'
+    ),
+    "cand.com.vn": (
+        'Cảnh sát PCCC&amp;CNCH Công an TP Hà Nội đã kịp thời dập tắt đám cháy xưởng gỗ '
+        '&quot;không để lan sang khu dân cư&quot; lúc 2h sáng nay.'
+    ),
+    "petrotimes.vn": (
+        'Giá LNG giao ngay tại châu Á giảm xuống mức thấp nhất trong 3 tháng do nhu cầu sưởi ấm '
+        'yếu và tồn kho tại Nhật Bản, Hàn Quốc ở mức cao.'
+    ),
+}
+
+def clean_text_reference(text):
+    """Bản clean_text trước khi tối ưu, dùng để so sánh"""
+    if not text:
+        return ""
+    
+    soup = BeautifulSoup(text, 'html.parser')
+    text = soup.get_text()
+    text = re.sub(r'\s+', ' ', text.strip())
+    text = re.sub(r'[^\w\s.,!?;:()\-""''…]', '', text)
+    return text
+
+def per_call_us(func, text, number):
+    return timeit.timeit(lambda: func(text), number=number) / number * 1e6
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    
+    print(f"\n⏱️ clean_text microbenchmark ({number} lần/mẫu)")
+    print(f"{'Nguồn':<16}{'Có HTML':>9}{'Cũ (µs)':>12}{'Mới (µs)':>12}{'Nhanh hơn':>12}")
+    print("-" * 61)
+    
+    total_old = total_new = 0.0
+    for source, text in SAMPLE_DESCRIPTIONS.items():
+        # Kết quả phải giống hệt cách cũ
+        assert clean_text(text) == clean_text_reference(text), source
+        
+        old_us = per_call_us(clean_text_reference, text, number)
+        new_us = per_call_us(clean_text, text, number)
+        total_old += old_us
+        total_new += new_us
+        has_markup = "có" if ('<' in text or '&' in text) else "không"
+        print(f"{source:<16}{has_markup:>9}{old_us:>12.1f}{new_us:>12.1f}{old_us / new_us:>11.1f}x")
+    
+    print("-" * 61)
+    print(f"{'Tổng':<16}{'':>9}{total_old:>12.1f}{total_new:>12.1f}{total_old / total_new:>11.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dựng email
+So sánh cách dựng cũ (nối chuỗi `body +=` cho từng bài, chỉ có text) với
+render_email hiện tại (ghép các đoạn vào list rồi join một lần, text + HTML)
+trên các bản tin giả lập từ vài chục tới hàng nghìn bài (bản tổng hợp tuần).
+
+Chạy: python benchmarks/bench_email.py [--articles 30,1000,5000] [--rounds 20]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+def make_news_data(article_count):
+    """Bản tin giả lập: chia đều article_count bài cho các chủ đề đang cấu hình"""
+    topics = list(digest.RSS_FEEDS)
+    news_data = {topic: [] for topic in topics}
+    for i in range(article_count):
+        topic = topics[i % len(topics)]
+        news_data[topic].append({
+            "title": f"Tin {topic} số {i}: cập nhật tình hình & diễn biến mới <nhất>",
+            "link": f"https://example.vn/{topic.lower()}/bai-viet-{i}.html?utm_source=rss&id={i}",
+            "published": "Mon, 06 Jan 2025 08:00:00 +0700" if i % 4 else "",
+            "summary": (f"Tóm tắt bài {i}: cơ quan chức năng cho biết dự án tiếp tục được triển khai "
+                        f"theo kế hoạch, dự kiến hoàn thành trong năm nay với tổng vốn đầu tư lớn."),
+            "content_length": 2000 + i,
+        })
+    return news_data
+
+def generate_email_content_reference(news_data):
+    """Bản generate_email_content trước khi tối ưu (nối chuỗi từng dòng), dùng để so sánh"""
+    today = digest.datetime.now()
+    date_str = today.strftime("%Y-%m-%d")
+    time_str = today.strftime("%H:%M:%S")
+
+    total_count = sum(len(articles) for articles in news_data.values())
+    subject = f"[BẢN TIN] PCCC·LNG·MRT — {date_str} ({total_count} tin)"
+    body = f"""📰 BẢN TIN TỰ ĐỘNG HÀNG NGÀY
+📅 Ngày: {date_str}
+⏰ Tạo lúc: {time_str}
+📊 Tổng số: {total_count} tin tức
+{'='*60}
+
+"""
+    for topic, articles in news_data.items():
+        if not articles:
+            continue
+        body += f"\n🏷️  {topic} ({len(articles)} tin)\n"
+        body += "─" * 50 + "\n\n"
+        for i, article in enumerate(articles, 1):
+            body += f"{i}. {article['title']}\n"
+            if article['link']:
+                body += f"🔗 {article['link']}\n"
+            if article['published']:
+                body += f"📅 {article['published']}\n"
+            body += f"📝 Tóm tắt: {article['summary']}\n"
+            body += f"📏 Độ dài: {article['content_length']} ký tự\n"
+            body += "\n" + "·" * 40 + "\n\n"
+    body += f"""
+{'='*60}
+🤖 Hệ thống Daily Digest tự động
+🔄 Lần chạy tiếp theo: Ngày mai 08:00
+⚙️ Phiên bản: 2.0 (No newspaper3k)
+"""
+    return subject, body
+
+def best_ms(func, rounds):
+    """Thời gian nhỏ nhất của một lần gọi (ms) qua `rounds` lần chạy"""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dựng email text/HTML")
+    parser.add_argument("--articles", default="30,1000,5000", help="Các số bài cần đo, cách nhau bằng dấu phẩy")
+    parser.add_argument("--rounds", type=int, default=20, help="Số lần chạy mỗi trường hợp (lấy lần nhanh nhất)")
+    args = parser.parse_args()
+
+    print(f"\n⏱️ Dựng email (nhanh nhất trong {args.rounds} lần)")
+    print(f"{'Số bài':>8}{'Cũ text ms':>12}{'Mới text ms':>13}{'Text+HTML ms':>14}{'µs/bài':>9}{'HTML KB':>10}")
+    print("-" * 66)
+
+    strip_time = lambda body: re.sub("⏰ Tạo lúc: .*", "", body)
+    for count in [int(value) for value in args.articles.split(",") if value.strip()]:
+        news_data = make_news_data(count)
+
+        # Bản text phải giống hệt cách cũ
+        _, reference = generate_email_content_reference(news_data)
+        _, text, html_body = digest.render_email(news_data, with_html=True)
+        assert strip_time(text) == strip_time(reference), count
+
+        old_ms = best_ms(lambda: generate_email_content_reference(news_data), args.rounds)
+        text_ms = best_ms(lambda: digest.render_email(news_data, with_html=False), args.rounds)
+        both_ms = best_ms(lambda: digest.render_email(news_data, with_html=True), args.rounds)
+        print(f"{count:>8}{old_ms:>12.2f}{text_ms:>13.2f}{both_ms:>14.2f}"
+              f"{both_ms * 1000 / max(count, 1):>9.1f}{len(html_body.encode('utf-8')) / 1024:>10.0f}")
+
+if __name__ == "__main__":
+    main()
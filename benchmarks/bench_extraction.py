@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark trích xuất và làm sạch nội dung trên corpus đã ghi sẵn
+Đo throughput (trang/s, MB/s), độ trễ p50/p95/p99 và bộ nhớ đỉnh cho từng hàm,
+lưu kết quả ra JSON và so sánh với baseline để phát hiện chậm đi.
+
+Mỗi lời gọi chỉ mất dưới một mili giây nên p95 dao động mạnh giữa các lần
+chạy; việc so sánh với baseline chỉ dựa trên throughput của lượt nhanh nhất
+(ít nhiễu nhất) qua nhiều lượt. p50/p95/p99 chỉ để tham khảo. Baseline nên
+được ghi với cùng số lượt (--rounds) như khi so sánh.
+
+Chạy:
+    python benchmarks/bench_extraction.py                  # chạy và so với baseline
+    python benchmarks/bench_extraction.py --save-baseline  # ghi kết quả làm baseline mới
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import feedparser
+import clean_news_digest as digest
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_ROUNDS = 20
+MIN_CASE_SECONDS = 0.5  # Hàm quá nhanh được chạy thêm lượt cho đủ thời gian đo
+
+def load_corpus():
+    """Đọc manifest và nội dung corpus (bytes)"""
+    with open(os.path.join(CORPUS_DIR, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    def read(item):
+        with open(os.path.join(CORPUS_DIR, item["file"]), "rb") as f:
+            return dict(item, data=f.read())
+    
+    return manifest, [read(item) for item in manifest["feeds"]], [read(item) for item in manifest["pages"]]
+
+def build_cases(feeds, pages):
+    """Danh sách (tên, hàm, danh sách input, số byte mỗi input)"""
+    html_inputs = [(digest.decode_html(page["data"]), page["url"]) for page in pages]
+    html_sizes = [len(page["data"]) for page in pages]
+    
+    articles = [digest.extract_content_from_html(html, url) for html, url in html_inputs]
+    
+    entries = [entry for feed in feeds for entry in feedparser.parse(feed["data"]).entries]
+    descriptions = [entry.get("description", "") for entry in entries]
+    
+    cases = [
+        ("decode_html[resolve_charset]", lambda data: digest.decode_html(data),
+         [page["data"] for page in pages], html_sizes),
+        ("chardet.detect[full body]", lambda data: digest.chardet.detect(data),
+         [page["data"] for page in pages], html_sizes),
+        ("feedparser.parse", lambda data: feedparser.parse(data),
+         [feed["data"] for feed in feeds], [len(feed["data"]) for feed in feeds]),
+        ("iter_feed_entries[stream]", lambda data: list(digest.iter_feed_entries([data])),
+         [feed["data"] for feed in feeds], [len(feed["data"]) for feed in feeds]),
+        ("extract_content_from_html[density]",
+         lambda args: digest.extract_content_from_html(args[0], args[1], engine="density"),
+         html_inputs, html_sizes),
+        ("extract_content_from_html[bs4]",
+         lambda args: digest.extract_content_from_html(args[0], args[1], engine="bs4"),
+         html_inputs, html_sizes),
+        ("extract_content_density[generic]",
+         lambda args: digest.extract_content_density(args[0], args[1]),
+         html_inputs, html_sizes),
+        ("reduce_content[token budget]", digest.reduce_content,
+         articles, [len(text.encode("utf-8")) for text in articles]),
+        ("summarize_locally[textrank]", digest.summarize_locally,
+         articles, [len(text.encode("utf-8")) for text in articles]),
+        ("clean_text[rss description]", digest.clean_text,
+         descriptions, [len(text.encode("utf-8")) for text in descriptions]),
+        ("get_rss_description", digest.get_rss_description,
+         entries, [len(text.encode("utf-8")) for text in descriptions]),
+    ]
+    return cases
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_case(func, inputs, sizes, rounds):
+    """Đo một hàm: độ trễ từng lần gọi, throughput và bộ nhớ đỉnh
+    
+    Chạy ít nhất `rounds` lượt và ít nhất MIN_CASE_SECONDS giây.
+    """
+    # Khởi động (biên dịch selector, cache regex...)
+    for item in inputs:
+        func(item)
+    
+    latencies = []
+    round_times = []
+    while len(round_times) < rounds or sum(round_times) < MIN_CASE_SECONDS:
+        round_started = time.perf_counter()
+        for item in inputs:
+            call_started = time.perf_counter_ns()
+            func(item)
+            latencies.append((time.perf_counter_ns() - call_started) / 1e6)
+        round_times.append(time.perf_counter() - round_started)
+    elapsed = sum(round_times)
+    round_times.sort()
+    best = round_times[0]
+    median = round_times[len(round_times) // 2]
+    
+    # Bộ nhớ đỉnh đo riêng một lượt vì tracemalloc làm chậm đáng kể
+    tracemalloc.start()
+    for item in inputs:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    latencies.sort()
+    calls = len(latencies)
+    return {
+        "calls": calls,
+        "items_per_s": calls / elapsed if elapsed else 0.0,
+        "median_items_per_s": len(inputs) / median if median else 0.0,
+        "best_items_per_s": len(inputs) / best if best else 0.0,
+        "mb_per_s": sum(sizes) * len(round_times) / elapsed / 1e6 if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "peak_memory_kb": peak / 1024,
+    }
+
+def compare(results, baseline, threshold):
+    """So throughput lượt nhanh nhất với baseline; trả về danh sách (tên, chỉ số, giá trị cũ, giá trị mới) bị chậm đi"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or "best_items_per_s" not in previous:
+            continue
+        if current["best_items_per_s"] < previous["best_items_per_s"] * (1 - threshold):
+            regressions.append((name, "best_items_per_s", previous["best_items_per_s"], current["best_items_per_s"]))
+    return regressions
+
+def print_table(results, baseline):
+    print(f"\n{'Hàm':<38}{'trang/s':>10}{'tốt nhất':>10}{'MB/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'peak KB':>10}{'so baseline':>13}")
+    print("-" * 116)
+    for name, r in results.items():
+        previous = baseline.get(name)
+        delta = (f"{(r['best_items_per_s'] / previous['best_items_per_s'] - 1) * 100:+.0f}%"
+                 if previous and "best_items_per_s" in previous else "-")
+        print(f"{name:<38}{r['median_items_per_s']:>10.1f}{r['best_items_per_s']:>10.1f}{r['mb_per_s']:>8.2f}"
+              f"{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['peak_memory_kb']:>10.0f}{delta:>13}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trích xuất/làm sạch nội dung trên corpus offline")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="Số lượt chạy qua toàn bộ corpus")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON lưu kết quả")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="File baseline để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Mức chậm đi cho phép (0.20 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả lần này làm baseline")
+    args = parser.parse_args()
+    
+    manifest, feeds, pages = load_corpus()
+    print(f"\n📦 Corpus ({manifest.get('source', '?')}): {len(feeds)} feed, {len(pages)} trang HTML")
+    if manifest.get("source") == "synthetic":
+        print("⚠️ Corpus tổng hợp (benchmarks/make_synthetic_corpus.py) dựng theo selector của SITE_RULES: "
+              "chỉ so sánh thời gian, không dùng để đánh giá độ chính xác trích xuất")
+    
+    results = {}
+    for name, func, inputs, sizes in build_cases(feeds, pages):
+        print(f"⏱️ {name}...")
+        results[name] = run_case(func, inputs, sizes, args.rounds)
+    
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        baseline = saved.get("results", {})
+        if saved.get("rounds") != args.rounds:
+            print(f"⚠️ Baseline được ghi với {saved.get('rounds')} lượt, lần này chạy {args.rounds} lượt")
+    
+    print_table(results, baseline)
+    
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus": {"source": manifest.get("source"), "feeds": len(feeds), "pages": len(pages)},
+        "rounds": args.rounds,
+        "results": results,
+    }
+    output = args.baseline if args.save_baseline else args.output
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Đã lưu kết quả: {output}")
+    
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ Chậm hơn baseline quá {args.threshold:.0%}:")
+        for name, metric, previous, current in regressions:
+            print(f"   {name}: {metric} {previous:.3f} -> {current:.3f}")
+        return 1
+    
+    if baseline:
+        print(f"\n✅ Không có hàm nào chậm hơn baseline quá {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
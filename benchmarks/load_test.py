@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test toàn bộ pipeline với các server giả lập chạy cục bộ
+- RSS + bài viết: HTTP server trên nhiều địa chỉ loopback (127.0.0.x) để mô phỏng
+  nhiều host, có độ trễ và tỉ lệ lỗi cấu hình được
+- DeepSeek: endpoint /v1/chat/completions tương thích OpenAI
+- SMTP: server nhận thư, không gửi đi đâu
+
+Mỗi mức số feed chạy main() trong một process riêng (trạng thái sạch), đo thời
+gian tổng, throughput, thời gian từng bước và bộ nhớ đỉnh (RSS).
+
+Chạy:
+    python benchmarks/load_test.py --feeds 6,60,300 --latency 0.05 --failure-rate 0.02
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "load_test.json")
+
+TOPICS = {
+    "PCCC": ["vụ cháy", "PCCC", "cứu nạn cứu hộ"],
+    "LNG": ["LNG", "khí hóa lỏng", "điện khí"],
+    "MRT": ["metro", "tàu điện", "đường sắt đô thị"],
+}
+
+class ServerCounters:
+    """Bộ đếm dùng chung giữa các thread của server giả lập"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Handler chung: server gắn cấu hình (latency, failure_rate...) làm thuộc tính"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self, latency):
+        if latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * latency)
+
+    def _send(self, status, body, content_type):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _maybe_fail(self, failure_rate, kind):
+        if failure_rate > 0 and random.random() < failure_rate:
+            self.server.counters.add(f"{kind}_failed")
+            self._send(500, "Injected failure", "text/plain")
+            return True
+        return False
+
+class NewsSiteHandler(MockHandler):
+    """/feed/<topic>/<n>.xml và /article/<topic>/<n>/<i>.html"""
+
+    def do_GET(self):
+        server = self.server
+        self._delay(server.latency)
+
+        match = re.match(r"^/feed/(\w+)/(\d+)\.xml$", self.path)
+        if match:
+            server.counters.add("feed_requests")
+            if not self._maybe_fail(server.failure_rate, "feed"):
+                self._send(200, render_feed(self.headers.get("Host"), match.group(1), int(match.group(2)),
+                                            server.items_per_feed), "application/rss+xml; charset=utf-8")
+            return
+
+        match = re.match(r"^/article/(\w+)/(\d+)/(\d+)\.html$", self.path)
+        if match:
+            server.counters.add("article_requests")
+            if not self._maybe_fail(server.failure_rate, "article"):
+                self._send(200, render_article(match.group(1), int(match.group(2)), int(match.group(3)),
+                                               server.paragraphs), "text/html; charset=utf-8")
+            return
+
+        self._send(404, "Not found", "text/plain")
+
+class ChatCompletionHandler(MockHandler):
+    """POST /v1/chat/completions, trả lời cả request đơn lẫn request gộp (JSON)"""
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server.counters.add("llm_requests")
+        self._delay(server.latency)
+        if self._maybe_fail(server.failure_rate, "llm"):
+            return
+
+        messages = payload.get("messages") or [{}]
+        prompt = messages[-1].get("content", "")
+        numbers = re.findall(r"^\[(\d+)\] Tiêu đề:", prompt, re.MULTILINE)
+        if numbers:
+            content = json.dumps({n: f"Tóm tắt giả lập cho bài {n}." for n in numbers}, ensure_ascii=False)
+        else:
+            content = "Tóm tắt giả lập: sự việc đã được xử lý, cơ quan chức năng đang theo dõi."
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 3 + 1
+        completion_tokens = len(content) // 3 + 1
+        server.counters.add("llm_prompt_tokens", prompt_tokens)
+        self._send(200, json.dumps({
+            "id": "chatcmpl-load-test",
+            "object": "chat.completion",
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }, ensure_ascii=False), "application/json")
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """SMTP tối giản: chấp nhận mọi AUTH, đếm thư nhận được"""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        counters = self.server.counters
+        self._reply("220 localhost load-test SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250-localhost")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif command.startswith("AUTH"):
+                self._reply("235 Authentication successful")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    size += len(data_line)
+                counters.add("emails")
+                counters.add("email_bytes", size)
+                self._reply("250 OK queued")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def render_feed(host, topic, feed_number, items):
+    keywords = TOPICS.get(topic, [topic])
+    entries = []
+    for i in range(items):
+        keyword = keywords[i % len(keywords)]
+        entries.append(
+            f"<item><title>Tin {topic} {feed_number}-{i}: cập nhật về {keyword}</title>"
+            f"<link>http://{host}/article/{topic}/{feed_number}/{i}.html</link>"
+            f"<description><![CDATA[<p>Mô tả ngắn cho tin {feed_number}-{i} liên quan {keyword}.</p>]]></description>"
+            f"<pubDate>Mon, 06 Jan 2025 08:{i % 60:02d}:00 +0700</pubDate>"
+            f"<guid>{topic}-{feed_number}-{i}</guid></item>"
+        )
+    return (f"<?xml version='1.0' encoding='UTF-8'?><rss version='2.0'><channel>"
+            f"<title>Feed {topic} {feed_number}</title>{''.join(entries)}</channel></rss>")
+
+def render_article(topic, feed_number, item, paragraphs):
+    keyword = TOPICS.get(topic, [topic])[item % len(TOPICS.get(topic, [topic]))]
+    body = "".join(
+        f"<p>Đoạn {p} của bài {feed_number}-{item}: thông tin chi tiết về {keyword}, "
+        f"diễn biến mới nhất và ý kiến của các chuyên gia trong lĩnh vực.</p>"
+        for p in range(paragraphs)
+    )
+    return (f"<html><head><meta charset='utf-8'><title>Bài {feed_number}-{item}</title>"
+            f"<script>var tracking = {item};</script></head><body>"
+            f"<nav><a href='/'>Trang chủ</a><a href='/{topic}'>{topic}</a></nav>"
+            f"<article><h1>Bài {feed_number}-{item} về {keyword}</h1>{body}</article>"
+            f"<footer>Bản quyền thuộc về báo giả lập</footer></body></html>")
+
+def start_http_server(address, handler, counters, **settings):
+    server = ThreadingHTTPServer(address, handler)
+    server.daemon_threads = True
+    server.counters = counters
+    for name, value in settings.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_mock_servers(args, counters):
+    """Khởi động các server giả lập; trả về (danh sách server, địa chỉ các host tin, url LLM, cổng SMTP)"""
+    servers, news_hosts = [], []
+    for k in range(args.hosts):
+        address = f"127.0.0.{k + 1}"
+        try:
+            server = start_http_server((address, 0), NewsSiteHandler, counters, latency=args.latency,
+                                       failure_rate=args.failure_rate, items_per_feed=args.items_per_feed,
+                                       paragraphs=args.paragraphs)
+        except OSError as e:
+            print(f"⚠️ Không bind được {address} ({e}), dùng chung các host đã có")
+            break
+        servers.append(server)
+        news_hosts.append(f"{address}:{server.server_address[1]}")
+
+    llm = start_http_server(("127.0.0.1", 0), ChatCompletionHandler, counters,
+                            latency=args.llm_latency, failure_rate=args.llm_failure_rate)
+    servers.append(llm)
+
+    smtp = ThreadingSMTPServer(("127.0.0.1", 0), SMTPSinkHandler)
+    smtp.counters = counters
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    servers.append(smtp)
+
+    return servers, news_hosts, f"http://127.0.0.1:{llm.server_address[1]}/v1/chat/completions", smtp.server_address[1]
+
+def build_feeds(feed_count, news_hosts):
+    """Chia feed_count feed đều cho các chủ đề và các host"""
+    feeds = {topic: [] for topic in TOPICS}
+    topics = list(TOPICS)
+    for n in range(feed_count):
+        topic = topics[n % len(topics)]
+        feeds[topic].append(f"http://{news_hosts[n % len(news_hosts)]}/feed/{topic}/{n}.xml")
+    return feeds
+
+def run_child(config_file, result_file):
+    """Chạy trong process con: thay RSS_FEEDS, bọc các bước để đo thời gian rồi gọi main()"""
+    import resource
+    sys.path.insert(0, REPO_DIR)
+    import clean_news_digest as digest
+
+    with open(config_file, encoding="utf-8") as f:
+        config = json.load(f)
+    digest.RSS_FEEDS.clear()
+    digest.RSS_FEEDS.update(config["feeds"])
+
+    lock = threading.Lock()
+    stages = {}
+    collected = {"articles": 0}
+
+    def timed(name, func):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stage = stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+                    stage["calls"] += 1
+                    stage["seconds"] += elapsed
+        return wrapper
+
+    collect_all_news = digest.collect_all_news
+    def counting_collect(*args, **kwargs):
+        news_data = collect_all_news(*args, **kwargs)
+        collected["articles"] = sum(len(articles) for articles in news_data.values())
+        return news_data
+
+    # Bước "wall" (gọi một lần) và bước cộng dồn thời gian của các luồng
+    digest.collect_all_news = timed("collect_all_news", counting_collect)
+    digest.process_entries = timed("process_entries", digest.process_entries)
+    digest.save_feed_state = timed("save_feed_state", digest.save_feed_state)
+    digest.send_daily_email = timed("send_daily_email", digest.send_daily_email)
+    for name in ("fetch_feed_entries", "fetch_article_content", "extract_content_from_html",
+                 "summarize_with_deepseek", "summarize_batch_with_deepseek"):
+        setattr(digest, name, timed(name, getattr(digest, name)))
+
+    started = time.perf_counter()
+    success = digest.main()
+    wall = time.perf_counter() - started
+
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "success": success,
+            "wall_s": wall,
+            "articles": collected["articles"],
+            "stages": stages,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "http": digest.get_http_stats(),
+        }, f)
+
+def run_scale(feed_count, args, news_hosts, llm_url, smtp_port, counters):
+    """Chạy main() một lần với feed_count feed trong process con"""
+    with tempfile.TemporaryDirectory(prefix="digest-load-") as workdir:
+        config_file = os.path.join(workdir, "config.json")
+        result_file = os.path.join(workdir, "result.json")
+        with open(config_file, "w", encoding="utf-8") as f:
+            json.dump({"feeds": build_feeds(feed_count, news_hosts)}, f)
+
+        env = dict(os.environ)
+        env.update({
+            "DIGEST_STATE_DIR": os.path.join(workdir, "state"),
+            "DIGEST_HOST_MIN_INTERVAL": str(args.host_interval),
+            "DEEPSEEK_API_KEY": "load-test",
+            "DEEPSEEK_API_URL": llm_url,
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(smtp_port),
+            "SMTP_USER": "digest@load.test",
+            "SMTP_PASS": "load-test",
+            "EMAIL_TO": "reader@load.test",
+            "SMTP_STARTTLS": "0",
+            "PYTHONIOENCODING": "utf-8",
+        })
+
+        before = counters.snapshot()
+        with open(os.path.join(workdir, "main.log"), "w", encoding="utf-8") as log:
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", config_file, result_file],
+                env=env, stdout=None if args.verbose else log, stderr=subprocess.STDOUT, cwd=workdir,
+            )
+        after = counters.snapshot()
+
+        if process.returncode != 0 or not os.path.exists(result_file):
+            print(f"❌ {feed_count} feed: process con lỗi (mã {process.returncode})")
+            return None
+        with open(result_file, encoding="utf-8") as f:
+            result = json.load(f)
+
+    result["feeds"] = feed_count
+    result["server"] = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+    result["feeds_per_s"] = feed_count / result["wall_s"] if result["wall_s"] else 0.0
+    result["articles_per_s"] = result["articles"] / result["wall_s"] if result["wall_s"] else 0.0
+    return result
+
+def print_report(results):
+    print(f"\n{'Feed':>6}{'Bài':>7}{'Wall s':>9}{'feed/s':>9}{'bài/s':>8}{'RSS MB':>9}"
+          f"{'Tải feed':>10}{'Xử lý bài':>11}{'Email':>8}{'Lỗi':>6}{'Thư':>5}")
+    print("-" * 88)
+    for r in results:
+        stages = r["stages"]
+        collect = stages.get("collect_all_news", {}).get("seconds", 0.0)
+        email = stages.get("send_daily_email", {}).get("seconds", 0.0)
+        failures = sum(v for k, v in r["server"].items() if k.endswith("_failed"))
+        if "process_entries" in stages:
+            process = stages["process_entries"]["seconds"]
+            split = f"{collect - process:>10.2f}{process:>11.2f}"
+        else:  # DIGEST_PIPELINE=1: các bước chạy chồng lên nhau, không tách được
+            split = f"{'-':>10}{'-':>11}"
+        print(f"{r['feeds']:>6}{r['articles']:>7}{r['wall_s']:>9.2f}{r['feeds_per_s']:>9.1f}{r['articles_per_s']:>8.1f}"
+              f"{r['peak_rss_mb']:>9.1f}{split}{email:>8.2f}"
+              f"{failures:>6}{r['server'].get('emails', 0):>5}")
+
+    print("\nThời gian cộng dồn theo bước (tổng thời gian các luồng, giây):")
+    names = sorted({name for r in results for name in r["stages"]})
+    print(f"{'Bước':<32}" + "".join(f"{r['feeds']:>10}" for r in results))
+    for name in names:
+        print(f"{name:<32}" + "".join(f"{r['stages'].get(name, {}).get('seconds', 0.0):>10.2f}" for r in results))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test pipeline với RSS/bài viết/LLM/SMTP giả lập")
+    parser.add_argument("--feeds", default="6,30,120", help="Danh sách số feed, vd 6,60,300")
+    parser.add_argument("--hosts", type=int, default=4, help="Số host tin giả lập (127.0.0.1..N)")
+    parser.add_argument("--items-per-feed", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=30, help="Số đoạn văn mỗi bài")
+    parser.add_argument("--latency", type=float, default=0.05, help="Độ trễ trung bình của host tin (giây)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Tỉ lệ request tin trả về 500")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Độ trễ trung bình của LLM (giây)")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="Tỉ lệ request LLM trả về 500")
+    parser.add_argument("--host-interval", type=float, default=0.0,
+                        help="DIGEST_HOST_MIN_INTERVAL cho lần chạy (mặc định 0 để đo giới hạn của pipeline)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSON lưu kết quả")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log của main()")
+    parser.add_argument("--child", nargs=2, metavar=("CONFIG", "RESULT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return 0
+
+    counters = ServerCounters()
+    servers, news_hosts, llm_url, smtp_port = start_mock_servers(args, counters)
+    print(f"🧪 Server giả lập: {len(news_hosts)} host tin, LLM {llm_url}, SMTP 127.0.0.1:{smtp_port}")
+
+    results = []
+    try:
+        for feed_count in [int(n) for n in args.feeds.split(",") if n.strip()]:
+            print(f"⏱️ Chạy main() với {feed_count} feed...")
+            result = run_scale(feed_count, args, news_hosts, llm_url, smtp_port, counters)
+            if result:
+                results.append(result)
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    if not results:
+        return 1
+    print_report(results)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": {k: v for k, v in vars(args).items() if k != "child"}, "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Đã lưu kết quả: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
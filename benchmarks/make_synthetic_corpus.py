@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sinh corpus tổng hợp cho benchmarks/bench_extraction.py
+Tạo lại đúng từng byte benchmarks/corpus (seed cố định) gồm 6 feed RSS và
+2 trang bài viết cho mỗi domain trong SITE_RULES.
+
+Giả định của corpus này:
+- Nội dung là các câu tiếng Việt ghép ngẫu nhiên, không phải bài thật.
+- Markup trang được dựng theo chính các selector trong SITE_RULES, kèm
+  nhiễu (CSS/JS lớn, menu, tin liên quan, sidebar, footer) để đo chi phí parse.
+  Vì vậy tỉ lệ khớp site rule và chất lượng trích xuất đo trên corpus này luôn
+  đẹp một cách tất yếu; chỉ số thời gian/throughput mới có ý nghĩa so sánh.
+- Feed vnexpress/tuoitre bọc ảnh trong CDATA của description như feed thật,
+  các feed khác chỉ có text.
+
+Muốn số liệu đại diện cho trang thật, ghi corpus bằng
+benchmarks/record_corpus.py (manifest sẽ có "source": "recorded").
+
+Chạy: python benchmarks/make_synthetic_corpus.py [--output benchmarks/corpus]
+"""
+
+import argparse
+import json
+import os
+import random
+
+SEED = 20241017
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+SENT=[
+"Lực lượng Cảnh sát PCCC và CNCH đã điều động 12 xe chữa cháy cùng hơn 70 cán bộ, chiến sĩ đến hiện trường",
+"Đám cháy bùng phát tại tầng 2 của căn nhà 5 tầng, khói đen bốc cao hàng chục mét khiến người dân hoảng loạn",
+"Theo Bộ Công Thương, nhu cầu nhập khẩu LNG của Việt Nam dự kiến đạt 8 triệu tấn mỗi năm vào năm 2030",
+"Kho cảng LNG Thị Vải có công suất giai đoạn một là 1 triệu tấn/năm, đã tiếp nhận chuyến tàu đầu tiên",
+"Tuyến metro số 1 Bến Thành - Suối Tiên dài gần 20 km, gồm 3 ga ngầm và 11 ga trên cao",
+"Ban Quản lý đường sắt đô thị TP.HCM cho biết đoàn tàu đã chạy thử toàn tuyến với tốc độ tối đa 110 km/h",
+"UBND thành phố yêu cầu các quận, huyện rà soát toàn bộ nhà ở kết hợp kinh doanh, chung cư mini và cơ sở karaoke",
+"Giá khí đốt tại châu Âu và châu Á giảm mạnh trong tuần qua do thời tiết ấm hơn dự báo",
+"Theo quy hoạch điện VIII, tổng công suất nhiệt điện khí LNG đến năm 2030 đạt khoảng 22.400 MW",
+"Nhiều người dân đã dùng bình chữa cháy mini để dập lửa trước khi lực lượng chức năng có mặt",
+"Tuyến đường sắt đô thị Nhổn - ga Hà Nội đoạn trên cao đã được đưa vào khai thác thương mại",
+"Cơ quan công an đang điều tra làm rõ nguyên nhân vụ cháy và thống kê thiệt hại",
+"Chuyên gia khuyến cáo mỗi gia đình cần trang bị thiết bị báo cháy và lối thoát hiểm thứ hai",
+"PV Gas cho biết sản lượng khí cung cấp cho các nhà máy điện trong quý đạt 95% kế hoạch",
+"Hành khách đi tàu điện Cát Linh - Hà Đông tăng 15% so với cùng kỳ năm trước",
+]
+
+def para(n): return " ".join(random.choice(SENT)+"." for _ in range(n))
+JS="<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}" + "var cfg={" + ",".join(f"k{i}:'{'x'*40}'" for i in range(300)) + "};</script>"
+CSS="<style>"+"".join(f".c{i}{{margin:{i}px;padding:{i%7}px;color:#{i%9}{i%9}{i%9}}}" for i in range(600))+"</style>"
+NAV="<nav class='main-nav'><ul>"+"".join(f"<li><a href='/muc-{i}'>Chuyên mục {i}</a></li>" for i in range(60))+"</ul></nav>"
+def related(cls): return f"<div class='{cls}'><h3>Tin liên quan</h3><ul>"+"".join(f"<li><a href='/tin-{i}.html'>{random.choice(SENT)[:70]}</a></li>" for i in range(8))+"</ul></div>"
+def sidebar(): return "<aside class='sidebar'>"+"".join(f"<div class='item-news'><a href='/x{i}'>{random.choice(SENT)[:80]}</a><p class='description'>{random.choice(SENT)}</p></div>" for i in range(25))+"</aside>"
+def footer(): return "<footer><p>© Bản quyền thuộc về báo. Giấy phép số 548/GP-BTTTT.</p>"+"".join(f"<a href='/f{i}'>Liên kết {i}</a>" for i in range(40))+"</footer>"
+PAGES={
+"vnexpress.net": lambda t,body: f"<!DOCTYPE html><html lang='vi'><head><meta charset='utf-8'><title>{t} - VnExpress</title>{CSS}{JS}</head><body><header class='header'>{NAV}</header><section class='section page-detail'><div class='container'><div class='sidebar-1'><div class='header-content'><span class='date'>Thứ hai, 14/10/2024, 08:15 (GMT+7)</span></div><h1 class='title-detail'>{t}</h1><p class='description'>{para(2)}</p><article class='fck_detail'>"+"".join(f"<p class='Normal'>{p}</p>" for p in body)+f"<table class='tplCaption'><tr><td><img src='a.jpg'/></td></tr><tr><td><p class='Image'>Hiện trường. Ảnh: N.H</p></td></tr></table><p class='Normal' style='text-align:right;'><strong>Nguyễn Hải</strong></p></article>{related('box-tinlienquanv2')}</div>{sidebar()}</div></section>{footer()}{JS}</body></html>",
+"tuoitre.vn": lambda t,body: f"<!DOCTYPE html><html><head><meta http-equiv='Content-Type' content='text/html; charset=utf-8'/><title>{t}</title>{CSS}{JS}</head><body>{NAV}<div class='detail-container'><h1 class='detail-title article-title'>{t}</h1><div class='detail-time'><div data-role='publishdate'>14/10/2024 08:15 GMT+7</div></div><h2 class='detail-sapo'>{para(2)}</h2><div class='detail-cmain'><div class='detail-content afcbc-body' data-role='content'>"+"".join(f"<p>{p}</p>" for p in body)+f"<div class='VCSortableInPreviewMode' type='RelatedNewsBox'>{related('relate-container')}</div></div></div></div>{sidebar()}{footer()}</body></html>",
+"baochinhphu.vn": lambda t,body: f"<!DOCTYPE html><html><head><meta charset='UTF-8'><title>{t}</title>{CSS}{JS}</head><body>{NAV}<div class='detail__content'><h1 class='detail-title' data-role='title'>{t}</h1><div class='detail-time'>14/10/2024 08:15</div><div class='detail-content afcbc-body' data-role='content'>"+"".join(f"<p style='text-align: justify;'>{p}</p>" for p in body)+f"<div class='VCSortableInPreviewMode' type='RelatedNewsBox'>{related('detail-related')}</div></div></div>{sidebar()}{footer()}</body></html>",
+"cand.com.vn": lambda t,body: f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{t}</title>{CSS}{JS}</head><body>{NAV}<div class='box-detail'><h1 class='box-title-detail'>{t}</h1><div class='box-date'>Thứ Hai, 14/10/2024 08:15</div><div class='detail-content-body'>"+"".join(f"<p>{p}</p>" for p in body)+f"{related('box-related')}<div class='detail-tags'><a href='/tag/pccc'>PCCC</a></div></div></div>{sidebar()}{footer()}</body></html>",
+"nangluongquocte.petrotimes.vn": lambda t,body: f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{t}</title>{CSS}{JS}</head><body>{NAV}<div class='main-article'><h1 class='post-title'>{t}</h1><span class='post-date'>14/10/2024 08:15</span><div class='post-content'>"+"".join(f"<p>{p}</p>" for p in body)+f"</div>{related('related-news')}<div class='post-tags'>LNG</div></div>{sidebar()}{footer()}</body></html>",
+}
+FEEDS={"baochinhphu.vn":"https://baochinhphu.vn/rss/thoi-su.rss","cand.com.vn":"https://cand.com.vn/rss","vnexpress.net-kinh-doanh":"https://vnexpress.net/rss/kinh-doanh.rss","nangluongquocte.petrotimes.vn":"https://nangluongquocte.petrotimes.vn/rss","tuoitre.vn":"https://tuoitre.vn/rss/thoi-su.rss"}
+FEEDS2={"vnexpress.net-thoi-su":"https://vnexpress.net/rss/thoi-su.rss"}
+TITLES=["Cháy lớn tại xưởng gỗ, hàng trăm mét vuông bị thiêu rụi","Việt Nam đón chuyến tàu LNG thứ 10 tại kho cảng Thị Vải","Metro Bến Thành - Suối Tiên chạy thử toàn tuyến","Thủ tướng chỉ đạo siết chặt phòng cháy ở chung cư mini","Giá khí đốt châu Á giảm sâu","Hà Nội đưa đoạn trên cao tuyến đường sắt Nhổn - ga Hà Nội vào khai thác"]
+
+def item(domain, i, t, link):
+    desc=para(2)
+    if domain in ("vnexpress.net","tuoitre.vn"):
+        desc=f"<![CDATA[<a href=\"{link}\"><img src=\"https://cdn.{domain}/2024/10/14/anh-{i}.jpg?w=1200&amp;h=0\" ></a></br>{desc}]]>"
+    return f"<item><title><![CDATA[{t}]]></title><link>{link}</link><guid isPermaLink='true'>{link}</guid><pubDate>Mon, 14 Oct 2024 0{i%10}:15:00 +0700</pubDate><description>{desc}</description></item>"
+def rss(domain, url, n=40):
+    items="".join(item(domain, i, random.choice(TITLES)+f" ({i})", f"https://{domain}/tin-{random.randint(10**6,10**7)}.html" if 'vnexpress' not in domain else f"https://vnexpress.net/tin-{random.randint(4000000,4999999)}.html") for i in range(n))
+    return f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><rss version=\"2.0\" xmlns:atom=\"http://www.w3.org/2005/Atom\"><channel><title>{domain}</title><link>https://{domain}</link><description>Tin tức</description><language>vi</language>{items}</channel></rss>"
+
+def write_corpus(output):
+    """Ghi feed, trang bài viết và manifest.json vào thư mục output"""
+    random.seed(SEED)
+    os.makedirs(os.path.join(output, "rss"), exist_ok=True)
+    os.makedirs(os.path.join(output, "html"), exist_ok=True)
+    manifest = {"source": "synthetic", "feeds": [], "pages": []}
+
+    for name, url in list(FEEDS.items()) + list(FEEDS2.items()):
+        domain = name.split("-")[0] if name.startswith("vnexpress") else name
+        filename = f"rss/{name}.xml"
+        with open(os.path.join(output, filename), "w") as f:
+            f.write(rss(domain, url))
+        manifest["feeds"].append({"file": filename, "url": url})
+
+    for domain, template in PAGES.items():
+        for k in range(2):
+            title = random.choice(TITLES)
+            body = [para(random.randint(2, 5)) for _ in range(random.randint(12, 30))]
+            filename = f"html/{domain}-{k + 1}.html"
+            with open(os.path.join(output, filename), "w") as f:
+                f.write(template(title, body))
+            manifest["pages"].append({"file": filename, "url": f"https://{domain}/bai-viet-{k + 1}.html"})
+
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh corpus tổng hợp cho benchmark trích xuất")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Thư mục ghi corpus")
+    args = parser.parse_args()
+
+    manifest = write_corpus(args.output)
+    print(f"✅ Đã sinh {len(manifest['feeds'])} feed và {len(manifest['pages'])} trang vào {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ghi lại corpus cho benchmark trích xuất
+Tải RSS của các feed trong RSS_FEEDS và vài bài đầu của mỗi feed, lưu nguyên
+byte vào benchmarks/corpus để benchmark chạy offline.
+
+Chạy: python benchmarks/record_corpus.py [số bài mỗi feed]
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feedparser
+from clean_news_digest import RSS_FEEDS, get_host, http_get
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def feed_file_name(feed_url):
+    """Tên file cho một feed, vd vnexpress.net-thoi-su.xml"""
+    parsed = urlparse(feed_url)
+    slug = os.path.splitext(os.path.basename(parsed.path.rstrip("/")))[0]
+    name = parsed.hostname if slug in ("", "rss") else f"{parsed.hostname}-{slug}"
+    return f"rss/{name}.xml"
+
+def main():
+    pages_per_feed = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    os.makedirs(os.path.join(CORPUS_DIR, "rss"), exist_ok=True)
+    os.makedirs(os.path.join(CORPUS_DIR, "html"), exist_ok=True)
+    
+    manifest = {"source": "recorded", "recorded_at": datetime.now().isoformat(timespec="seconds"), "feeds": [], "pages": []}
+    page_counts = {}
+    feed_urls = list(dict.fromkeys(url for urls in RSS_FEEDS.values() for url in urls))
+    
+    for feed_url in feed_urls:
+        print(f"📡 {feed_url}")
+        try:
+            response = http_get(feed_url)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"  ❌ Lỗi tải feed: {e}")
+            continue
+        
+        file_name = feed_file_name(feed_url)
+        with open(os.path.join(CORPUS_DIR, file_name), "wb") as f:
+            f.write(response.content)
+        manifest["feeds"].append({"file": file_name, "url": feed_url})
+        
+        for entry in feedparser.parse(response.content).entries[:pages_per_feed]:
+            link = entry.get("link")
+            if not link:
+                continue
+            host = get_host(link)
+            page_counts[host] = page_counts.get(host, 0) + 1
+            page_name = f"html/{host}-{page_counts[host]}.html"
+            try:
+                page = http_get(link)
+                page.raise_for_status()
+            except Exception as e:
+                print(f"  ⚠️ Lỗi tải bài {link}: {e}")
+                continue
+            with open(os.path.join(CORPUS_DIR, page_name), "wb") as f:
+                f.write(page.content)
+            manifest["pages"].append({"file": page_name, "url": link})
+            print(f"  ✅ {page_name} ({len(page.content):,} byte)")
+    
+    with open(os.path.join(CORPUS_DIR, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"\n📦 Đã ghi {len(manifest['feeds'])} feed và {len(manifest['pages'])} bài vào {CORPUS_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,47 @@ import os
 import sys
 import feedparser
 import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from bs4 import BeautifulSoup
+import soupsieve
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # Không có lxml thì chỉ dùng được engine bs4
+    lxml = None
+try:
+    from lxml.cssselect import CSSSelector
+except ImportError:  # Thiếu lxml/cssselect thì quy tắc theo site chạy trên BeautifulSoup
+    CSSSelector = None
+try:
+    import numpy as np
+except ImportError:  # Không có numpy thì chấm điểm câu bằng Python thuần
+    np = None
 import re
+import html
+import math
+import random
+import codecs
 import time
+import json
+import hashlib
+import sqlite3
+import threading
+import queue
+import multiprocessing
+import unicodedata
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
 
 print("🚀 Khởi động Daily News Digest System...")
 print(f"🐍 Python version: {sys.version}")
@@ -47,25 +81,835 @@ HEADERS = {
     'Upgrade-Insecure-Requests': '1',
 }
 
+# Cấu hình chạy song song
+CONCURRENT_MODE = os.getenv("DIGEST_CONCURRENT", "1") != "0"
+MAX_WORKERS = int(os.getenv("DIGEST_MAX_WORKERS", "8"))        # Giới hạn request đồng thời toàn cục
+PER_HOST_LIMIT = int(os.getenv("DIGEST_PER_HOST_LIMIT", "2"))  # Giới hạn request đồng thời mỗi host
+
+_global_slots = threading.BoundedSemaphore(MAX_WORKERS)
+_slot_state = threading.local()  # holding_global: luồng đang giữ một slot toàn cục
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def get_host(url):
+    """Lấy hostname từ URL"""
+    return (urlparse(url).hostname or "").lower()
+
+def match_domain(host, mapping):
+    """Tìm cấu hình theo host, khớp cả domain cha (vd m.vnexpress.net -> vnexpress.net)"""
+    parts = host.split(".")
+    for i in range(len(parts)):
+        domain = ".".join(parts[i:])
+        if domain in mapping:
+            return mapping[domain]
+    return None
+
+@contextmanager
+def host_slot(url):
+    """Chiếm một slot request cho host của URL (theo giới hạn host và toàn cục)"""
+    host = get_host(url)
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+    
+    # Lấy slot của host trước để không giữ slot toàn cục khi đang chờ host bận
+    with slot, _global_slots:
+        _slot_state.holding_global = True
+        try:
+            yield
+        finally:
+            _slot_state.holding_global = False
+
+@contextmanager
+def global_slot_released():
+    """Tạm trả slot toàn cục (nếu luồng đang giữ trong host_slot) trong lúc chờ giãn cách/Retry-After
+    
+    Slot của host vẫn được giữ, nên host đang bị giãn cách không chặn request tới các host khác.
+    """
+    if not getattr(_slot_state, "holding_global", False):
+        yield
+        return
+    _slot_state.holding_global = False
+    _global_slots.release()
+    try:
+        yield
+    finally:
+        _global_slots.acquire()
+        _slot_state.holding_global = True
+
+# HTTP session dùng chung (keep-alive, connection pool theo host)
+HTTP_POOL_SIZE = int(os.getenv("DIGEST_HTTP_POOL_SIZE", str(MAX_WORKERS)))  # Số kết nối giữ lại mỗi host
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_http_stats = {"requests": 0, "connections_opened": 0}
+_http_stats_lock = threading.Lock()
+
+def _counting_pool(pool_class):
+    """Tạo connection pool class có đếm số kết nối TCP mới được mở"""
+    class CountingConnectionPool(pool_class):
+        def _new_conn(self):
+            with _http_stats_lock:
+                _http_stats["connections_opened"] += 1
+            return super()._new_conn()
+    
+    # Giữ tên gốc để thông báo lỗi của urllib3 không đổi
+    CountingConnectionPool.__name__ = pool_class.__name__
+    return CountingConnectionPool
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter đếm số kết nối mở mới để so sánh với số request"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool),
+            "https": _counting_pool(HTTPSConnectionPool),
+        }
+
+def _count_response(response, *args, **kwargs):
+    with _http_stats_lock:
+        _http_stats["requests"] += 1
+
+def get_http_session():
+    """Lấy HTTP session dùng chung cho mọi request (feeds, bài viết, API)"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = PooledHTTPAdapter(
+                pool_connections=max(10, sum(len(urls) for urls in RSS_FEEDS.values()) + 1),
+                pool_maxsize=HTTP_POOL_SIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_count_response)
+            _http_session = session
+        return _http_session
+
+# Giới hạn tốc độ theo host (thay cho sleep cố định)
+HOST_MIN_INTERVAL = float(os.getenv("DIGEST_HOST_MIN_INTERVAL", "1.0"))  # Giây giữa 2 request tới cùng host
+HOST_RATE_LIMITS = os.getenv("DIGEST_HOST_RATE_LIMITS", "")  # Vd: "vnexpress.net=0.5,cand.com.vn=2"
+RETRY_AFTER_STATUSES = (429, 503)
+RETRY_AFTER_MAX_WAIT = float(os.getenv("DIGEST_RETRY_AFTER_MAX", "60"))  # Không chờ lâu hơn mức này
+RETRY_AFTER_ATTEMPTS = 2
+
+def parse_host_rate_limits(spec):
+    """Đọc cấu hình "domain=giây,domain=giây" thành dict"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        domain, interval = item.split("=", 1)
+        try:
+            limits[domain.strip().lower()] = float(interval)
+        except ValueError:
+            print(f"⚠️ Bỏ qua cấu hình rate limit không hợp lệ: {item}")
+    return limits
+
+def parse_retry_after(value):
+    """Đọc header Retry-After (số giây hoặc HTTP date), trả về số giây cần chờ"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class HostRateLimiter:
+    """Giãn cách request tới cùng một host; request tới các host khác nhau không phải chờ"""
+    
+    def __init__(self, default_interval=HOST_MIN_INTERVAL, intervals=None):
+        self.default_interval = default_interval
+        self.intervals = dict(intervals or {})
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+    
+    def interval_for(self, host):
+        """Khoảng cách tối thiểu cho host (khớp cả domain cha)"""
+        interval = match_domain(host, self.intervals)
+        return self.default_interval if interval is None else interval
+    
+    def reserve(self, url):
+        """Giữ lượt gửi request tiếp theo tới host của URL; trả về số giây phải chờ tới lượt đó"""
+        host = get_host(url)
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_allowed.get(host, 0.0))
+            self._next_allowed[host] = send_at + self.interval_for(host)
+        return send_at - now
+    
+    def acquire(self, url):
+        """Chờ tới lượt gửi request tới host của URL"""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+    
+    def defer(self, url, seconds):
+        """Hoãn mọi request tới host thêm `seconds` giây (theo Retry-After)"""
+        host = get_host(url)
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            self._next_allowed[host] = max(self._next_allowed.get(host, 0.0), resume_at)
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Lấy rate limiter dùng chung; API DeepSeek mặc định không bị giãn cách"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            intervals = {get_host(DEEPSEEK_API_URL): 0.0}
+            intervals.update(parse_host_rate_limits(HOST_RATE_LIMITS))
+            _rate_limiter = HostRateLimiter(HOST_MIN_INTERVAL, intervals)
+        return _rate_limiter
+
+def http_request(method, url, **kwargs):
+    """Gửi request qua session dùng chung, có giãn cách theo host và tôn trọng Retry-After
+    
+    response.retries là số lần đã gửi lại sau khi chờ theo Retry-After.
+    """
+    limiter = get_rate_limiter()
+    for attempt in range(RETRY_AFTER_ATTEMPTS + 1):
+        wait = limiter.reserve(url)
+        if wait > 0:
+            # Chờ giãn cách/Retry-After mà không chiếm slot toàn cục của các host khác
+            with global_slot_released():
+                time.sleep(wait)
+        response = get_http_session().request(method, url, **kwargs)
+        response.retries = attempt
+        
+        if response.status_code not in RETRY_AFTER_STATUSES:
+            return response
+        
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None or delay > RETRY_AFTER_MAX_WAIT or attempt == RETRY_AFTER_ATTEMPTS:
+            return response
+        
+        print(f"    ⏳ {get_host(url)} trả về {response.status_code}, chờ {delay:.0f}s theo Retry-After")
+        limiter.defer(url, delay)
+        response.close()
+    return response
+
+def http_get(url, **kwargs):
+    """GET qua session dùng chung"""
+    kwargs.setdefault("timeout", 15)
+    return http_request("GET", url, **kwargs)
+
+def http_post(url, **kwargs):
+    """POST qua session dùng chung"""
+    kwargs.setdefault("timeout", 30)
+    return http_request("POST", url, **kwargs)
+
+def get_http_stats():
+    """Thống kê kết nối: số request, số kết nối mở mới và số lần tái sử dụng"""
+    with _http_stats_lock:
+        stats = dict(_http_stats)
+    stats["connections_reused"] = max(0, stats["requests"] - stats["connections_opened"])
+    return stats
+
+# Trạng thái lưu giữa các lần chạy (feed state, cache...)
+STATE_DIR = os.getenv("DIGEST_STATE_DIR", ".digest_state")
+FEED_STATE_FILE = os.path.join(STATE_DIR, "feed_state.json")
+CONDITIONAL_GET = os.getenv("DIGEST_CONDITIONAL_GET", "1") != "0"  # Chỉ dùng ở chế độ poll/store (có kho bài)
+FEED_STATE_MAX_IDS = 100  # Số entry ID gần nhất lưu cho mỗi feed
+
+_feed_state = None          # Trạng thái đọc từ lần chạy trước
+_feed_state_updates = {}    # Trạng thái mới của lần chạy này
+_feed_state_lock = threading.Lock()
+
+def load_feed_state():
+    """Đọc trạng thái các feed (ETag, Last-Modified, entry IDs) từ lần chạy trước"""
+    global _feed_state
+    with _feed_state_lock:
+        if _feed_state is None:
+            try:
+                with open(FEED_STATE_FILE, encoding="utf-8") as f:
+                    _feed_state = json.load(f)
+            except FileNotFoundError:
+                _feed_state = {}
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Không đọc được feed state: {e}")
+                _feed_state = {}
+        return _feed_state
+
+def get_feed_state(feed_url):
+    """Trạng thái của một feed từ lần chạy trước"""
+    return load_feed_state().get(feed_url, {})
+
+def update_feed_state(feed_url, response, entries):
+    """Ghi nhận trạng thái mới của feed sau khi tải thành công"""
+    entry_ids = [entry.get("id") or entry.get("link") for entry in entries]
+    state = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "entry_ids": [entry_id for entry_id in entry_ids if entry_id][:FEED_STATE_MAX_IDS],
+        "checked_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with _feed_state_lock:
+        _feed_state_updates[feed_url] = state
+
+def save_feed_state():
+    """Lưu trạng thái feed xuống đĩa (ghi file tạm rồi đổi tên)"""
+    state = dict(load_feed_state())
+    with _feed_state_lock:
+        if not _feed_state_updates:
+            return
+        state.update(_feed_state_updates)
+    
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = FEED_STATE_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, FEED_STATE_FILE)
+    except OSError as e:
+        print(f"⚠️ Không lưu được feed state: {e}")
+
+# Đo thời gian theo bước và báo cáo lần chạy
+RUN_REPORT_FILE = os.getenv("DIGEST_RUN_REPORT", os.path.join(STATE_DIR, "run_report.json"))  # "" để tắt
+TRACE_STDERR = os.getenv("DIGEST_TRACE_STDERR", "0") == "1"  # In từng span/bài dạng JSON lines ra stderr
+REPORT_TOP_N = 5  # Số bước / host chậm nhất in ở cuối lần chạy
+HOST_STAGES = ("feed.fetch", "article.fetch", "summary.request")  # Các span tính vào bảng theo host
+
+class RunTelemetry:
+    """Thu thập span thời gian theo bước và bản ghi từng bài viết của một lần chạy"""
+    
+    def __init__(self, trace_stream=None):
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._trace_stream = trace_stream
+        self.spans = []
+        self.articles = []
+    
+    @contextmanager
+    def span(self, stage, **fields):
+        """Đo thời gian một khối lệnh; có thể ghi thêm trường vào dict được yield"""
+        record = dict(fields, stage=stage)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            record["start"] = round(started - self._origin, 4)
+            record["duration"] = round(time.perf_counter() - started, 4)
+            self._emit("span", self.spans, record)
+    
+    def record_article(self, **fields):
+        """Ghi bản ghi của một bài viết (URL, host, byte, trạng thái, thời gian...)"""
+        self._emit("article", self.articles, fields)
+    
+    def _emit(self, kind, target, record):
+        with self._lock:
+            target.append(record)
+            if self._trace_stream is not None:
+                try:
+                    self._trace_stream.write(json.dumps(dict(record, type=kind), ensure_ascii=False) + "\n")
+                except (OSError, ValueError):
+                    self._trace_stream = None  # stderr bị đóng: bỏ trace, không làm hỏng lần chạy
+    
+    def stage_summary(self):
+        """Tổng hợp theo bước: số lần, tổng thời gian, thời gian lớn nhất, số lỗi"""
+        return self._summarize(self.spans, lambda record: record["stage"])
+    
+    def host_summary(self):
+        """Tổng hợp các request mạng theo host"""
+        return self._summarize(
+            [record for record in self.spans if record["stage"] in HOST_STAGES and record.get("host")],
+            lambda record: record["host"]
+        )
+    
+    def _summarize(self, records, key):
+        with self._lock:
+            records = list(records)
+        summary = {}
+        for record in records:
+            item = summary.setdefault(key(record), {"calls": 0, "total": 0.0, "max": 0.0, "errors": 0})
+            item["calls"] += 1
+            item["total"] += record["duration"]
+            item["max"] = max(item["max"], record["duration"])
+            if record.get("error") or (record.get("status") or 0) >= 400:
+                item["errors"] += 1
+        for item in summary.values():
+            item["total"] = round(item["total"], 4)
+        return dict(sorted(summary.items(), key=lambda kv: kv[1]["total"], reverse=True))
+    
+    def charset_summary(self):
+        """Số trang theo cách xác định charset (header, bom, meta, utf-8, detect, default)"""
+        with self._lock:
+            methods = [record.get("charset_method") for record in self.articles]
+        summary = {}
+        for method in methods:
+            if method:
+                summary[method] = summary.get(method, 0) + 1
+        return summary
+    
+    def report(self):
+        """Báo cáo đầy đủ dạng dict (dùng để ghi JSON)"""
+        with self._lock:
+            spans, articles = list(self.spans), list(self.articles)
+        return {
+            "started_at": self.started_at,
+            "duration": round(time.perf_counter() - self._origin, 4),
+            "stages": self.stage_summary(),
+            "hosts": self.host_summary(),
+            "charsets": self.charset_summary(),
+            "http": get_http_stats(),
+            "articles": articles,
+            "spans": spans,
+        }
+    
+    def write_report(self, path):
+        """Ghi báo cáo JSON (ghi file tạm rồi đổi tên)"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+            print(f"🧾 Báo cáo lần chạy: {path}")
+        except OSError as e:
+            print(f"⚠️ Không ghi được báo cáo lần chạy: {e}")
+    
+    def print_summary(self, top=REPORT_TOP_N):
+        """In bảng các bước và host chậm nhất"""
+        for heading, label, summary in (
+            ("⏱️ Các bước tốn thời gian nhất", "Bước", self.stage_summary()),
+            ("🐢 Các host chậm nhất", "Host", self.host_summary()),
+        ):
+            if not summary:
+                continue
+            print(f"\n{heading} (tổng thời gian các luồng):")
+            print(f"  {label:<32}{'Lần':>6}{'Tổng s':>9}{'TB ms':>9}{'Max ms':>9}{'Lỗi':>6}")
+            for name, item in list(summary.items())[:top]:
+                print(f"  {name[:32]:<32}{item['calls']:>6}{item['total']:>9.2f}"
+                      f"{item['total'] / item['calls'] * 1000:>9.0f}{item['max'] * 1000:>9.0f}{item['errors']:>6}")
+        
+        charsets = self.charset_summary()
+        if charsets:
+            print("\n🔤 Charset theo cách xác định: " + ", ".join(f"{method} {count}" for method, count in charsets.items()))
+
+telemetry = RunTelemetry(sys.stderr if TRACE_STDERR else None)
+
+# Timeout thích nghi theo host và ngắt mạch (circuit breaker), lưu giữa các lần chạy
+HOST_HEALTH_FILE = os.path.join(STATE_DIR, "host_health.json")
+ADAPTIVE_TIMEOUTS = os.getenv("DIGEST_ADAPTIVE_TIMEOUTS", "1") != "0"
+DEFAULT_FETCH_TIMEOUT = 15.0
+HOST_TIMEOUT_MIN = float(os.getenv("DIGEST_HOST_TIMEOUT_MIN", "4"))  # Timeout thích nghi không thấp hơn mức này
+HOST_TIMEOUT_P95_MULTIPLIER = 3.0  # Timeout = p95 thời gian phản hồi x hệ số này
+HOST_LATENCY_SAMPLES = 50  # Số lần đo gần nhất giữ lại cho mỗi host
+HOST_LATENCY_MIN_SAMPLES = 5  # Ít mẫu hơn thì dùng timeout mặc định
+BREAKER_FAILURES = int(os.getenv("DIGEST_BREAKER_FAILURES", "3"))  # Số lỗi liên tiếp để ngắt mạch host (0 = tắt)
+
+def is_host_failure_status(status_code):
+    """Mã HTTP cho thấy host đang lỗi/quá tải (khác với lỗi của riêng một trang như 404)"""
+    return status_code >= 500 or status_code == 429
+
+class HostHealth:
+    """Theo dõi thời gian phản hồi và lỗi liên tiếp của từng host
+    
+    - timeout_for: timeout theo p95 thời gian phản hồi đã quan sát, trong
+      khoảng [HOST_TIMEOUT_MIN, DEFAULT_FETCH_TIMEOUT].
+    - allow: False khi host đã bị ngắt mạch trong lần chạy này (sau
+      BREAKER_FAILURES lỗi liên tiếp). Host bị ngắt ở lần chạy trước được thử
+      lại (half-open) bằng đúng một request: các request khác tới host đó bị
+      từ chối cho tới khi request thử xong; lỗi là ngắt tiếp, thành công thì
+      đóng mạch.
+    """
+    
+    def __init__(self, state=None):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._probing = set()  # Host half-open đang có request thử
+        for host, item in (state or {}).items():
+            self._hosts[host] = {
+                "latencies": list(item.get("latencies", []))[-HOST_LATENCY_SAMPLES:],
+                "consecutive_failures": item.get("consecutive_failures", 0),
+                "state": "half_open" if item.get("state") in ("open", "half_open") else "closed",
+                "opened_at": item.get("opened_at"),
+            }
+    
+    def _host(self, url):
+        host = get_host(url)
+        return host, self._hosts.setdefault(
+            host, {"latencies": [], "consecutive_failures": 0, "state": "closed", "opened_at": None}
+        )
+    
+    def timeout_for(self, url, default=DEFAULT_FETCH_TIMEOUT):
+        """Timeout (giây) cho request tới host của URL"""
+        if not ADAPTIVE_TIMEOUTS:
+            return default
+        with self._lock:
+            latencies = sorted(self._host(url)[1]["latencies"])
+        if len(latencies) < HOST_LATENCY_MIN_SAMPLES:
+            return default
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        return round(min(default, max(HOST_TIMEOUT_MIN, p95 * HOST_TIMEOUT_P95_MULTIPLIER)), 2)
+    
+    def allow(self, url):
+        """Có được gửi request tới host này không (mạch chưa bị ngắt)"""
+        if BREAKER_FAILURES <= 0:
+            return True
+        with self._lock:
+            host, item = self._host(url)
+            if item["state"] == "open":
+                return False
+            if item["state"] == "half_open":
+                if host in self._probing:
+                    return False
+                self._probing.add(host)
+            return True
+    
+    def release_probe(self, url):
+        """Request thử kết thúc mà không rõ host sống hay chết: để request sau thử lại"""
+        with self._lock:
+            self._probing.discard(get_host(url))
+    
+    def record_success(self, url, latency):
+        with self._lock:
+            host, item = self._host(url)
+            item["latencies"] = (item["latencies"] + [round(latency, 3)])[-HOST_LATENCY_SAMPLES:]
+            item["consecutive_failures"] = 0
+            self._probing.discard(host)
+            if item["state"] == "half_open":
+                print(f"    ✅ {host} đã hoạt động lại, đóng mạch")
+            item["state"] = "closed"
+    
+    def record_failure(self, url):
+        with self._lock:
+            host, item = self._host(url)
+            item["consecutive_failures"] += 1
+            self._probing.discard(host)
+            threshold = 1 if item["state"] == "half_open" else BREAKER_FAILURES
+            if BREAKER_FAILURES > 0 and item["state"] != "open" and item["consecutive_failures"] >= threshold:
+                item["state"] = "open"
+                item["opened_at"] = datetime.now().isoformat(timespec="seconds")
+                print(f"    ⛔ Ngắt mạch {host} sau {item['consecutive_failures']} lỗi liên tiếp, "
+                      f"bỏ qua host này đến hết lần chạy")
+    
+    def open_hosts(self):
+        with self._lock:
+            return sorted(host for host, item in self._hosts.items() if item["state"] == "open")
+    
+    def snapshot(self):
+        with self._lock:
+            return {host: dict(item, latencies=list(item["latencies"])) for host, item in self._hosts.items()}
+
+_host_health = None
+_host_health_lock = threading.Lock()
+
+def get_host_health():
+    """Lấy trạng thái host dùng chung, đọc từ lần chạy trước nếu có"""
+    global _host_health
+    with _host_health_lock:
+        if _host_health is None:
+            state = {}
+            try:
+                with open(HOST_HEALTH_FILE, encoding="utf-8") as f:
+                    state = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Không đọc được trạng thái host: {e}")
+            _host_health = HostHealth(state)
+        return _host_health
+
+def save_host_health():
+    """Lưu thời gian phản hồi và trạng thái ngắt mạch của các host (ghi file tạm rồi đổi tên)"""
+    if _host_health is None:
+        return
+    state = _host_health.snapshot()
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = HOST_HEALTH_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, HOST_HEALTH_FILE)
+    except OSError as e:
+        print(f"⚠️ Không lưu được trạng thái host: {e}")
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s.,!?;:()\-""''…]')
+
+def normalize_text(text):
+    """Chuẩn hoá whitespace và bỏ ký tự đặc biệt (text đã không còn HTML)"""
+    # Làm sạch whitespace
+    text = _WHITESPACE_RE.sub(' ', text.strip())
+    
+    # Loại bỏ ký tự đặc biệt không cần thiết
+    text = _SPECIAL_CHARS_RE.sub('', text)
+    
+    return text
+
 def clean_text(text):
     """Làm sạch text từ HTML"""
     if not text:
         return ""
     
-    # Loại bỏ HTML tags
-    soup = BeautifulSoup(text, 'html.parser')
-    text = soup.get_text()
+    # Loại bỏ HTML tags (chỉ dựng parser khi thật sự có thẻ; chỉ có entity thì unescape)
+    if '<' in text:
+        soup = BeautifulSoup(text, 'html.parser')
+        text = soup.get_text()
+    elif '&' in text:
+        text = html.unescape(text)
     
-    # Làm sạch whitespace
-    text = re.sub(r'\s+', ' ', text.strip())
+    return normalize_text(text)
+
+# Engine trích xuất nội dung: "density" (lxml, chấm điểm mật độ chữ) hoặc "bs4" (selector như cũ)
+EXTRACTION_ENGINE = os.getenv("DIGEST_EXTRACTION_ENGINE", "density")
+CONTENT_MAX_CHARS = 3000
+JUNK_TAGS = ('script', 'style', 'nav', 'header', 'footer', 'aside', 'menu', 'noscript', 'form', 'iframe')
+PARAGRAPH_TAGS = ('p', 'pre', 'blockquote', 'td')        # Đoạn văn: tính toàn bộ text bên trong
+CONTAINER_TAGS = ('div', 'section', 'article', 'span')    # Khối chứa: chỉ tính text trực tiếp
+MIN_PARAGRAPH_CHARS = 25
+
+# Quy tắc trích xuất riêng cho từng nguồn tin (CSS selector)
+SITE_RULES = {
+    "vnexpress.net": {
+        "body": "article.fck_detail",
+        "drop": ["table.tplCaption", "div.box-tinlienquanv2", "div.banner-ads"],
+        "title": "h1.title-detail",
+        "date": "span.date",
+    },
+    "tuoitre.vn": {
+        "body": "div.detail-content",
+        "drop": ["div.VCSortableInPreviewMode[type='RelatedNewsBox']", "div.relate-container"],
+        "title": "h1.detail-title",
+        "date": "div.detail-time",
+    },
+    "baochinhphu.vn": {
+        "body": "div.detail-content",
+        "drop": ["div.VCSortableInPreviewMode[type='RelatedNewsBox']", "div.detail-related"],
+        "title": "h1.detail-title",
+        "date": "div.detail-time",
+    },
+    "cand.com.vn": {
+        "body": "div.detail-content-body",
+        "drop": ["div.box-related", "div.detail-tags"],
+        "title": "h1.box-title-detail",
+        "date": "div.box-date",
+    },
+    "petrotimes.vn": {
+        "body": "div.post-content",
+        "drop": ["div.related-news", "div.post-tags"],
+        "title": "h1.post-title",
+        "date": "span.post-date",
+    },
+}
+MIN_RULE_CONTENT_CHARS = 200  # Ít hơn mức này coi như quy tắc không khớp
+
+class SiteRule:
+    """Quy tắc trích xuất của một domain, selector được biên dịch một lần"""
     
-    # Loại bỏ ký tự đặc biệt không cần thiết
-    text = re.sub(r'[^\w\s.,!?;:()\-""''…]', '', text)
+    def __init__(self, domain, body, drop=(), title=None, date=None):
+        self.domain = domain
+        self.attempts = 0
+        self.hits = 0
+        selectors = {"body": body, "drop": ", ".join(drop), "title": title, "date": date}
+        selectors = {name: selector for name, selector in selectors.items() if selector}
+        self._soup_selectors = {name: soupsieve.compile(selector) for name, selector in selectors.items()}
+        self._lxml_selectors = None
+        if lxml is not None and CSSSelector is not None:
+            self._lxml_selectors = {name: CSSSelector(selector) for name, selector in selectors.items()}
     
-    return text
+    @property
+    def supports_lxml(self):
+        return self._lxml_selectors is not None
+    
+    def apply_lxml(self, doc, stats, max_chars=CONTENT_MAX_CHARS):
+        """Áp dụng quy tắc lên cây lxml; trả về text hoặc "" nếu không khớp"""
+        selectors = self._lxml_selectors
+        for name, key in (("title", "page_title"), ("date", "page_published")):
+            if name in selectors:
+                found = selectors[name](doc)
+                if found:
+                    stats[key] = _WHITESPACE_RE.sub(' ', found[0].text_content()).strip()
+        
+        if "drop" in selectors:
+            for element in selectors["drop"](doc):
+                element.drop_tree()
+        
+        parts = []
+        collected = 0
+        for element in selectors["body"](doc):
+            for text in element.itertext():
+                parts.append(text)
+                collected += len(text)
+            if collected >= max_chars * 2:
+                break
+        return normalize_text(" ".join(parts))
+    
+    def apply_soup(self, soup, stats):
+        """Áp dụng quy tắc lên cây BeautifulSoup; trả về text hoặc "" nếu không khớp"""
+        selectors = self._soup_selectors
+        for name, key in (("title", "page_title"), ("date", "page_published")):
+            if name in selectors:
+                found = selectors[name].select_one(soup)
+                if found is not None:
+                    stats[key] = _WHITESPACE_RE.sub(' ', found.get_text()).strip()
+        
+        if "drop" in selectors:
+            for element in selectors["drop"].select(soup):
+                element.decompose()
+        
+        return normalize_text(" ".join(element.get_text(" ") for element in selectors["body"].select(soup)))
+
+_site_rules = None
+_site_rules_lock = threading.Lock()
+_generic_extractions = {"count": 0}
+
+def get_site_rules():
+    """Biên dịch SITE_RULES (một lần mỗi lần chạy)"""
+    global _site_rules
+    with _site_rules_lock:
+        if _site_rules is None:
+            _site_rules = {domain: SiteRule(domain, **spec) for domain, spec in SITE_RULES.items()}
+        return _site_rules
+
+def get_site_rule(url):
+    """Quy tắc trích xuất cho URL (hoặc None nếu nguồn không có quy tắc riêng)"""
+    return match_domain(get_host(url), get_site_rules())
+
+def _record_rule_result(rule, hit):
+    with _site_rules_lock:
+        if rule is None:
+            _generic_extractions["count"] += 1
+            return
+        rule.attempts += 1
+        rule.hits += hit
+
+def get_site_rule_report():
+    """Tỉ lệ khớp của từng quy tắc theo site và số trang phải dùng cách chung"""
+    with _site_rules_lock:
+        rules = dict(_site_rules or {})
+        report = {
+            domain: {"attempts": rule.attempts, "hits": rule.hits}
+            for domain, rule in rules.items() if rule.attempts
+        }
+        report["_generic"] = {"attempts": _generic_extractions["count"], "hits": 0}
+    return report
+
+def print_site_rule_report():
+    """In tỉ lệ khớp của các quy tắc trích xuất theo site"""
+    report = get_site_rule_report()
+    generic = report.pop("_generic")
+    if not report and not generic["attempts"]:
+        return
+    
+    print("🧩 Quy tắc trích xuất theo site:")
+    for domain, counts in report.items():
+        rate = counts["hits"] / counts["attempts"] * 100
+        print(f"   {domain:<20} {counts['hits']}/{counts['attempts']} trang khớp ({rate:.0f}%)")
+    print(f"   {'(không có quy tắc)':<20} {generic['attempts']} trang dùng cách trích xuất chung")
+
+def extract_content_from_html(html_content, url, engine=None, stats=None):
+    """Trích xuất nội dung chính từ HTML
+    
+    Nguồn có quy tắc trong SITE_RULES được trích xuất theo quy tắc đó trước;
+    không khớp thì dùng cách chung. Mặc định dùng engine "density" (lxml);
+    nếu không có lxml hoặc engine này không tìm được nội dung thì dùng lại
+    cách cũ với BeautifulSoup.
+    """
+    engine = engine or EXTRACTION_ENGINE
+    stats = stats if stats is not None else {}
+    rule = get_site_rule(url)
+    
+    content_text = ""
+    # Quy tắc theo site không biên dịch được cho lxml (thiếu cssselect) thì chạy trên BeautifulSoup
+    if engine == "density" and lxml is not None and (rule is None or rule.supports_lxml):
+        content_text = extract_content_density(html_content, url, rule=rule, stats=stats)
+    if not content_text:
+        content_text = extract_content_bs4(html_content, url, rule=rule, stats=stats)
+    
+    _record_rule_result(rule, stats.get("extraction") == "site_rule")
+    return content_text
+
+def _parse_lxml_document(html_content):
+    try:
+        return lxml.html.document_fromstring(html_content)
+    except ValueError:
+        # lxml không nhận str có khai báo encoding, chuyển sang bytes
+        parser = lxml.html.HTMLParser(encoding='utf-8')
+        return lxml.html.document_fromstring(html_content.encode('utf-8'), parser=parser)
+
+def _link_density(element):
+    text_length = len(element.text_content()) or 1
+    link_length = sum(len(link.text_content()) for link in element.iter('a'))
+    return link_length / text_length
+
+def extract_content_density(html_content, url, max_chars=CONTENT_MAX_CHARS, rule=None, stats=None):
+    """Trích xuất nội dung bằng lxml: chấm điểm các khối theo mật độ chữ trong một lượt duyệt"""
+    stats = stats if stats is not None else {}
+    try:
+        doc = _parse_lxml_document(html_content)
+        etree.strip_elements(doc, *JUNK_TAGS, with_tail=False)
+        
+        if rule is not None and rule.supports_lxml:
+            stats["rule_tried"] = True
+            content_text = rule.apply_lxml(doc, stats, max_chars)
+            if len(content_text) >= MIN_RULE_CONTENT_CHARS:
+                stats["extraction"] = "site_rule"
+                return content_text[:max_chars]
+        
+        # Một lượt duyệt: mỗi đoạn văn cộng điểm cho khối cha (và một nửa cho khối ông)
+        scores = {}
+        for element in doc.iter(*PARAGRAPH_TAGS, *CONTAINER_TAGS):
+            if element.tag in PARAGRAPH_TAGS:
+                own_text = element.text_content()
+            else:
+                own_text = (element.text or "") + "".join((child.tail or "") for child in element)
+            own_length = len(own_text.strip())
+            if own_length < MIN_PARAGRAPH_CHARS:
+                continue
+            
+            score = 1 + own_text.count(',') + min(own_length / 100, 3)
+            parent = element.getparent()
+            if parent is None:
+                continue
+            scores[parent] = scores.get(parent, 0) + score
+            grandparent = parent.getparent()
+            if grandparent is not None:
+                scores[grandparent] = scores.get(grandparent, 0) + score / 2
+        
+        if scores:
+            # Chỉ tính link density cho vài ứng viên tốt nhất
+            top_candidates = sorted(scores, key=scores.get, reverse=True)[:5]
+            best = max(top_candidates, key=lambda el: scores[el] * (1 - _link_density(el)))
+        else:
+            best = doc.find('body')
+            if best is None:
+                best = doc
+        
+        # Lấy text, dừng sớm khi đã đủ ký tự
+        parts = []
+        collected = 0
+        for text in best.itertext():
+            parts.append(text)
+            collected += len(text)
+            if collected >= max_chars * 2:  # Dư để bù phần whitespace bị bỏ
+                break
+        
+        content_text = normalize_text(" ".join(parts))
+        stats["extraction"] = "density"
+        return content_text[:max_chars] if content_text else ""
+        
+    except Exception as e:
+        print(f"    ⚠️ Lỗi parse HTML (lxml): {e}")
+        return ""
 
-def extract_content_from_html(html_content, url):
-    """Trích xuất nội dung chính từ HTML"""
+def extract_content_bs4(html_content, url, max_chars=CONTENT_MAX_CHARS, rule=None, stats=None):
+    """Trích xuất nội dung chính từ HTML bằng BeautifulSoup và các selector phổ biến"""
+    stats = stats if stats is not None else {}
     try:
         soup = BeautifulSoup(html_content, 'html.parser')
         
@@ -73,6 +917,13 @@ def extract_content_from_html(html_content, url):
         for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'menu']):
             tag.decompose()
         
+        if rule is not None and not stats.get("rule_tried"):
+            stats["rule_tried"] = True
+            content_text = rule.apply_soup(soup, stats)
+            if len(content_text) >= MIN_RULE_CONTENT_CHARS:
+                stats["extraction"] = "site_rule"
+                return content_text[:max_chars]
+        
         # Tìm content chính theo các pattern phổ biến
         selectors = [
             'article',
@@ -104,56 +955,260 @@ def extract_content_from_html(html_content, url):
         
         # Làm sạch và cắt ngắn
         content_text = clean_text(content_text)
+        stats["extraction"] = "bs4"
         
-        return content_text[:3000] if content_text else ""
+        return content_text[:max_chars] if content_text else ""
         
     except Exception as e:
         print(f"    ⚠️ Lỗi parse HTML: {e}")
         return ""
 
-def fetch_article_content(url, max_retries=2):
-    """Lấy nội dung bài báo từ URL"""
+# Tải bài viết dạng stream, dừng khi đã đủ nội dung hoặc chạm giới hạn byte
+FETCH_STREAMING = os.getenv("DIGEST_FETCH_STREAMING", "1") != "0"
+FETCH_MAX_BYTES = int(os.getenv("DIGEST_FETCH_MAX_BYTES", str(512 * 1024)))
+FETCH_CHUNK_SIZE = 16 * 1024
+STREAM_TEXT_TARGET = CONTENT_MAX_CHARS * 3 // 2  # Dư một chút để engine trích xuất chọn đúng khối
+
+class ArticleTextProbe(HTMLParser):
+    """Parser tăng dần, đếm số ký tự trong các đoạn <p> để biết đã tải đủ nội dung chưa"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.paragraph_depth = 0
+        self.paragraph_chars = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in JUNK_TAGS:
+            self.skip_depth += 1
+        elif tag == 'p':
+            self.paragraph_depth += 1
+    
+    def handle_endtag(self, tag):
+        if tag in JUNK_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == 'p' and self.paragraph_depth:
+            self.paragraph_depth -= 1
+    
+    def handle_data(self, data):
+        if self.paragraph_depth and not self.skip_depth:
+            self.paragraph_chars += len(data.strip())
+    
+    def has_enough_text(self, target=STREAM_TEXT_TARGET):
+        return self.paragraph_chars >= target
+
+# Xác định charset: header -> BOM -> <meta> -> thử UTF-8 -> nhận diện thống kê trên một đoạn đầu
+CHARSET_META_BYTES = 4096  # Chỉ tìm <meta charset> / http-equiv trong từng này byte đầu
+CHARSET_DETECT_BYTES = 32 * 1024  # Nhận diện thống kê (chardet) chỉ chạy trên đoạn đầu này
+WEAK_HEADER_CHARSETS = {'iso8859-1', 'ascii'}  # Hay bị server khai báo sai/mặc định
+CHARSET_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+CONTENT_TYPE_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([\w.:\-]+)', re.I)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:\-]+)', re.I)
+
+def _valid_charset(name):
+    """Tên codec chuẩn của Python cho một nhãn charset, None nếu không nhận ra"""
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip().lower()).name
+    except LookupError:
+        return None
+
+def _header_charset(content_type):
+    """Charset trong header Content-Type (None nếu không khai báo)"""
+    match = CONTENT_TYPE_CHARSET_RE.search(content_type or "")
+    return _valid_charset(match.group(1)) if match else None
+
+def _is_utf8(body, truncated=False):
+    """Body giải mã được bằng UTF-8 (truncated: cho phép ký tự cuối bị cắt dở do dừng tải sớm)"""
+    try:
+        body.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return truncated and e.reason == 'unexpected end of data' and e.start >= len(body) - 3
+    return True
+
+def resolve_charset(body, content_type=None, truncated=False):
+    """Xác định charset của một trang HTML; trả về (encoding, method)
+    
+    method cho biết bước đã quyết định: header, bom, meta, utf-8, detect
+    hoặc default. Header khai báo ISO-8859-1/ASCII chỉ là phương án cuối,
+    sau cả <meta>, UTF-8 và nhận diện thống kê, vì nhiều server gửi giá trị
+    mặc định này cho trang thực ra là UTF-8 hay cp1258/windows-1252.
+    """
+    header = _header_charset(content_type)
+    for bom, encoding in CHARSET_BOMS:
+        if body.startswith(bom):
+            return encoding, "bom"
+    if header and header not in WEAK_HEADER_CHARSETS:
+        return header, "header"
+    
+    match = META_CHARSET_RE.search(body[:CHARSET_META_BYTES])
+    meta = _valid_charset(match.group(1).decode('ascii', 'ignore')) if match else None
+    if meta and not meta.startswith('utf-16'):  # Trang đã đọc được dạng ASCII thì không thể là UTF-16
+        return meta, "meta"
+    
+    if _is_utf8(body, truncated):
+        return 'utf-8', "utf-8"
+    
+    sample = body[:CHARSET_DETECT_BYTES]
+    detected = _valid_charset(chardet.detect(sample).get('encoding')) if sample else None
+    if detected:
+        return detected, "detect"
+    if header:
+        return header, "header"
+    return 'utf-8', "default"
+
+def decode_html(body, content_type=None, stats=None, truncated=False):
+    """Giải mã HTML theo charset xác định bởi resolve_charset
+    
+    Nếu truyền dict stats, ghi charset và cách xác định (charset_method).
+    """
+    encoding, method = resolve_charset(body, content_type, truncated)
+    if stats is not None:
+        stats["charset"] = encoding
+        stats["charset_method"] = method
+    return body.decode(encoding, errors='replace')
+
+def read_html_stream(response, stats, max_bytes=FETCH_MAX_BYTES):
+    """Đọc body theo từng chunk, dừng khi đã đủ text bài viết hoặc chạm max_bytes"""
+    content_type = response.headers.get('Content-Type')
+    # Probe chỉ đếm ký tự nên giải mã tạm theo header; charset thật xác định sau khi đọc xong
+    decoder = codecs.getincrementaldecoder(_header_charset(content_type) or 'utf-8')(errors='replace')
+    
+    probe = ArticleTextProbe()
+    chunks = []
+    downloaded = 0
+    stop_reason = "complete"
+    try:
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            chunks.append(chunk)
+            downloaded += len(chunk)
+            probe.feed(decoder.decode(chunk))
+            
+            if probe.has_enough_text():
+                stop_reason = "enough_text"
+                break
+            if downloaded >= max_bytes:
+                stop_reason = "byte_cap"
+                break
+    finally:
+        response.close()
+    
+    stats["bytes_downloaded"] = downloaded
+    stats["stop_reason"] = stop_reason
+    return decode_html(b"".join(chunks), content_type, stats, truncated=stop_reason != "complete")
+
+def download_article(url, max_retries=2, stats=None):
+    """Tải HTML bài báo (có giới hạn byte, thử lại khi timeout); trả về "" nếu lỗi
+    
+    Nếu truyền dict stats, hàm ghi thêm số byte đã tải (bytes_downloaded),
+    lý do dừng tải (stop_reason), mã HTTP (status) và số lần thử lại (retries).
+    """
+    stats = stats if stats is not None else {}
+    stats["retries"] = 0
+    health = get_host_health()
     for attempt in range(max_retries):
+        if not health.allow(url):
+            print(f"    ⛔ {get_host(url)} đang bị ngắt mạch, không tải trang")
+            stats["error"] = "CircuitOpen"
+            return ""
         try:
             print(f"    🌐 Fetching: {url[:80]}...")
             
-            response = requests.get(
-                url, 
-                headers=HEADERS, 
-                timeout=15,
-                allow_redirects=True
-            )
-            response.raise_for_status()
-            
-            # Auto-detect encoding
-            if response.encoding == 'ISO-8859-1':
-                response.encoding = response.apparent_encoding or 'utf-8'
-            
-            content = extract_content_from_html(response.text, url)
-            
-            if len(content) > 100:  # Có nội dung hợp lệ
-                print(f"    ✅ Lấy được {len(content)} ký tự")
-                return content
-            else:
-                print(f"    ⚠️ Nội dung quá ngắn ({len(content)} ký tự)")
-                return ""
+            with telemetry.span("article.fetch", url=url, host=get_host(url)) as span:
+                # Đóng response kể cả khi raise_for_status/đọc body lỗi, để trả kết nối về pool
+                with host_slot(url), http_get(
+                    url, 
+                    timeout=health.timeout_for(url),
+                    allow_redirects=True,
+                    stream=FETCH_STREAMING
+                ) as response:
+                    stats["status"] = span["status"] = response.status_code
+                    stats["retries"] = attempt + response.retries
+                    if is_host_failure_status(response.status_code):
+                        health.record_failure(url)
+                    else:
+                        health.record_success(url, response.elapsed.total_seconds())
+                    response.raise_for_status()
+                    
+                    if FETCH_STREAMING:
+                        html_text = read_html_stream(response, stats)
+                    else:
+                        html_text = decode_html(response.content, response.headers.get('Content-Type'), stats)
+                        stats["bytes_downloaded"] = len(response.content)
+                        stats["stop_reason"] = "complete"
+                span.update(bytes=stats["bytes_downloaded"], charset_method=stats.get("charset_method"))
+            return html_text
                 
         except requests.exceptions.Timeout:
             print(f"    ⚠️ Timeout attempt {attempt+1}/{max_retries}")
+            stats["retries"] = attempt + 1
+            stats["error"] = "Timeout"
+            health.record_failure(url)
             if attempt < max_retries - 1:
                 time.sleep(2)
             continue
             
+        except requests.exceptions.ConnectionError as e:
+            print(f"    ⚠️ Request error: {str(e)[:100]}")
+            stats["error"] = type(e).__name__
+            health.record_failure(url)
+            return ""
+            
         except requests.exceptions.RequestException as e:
             print(f"    ⚠️ Request error: {str(e)[:100]}")
+            stats["error"] = type(e).__name__
+            health.release_probe(url)
             return ""
             
         except Exception as e:
             print(f"    ⚠️ Unexpected error: {str(e)[:100]}")
+            stats["error"] = type(e).__name__
+            health.release_probe(url)
             return ""
     
     return ""
 
+def extract_article_text(html_text, url, stats=None):
+    """Trích xuất nội dung bài từ HTML đã tải; trả về "" nếu quá ngắn hoặc lỗi
+    
+    Ghi số byte nội dung thực dùng (bytes_used) vào stats.
+    """
+    stats = stats if stats is not None else {}
+    try:
+        with telemetry.span("article.extract", url=url) as span:
+            content = extract_content_from_html(html_text, url, stats=stats)
+            span.update(chars=len(content), extraction=stats.get("extraction"))
+    except Exception as e:
+        print(f"    ⚠️ Unexpected error: {str(e)[:100]}")
+        stats["error"] = type(e).__name__
+        return ""
+    stats["bytes_used"] = len(content.encode('utf-8'))
+    
+    if len(content) > 100:  # Có nội dung hợp lệ
+        print(f"    ✅ Lấy được {len(content)} ký tự "
+              f"({stats['bytes_used']:,}/{stats.get('bytes_downloaded', 0):,} byte được dùng)")
+        return content
+    else:
+        print(f"    ⚠️ Nội dung quá ngắn ({len(content)} ký tự)")
+        stats["bytes_used"] = 0
+        return ""
+
+def fetch_article_content(url, max_retries=2, stats=None):
+    """Lấy nội dung bài báo từ URL (tải rồi trích xuất)
+    
+    Nếu truyền dict stats, hàm ghi thêm số byte đã tải (bytes_downloaded),
+    số byte nội dung thực dùng (bytes_used), lý do dừng tải (stop_reason),
+    mã HTTP (status) và số lần thử lại (retries).
+    """
+    stats = stats if stats is not None else {}
+    html_text = download_article(url, max_retries, stats)
+    return extract_article_text(html_text, url, stats) if html_text else ""
+
 def get_rss_description(entry):
     """Lấy mô tả từ RSS entry"""
     description = ""
@@ -178,228 +1233,2157 @@ def get_rss_description(entry):
     
     return ""
 
-def summarize_with_deepseek(content, title=""):
-    """Tóm tắt nội dung bằng DeepSeek API"""
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        return "⚠️ Thiếu DEEPSEEK_API_KEY"
-    
-    if not content or len(content.strip()) < 50:
-        return "⚠️ Nội dung quá ngắn để tóm tắt"
+# Cấu hình DeepSeek API
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+DEEPSEEK_MODEL = "deepseek-chat"
+SUMMARY_CONTENT_LIMIT = 2000  # Giới hạn ký tự khi tắt rút gọn theo token
+SUMMARY_SYSTEM_PROMPT = "Bạn là chuyên gia phân tích tin tức Việt Nam về PCCC (phòng cháy chữa cháy), năng lượng LNG, và giao thông MRT. Tóm tắt tin tức ngắn gọn, chính xác bằng tiếng Việt."
+SUMMARY_USER_PROMPT = "Hãy tóm tắt tin tức này trong 2-3 câu, tập trung vào thông tin quan trọng:\n\n{prompt_text}"
+SUMMARY_LATENCY_BUDGET = float(os.getenv("DIGEST_SUMMARY_LATENCY_BUDGET", "30"))  # Timeout mỗi request DeepSeek (giây)
 
-    try:
-        # Tạo prompt context
-        prompt_text = f"Tiêu đề: {title}\n\nNội dung: {content[:2000]}"  # Giới hạn để tránh token limit
-        
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": "Bạn là chuyên gia phân tích tin tức Việt Nam về PCCC (phòng cháy chữa cháy), năng lượng LNG, và giao thông MRT. Tóm tắt tin tức ngắn gọn, chính xác bằng tiếng Việt."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"Hãy tóm tắt tin tức này trong 2-3 câu, tập trung vào thông tin quan trọng:\n\n{prompt_text}"
-                    }
-                ],
-                "temperature": 0.3,
-                "max_tokens": 200,
-                "top_p": 0.9
-            },
-            timeout=30
-        )
-        
-        response.raise_for_status()
-        result = response.json()
-        
-        if 'choices' in result and result['choices'] and 'message' in result['choices'][0]:
-            summary = result['choices'][0]['message']['content'].strip()
-            return summary if summary else "⚠️ AI không trả về kết quả"
-        else:
-            return "⚠️ Phản hồi API không hợp lệ"
-            
-    except requests.exceptions.Timeout:
-        return "⚠️ Timeout khi gọi DeepSeek API"
-    except requests.exceptions.RequestException as e:
-        return f"⚠️ Lỗi API: {str(e)[:80]}"
-    except Exception as e:
-        return f"⚠️ Lỗi: {str(e)[:80]}"
+# Cache tóm tắt trên đĩa
+SUMMARY_CACHE_ENABLED = os.getenv("DIGEST_SUMMARY_CACHE", "1") != "0"
+SUMMARY_CACHE_FILE = os.path.join(STATE_DIR, "summary_cache.sqlite")
+SUMMARY_CACHE_TTL = float(os.getenv("DIGEST_SUMMARY_CACHE_TTL_DAYS", "7")) * 86400
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("DIGEST_SUMMARY_CACHE_MAX_ENTRIES", "5000"))
 
-def process_rss_feed(feed_url, topic, max_articles=3):
-    """Xử lý một RSS feed"""
-    articles = []
+class SummaryCache:
+    """Cache tóm tắt (SQLite), khoá theo hash của model, prompt, tiêu đề và nội dung"""
     
-    try:
-        print(f"  📡 Đang xử lý: {feed_url}")
-        
-        # Parse RSS
-        feed = feedparser.parse(feed_url)
-        
-        if not feed.entries:
-            print(f"  ❌ Không có bài viết nào")
-            return articles
-        
-        print(f"  📰 Tìm thấy {len(feed.entries)} bài viết, xử lý {min(max_articles, len(feed.entries))} bài")
+    def __init__(self, path, ttl=SUMMARY_CACHE_TTL, max_entries=SUMMARY_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
         
-        for i, entry in enumerate(feed.entries[:max_articles]):
-            print(f"\n    📄 [{i+1}/{max_articles}] {entry.title[:60]}...")
-            
-            # Lấy nội dung full từ link
-            full_content = ""
-            if hasattr(entry, 'link') and entry.link:
-                full_content = fetch_article_content(entry.link)
-            
-            # Nếu không lấy được full content, dùng description từ RSS
-            if not full_content:
-                full_content = get_rss_description(entry)
-                print(f"    📝 Sử dụng RSS description: {len(full_content)} ký tự")
-            
-            if not full_content:
-                print(f"    ❌ Không có nội dung")
-                continue
-            
-            # Tóm tắt bằng AI
-            print(f"    🤖 Đang tóm tắt...")
-            summary = summarize_with_deepseek(full_content, entry.title)
-            
-            # Lưu thông tin bài viết
-            article_info = {
-                "title": getattr(entry, 'title', 'Không có tiêu đề'),
-                "link": getattr(entry, 'link', ''),
-                "summary": summary,
-                "published": getattr(entry, 'published', ''),
-                "content_length": len(full_content)
-            }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+    
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt, title, content):
+        """Hash SHA-256 của mọi thứ ảnh hưởng tới kết quả tóm tắt"""
+        payload = json.dumps([model, system_prompt, user_prompt, title, content], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Trả về tóm tắt đã cache, hoặc None nếu không có / đã hết hạn"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
             
-            articles.append(article_info)
-            print(f"    ✅ Hoàn thành bài {i+1}")
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.stats["evictions"] += 1
+                self.stats["misses"] += 1
+                return None
             
-            # Delay để tránh overload
-            time.sleep(1)
-        
-    except Exception as e:
-        print(f"  ❌ Lỗi xử lý feed: {e}")
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+    
+    def put(self, key, summary):
+        """Lưu một tóm tắt thành công vào cache"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, summary, now, now)
+            )
+            self._conn.commit()
+            self.stats["stores"] += 1
+    
+    def evict(self):
+        """Xoá các mục hết hạn và các mục ít dùng nhất khi vượt quá số lượng cho phép"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            evicted = cursor.rowcount
+            cursor = self._conn.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                " SELECT key FROM summaries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            evicted += cursor.rowcount
+            self._conn.commit()
+            self.stats["evictions"] += evicted
     
-    return articles
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-def collect_all_news():
-    """Thu thập tin tức từ tất cả RSS feeds"""
-    all_news = {}
-    total_articles = 0
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+def get_summary_cache():
+    """Lấy cache tóm tắt dùng chung (None nếu bị tắt hoặc không mở được)"""
+    global _summary_cache
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            try:
+                _summary_cache = SummaryCache(SUMMARY_CACHE_FILE)
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ Không mở được cache tóm tắt: {e}")
+                return None
+        return _summary_cache
+
+def estimate_tokens(text):
+    """Ước lượng nhanh số token (tiếng Việt trung bình ~3 ký tự/token)"""
+    return len(text) // 3 + 1
+
+# Client LLM: giới hạn request đồng thời, backoff khi 429/5xx, hedging
+LLM_MAX_CONCURRENCY = int(os.getenv("DIGEST_LLM_CONCURRENCY", str(MAX_WORKERS)))  # Trần số request đồng thời
+LLM_MAX_RETRIES = int(os.getenv("DIGEST_LLM_MAX_RETRIES", "3"))  # Số lần thử lại khi 429/5xx/lỗi kết nối
+LLM_BACKOFF_BASE = 1.0   # Giây; lần thử thứ n chờ ngẫu nhiên trong [0, base x 2^n]
+LLM_BACKOFF_MAX = 30.0
+LLM_RETRY_STATUSES = (429, 500, 502, 503, 504)
+LLM_HEDGE = os.getenv("DIGEST_LLM_HEDGE", "0") == "1"  # Gửi thêm một request khi request đầu chậm hơn p95
+LLM_HEDGE_MIN_SAMPLES = 10  # Cần đủ số lần đo để ước lượng p95
+LLM_LATENCY_SAMPLES = 200
+
+class LLMClient:
+    """Gửi chat completion với số request đồng thời thích nghi theo rate limit
     
-    print(f"\n🔄 Bắt đầu thu thập tin tức từ {len(RSS_FEEDS)} chủ đề...")
+    - Giới hạn đồng thời bắt đầu ở max_concurrency, giảm một nửa mỗi khi gặp
+      429 và tăng dần lại 1 sau mỗi `limit` lần thành công liên tiếp.
+    - 429/5xx và lỗi kết nối được thử lại với backoff lũy thừa có jitter (tôn
+      trọng Retry-After nếu lâu hơn); timeout không thử lại vì đã hết ngân sách.
+    - hedge=True: request chạy quá p95 độ trễ đã quan sát thì gửi thêm một
+      bản sao (nếu còn slot), lấy kết quả về trước.
+    """
     
-    for topic, feed_urls in RSS_FEEDS.items():
-        print(f"\n📚 CHUYÊN MỤC: {topic}")
-        print("=" * 40)
-        
-        all_news[topic] = []
-        
-        for feed_url in feed_urls:
-            articles = process_rss_feed(feed_url, topic, max_articles=3)
-            all_news[topic].extend(articles)
-            total_articles += len(articles)
-            
-            # Nghỉ giữa các feed
-            time.sleep(2)
-        
-        print(f"  📊 Tổng {topic}: {len(all_news[topic])} bài")
+    def __init__(self, url, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES, hedge=LLM_HEDGE):
+        self.url = url
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.limit = self.max_concurrency
+        self._active = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self._latencies = []
+        self._hedge_pool = None
+        self.stats = {
+            "calls": 0, "requests": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "failures": 0,
+            "hedges": 0, "hedge_wins": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+        }
     
-    print(f"\n📈 TỔNG KẾT: {total_articles} bài viết từ {len(RSS_FEEDS)} chuyên mục")
-    return all_news
-
-def generate_email_content(news_data):
-    """Tạo nội dung email"""
-    today = datetime.now()
-    date_str = today.strftime("%Y-%m-%d")
-    time_str = today.strftime("%H:%M:%S")
+    def _acquire(self, blocking=True):
+        with self._condition:
+            while self._active >= self.limit:
+                if not blocking:
+                    return False
+                self._condition.wait()
+            self._active += 1
+            return True
     
-    total_count = sum(len(articles) for articles in news_data.values())
+    def _release(self, *args):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
     
-    # Subject
-    subject = f"[BẢN TIN] PCCC·LNG·MRT — {date_str} ({total_count} tin)"
+    def _count(self, name, value=1):
+        with self._condition:
+            self.stats[name] += value
     
-    # Body header
-    body = f"""📰 BẢN TIN TỰ ĐỘNG HÀNG NGÀY
-📅 Ngày: {date_str}
-⏰ Tạo lúc: {time_str}
-📊 Tổng số: {total_count} tin tức
-{'='*60}
-
-"""
+    def _on_rate_limited(self):
+        with self._condition:
+            self.stats["rate_limited"] += 1
+            self._successes = 0
+            if self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                print(f"    🚦 API báo 429, giảm số request đồng thời còn {self.limit}")
     
-    # Content cho từng chuyên mục
-    for topic, articles in news_data.items():
-        if not articles:
-            continue
-            
-        body += f"\n🏷️  {topic} ({len(articles)} tin)\n"
-        body += "─" * 50 + "\n\n"
-        
-        for i, article in enumerate(articles, 1):
-            body += f"{i}. {article['title']}\n"
-            
-            if article['link']:
-                body += f"🔗 {article['link']}\n"
+    def _on_success(self, latency):
+        with self._condition:
+            self._latencies = (self._latencies + [latency])[-LLM_LATENCY_SAMPLES:]
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify()
+    
+    def latency_percentile(self, fraction):
+        with self._condition:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+    
+    def _post(self, payload, headers, timeout):
+        self._count("requests")
+        started = time.perf_counter()
+        response = get_http_session().post(self.url, headers=headers, json=payload, timeout=timeout)
+        response.latency = time.perf_counter() - started
+        return response
+    
+    def _submit(self, payload, headers, timeout, blocking=True):
+        """Chạy _post trên pool hedging, giữ slot đến khi request xong (kể cả khi bị bỏ)"""
+        if not self._acquire(blocking):
+            return None
+        if self._hedge_pool is None:
+            with self._condition:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=self.max_concurrency * 2,
+                                                          thread_name_prefix="llm-hedge")
+        future = self._hedge_pool.submit(self._post, payload, headers, timeout)
+        future.add_done_callback(self._release)
+        return future
+    
+    def _attempt(self, payload, headers, timeout):
+        """Một lần gửi (có thể kèm bản sao hedging); trả về response về trước"""
+        with self._condition:
+            enough_samples = len(self._latencies) >= LLM_HEDGE_MIN_SAMPLES
+        if not (self.hedge and enough_samples):
+            self._acquire()
+            try:
+                return self._post(payload, headers, timeout)
+            finally:
+                self._release()
+        
+        primary = self._submit(payload, headers, timeout)
+        done, _ = wait([primary], timeout=self.latency_percentile(0.95))
+        hedge = None if done else self._submit(payload, headers, timeout, blocking=False)
+        if hedge is None:
+            return primary.result()
+        
+        self._count("hedges")
+        for future in as_completed([primary, hedge]):
+            if future.exception() is None:
+                if future is hedge:
+                    self._count("hedge_wins")
+                return future.result()
+        return primary.result()
+    
+    def complete(self, payload, api_key, timeout=None):
+        """Gửi một chat completion; trả về response thành công (response.retries = số lần thử lại)
+        
+        Hết số lần thử lại thì ném lỗi của requests như raise_for_status.
+        """
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        timeout = timeout or SUMMARY_LATENCY_BUDGET
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._attempt(payload, headers, timeout)
+            except requests.exceptions.ConnectionError as e:
+                if isinstance(e, requests.exceptions.Timeout) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            except requests.exceptions.RequestException:
+                self._count("failures")
+                raise
+            else:
+                if response.status_code not in LLM_RETRY_STATUSES:
+                    if response.ok:
+                        self._on_success(response.latency)
+                        self._record_usage(response)
+                    else:
+                        self._count("failures")
+                    response.retries = attempt
+                    response.raise_for_status()
+                    return response
+                
+                if response.status_code == 429:
+                    self._on_rate_limited()
+                else:
+                    self._count("server_errors")
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    response.retries = attempt
+                    response.raise_for_status()
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+                delay = max(delay, min(parse_retry_after(response.headers.get("Retry-After")) or 0, LLM_BACKOFF_MAX))
+                response.close()
             
-            if article['published']:
-                body += f"📅 {article['published']}\n"
+            self._count("retries")
+            print(f"    🔁 Thử lại request tóm tắt sau {delay:.1f}s (lần {attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+    
+    def _record_usage(self, response):
+        try:
+            usage = response.json().get("usage") or {}
+        except (ValueError, AttributeError):
+            return
+        with self._condition:
+            for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                if isinstance(usage.get(name), int):
+                    self.stats[name] += usage[name]
+    
+    def report(self):
+        """Thống kê các lần gọi: số lần, độ trễ p50/p95, thử lại, 429, hedging, token"""
+        with self._condition:
+            report = dict(self.stats, limit=self.limit, max_concurrency=self.max_concurrency)
+        report["p50"] = self.latency_percentile(0.50)
+        report["p95"] = self.latency_percentile(0.95)
+        return report
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client():
+    """Lấy client LLM dùng chung cho DEEPSEEK_API_URL"""
+    global _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient(DEEPSEEK_API_URL)
+        return _llm_client
+
+def print_llm_report():
+    """In thống kê gọi API tóm tắt của lần chạy (nếu có gọi)"""
+    if _llm_client is None or not _llm_client.stats["calls"]:
+        return
+    report = _llm_client.report()
+    latency = (f", độ trễ p50 {report['p50'] * 1000:.0f} ms / p95 {report['p95'] * 1000:.0f} ms"
+               if report["p50"] is not None else "")
+    print(f"🤖 LLM: {report['calls']} lần gọi ({report['requests']} request){latency}, "
+          f"{report['retries']} thử lại, {report['rate_limited']} lần 429, {report['failures']} thất bại, "
+          f"hedging {report['hedge_wins']}/{report['hedges']} thắng, đồng thời {report['limit']}/{report['max_concurrency']}")
+    print(f"🧾 Token theo usage: {report['prompt_tokens']} prompt + {report['completion_tokens']} completion "
+          f"= {report['total_tokens']}")
+
+def post_chat_completion(api_key, user_content, max_tokens=200):
+    """Gửi một chat completion tới DeepSeek, trả về nội dung trả lời (có thể rỗng)"""
+    prompt_tokens = estimate_tokens(SUMMARY_SYSTEM_PROMPT + user_content)
+    print(f"    🧮 Prompt ước tính ~{prompt_tokens} token")
+    with telemetry.span("summary.request", host=get_host(DEEPSEEK_API_URL), prompt_tokens_est=prompt_tokens) as span:
+        try:
+            response = get_llm_client().complete(
+                {
+                    "model": DEEPSEEK_MODEL,
+                    "messages": [
+                        {
+                            "role": "system", 
+                            "content": SUMMARY_SYSTEM_PROMPT
+                        },
+                        {
+                            "role": "user", 
+                            "content": user_content
+                        }
+                    ],
+                    "temperature": 0.3,
+                    "max_tokens": max_tokens,
+                    "top_p": 0.9
+                },
+                api_key,
+                timeout=SUMMARY_LATENCY_BUDGET
+            )
+        except requests.exceptions.HTTPError as e:
+            span.update(status=e.response.status_code, retries=getattr(e.response, "retries", 0))
+            raise
+        span.update(status=response.status_code, retries=response.retries, latency=round(response.latency, 4))
+        
+        result = response.json()
+        if isinstance(result, dict) and isinstance(result.get('usage'), dict):
+            span["usage"] = result['usage']
+    
+    if 'choices' in result and result['choices'] and 'message' in result['choices'][0]:
+        return result['choices'][0]['message']['content'].strip()
+    raise ValueError("Phản hồi API không hợp lệ")
+
+# Rút gọn nội dung theo ngân sách token trước khi tóm tắt
+SUMMARY_TOKEN_BUDGET = int(os.getenv("DIGEST_SUMMARY_TOKEN_BUDGET", "600"))  # 0 = cắt SUMMARY_CONTENT_LIMIT ký tự như cũ
+SUMMARY_LEAD_WEIGHT = float(os.getenv("DIGEST_SUMMARY_LEAD_WEIGHT", "0.3"))  # Tỉ trọng ưu tiên các câu đầu bài
+TITLE_TERM_BOOST = 2.0  # Từ xuất hiện trong tiêu đề được nhân trọng số
+SENTENCE_ABBREVIATIONS = {"tp", "tx", "q", "p", "ts", "ths", "pgs", "gs", "bs", "ks", "th", "mr", "ms", "dr"}
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+_TERM_RE = re.compile(r'\w+')
+
+def _continues_sentence(previous, piece):
+    """Đoạn tách ra có phải phần tiếp của câu trước không (sau chữ viết tắt, chữ thường...)"""
+    first = piece[:1]
+    if not (first.isupper() or first.isdigit() or first in '"\'(['):
+        return True
+    last_word = previous.rsplit(" ", 1)[-1].rstrip(".").lower()
+    return last_word in SENTENCE_ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha())
+
+def split_sentences(text):
+    """Tách câu tiếng Việt theo . ! ? …, không tách sau chữ viết tắt như TP., PGS."""
+    sentences = []
+    for piece in _SENTENCE_END_RE.split(text.strip()):
+        if sentences and _continues_sentence(sentences[-1], piece):
+            sentences[-1] += " " + piece
+        elif piece:
+            sentences.append(piece)
+    return sentences
+
+def _term_count_matrix(term_lists, vocabulary):
+    """Ma trận số lần xuất hiện (câu x từ) cho NumPy"""
+    rows = np.repeat(np.arange(len(term_lists)), [len(terms) for terms in term_lists])
+    cols = np.fromiter((vocabulary[term] for terms in term_lists for term in terms), dtype=np.intp, count=len(rows))
+    counts = np.zeros((len(term_lists), len(vocabulary)))
+    np.add.at(counts, (rows, cols), 1)
+    return counts
+
+def score_sentences(sentences, title="", lead_weight=None):
+    """Chấm điểm câu: TF-IDF trong bài (câu là văn bản) kết hợp ưu tiên vị trí đầu bài
+    
+    Trọng số từ = tần suất trong bài x IDF giữa các câu (từ có ở mọi câu gần
+    như bằng 0); điểm câu = tổng trọng số các từ khác nhau / sqrt(số từ),
+    chuẩn hoá về [0, 1] rồi trộn với 1 / (vị trí + 1) theo lead_weight.
+    """
+    lead_weight = SUMMARY_LEAD_WEIGHT if lead_weight is None else lead_weight
+    term_lists = [_TERM_RE.findall(sentence.lower()) for sentence in sentences]
+    title_terms = set(_TERM_RE.findall(title.lower()))
+    vocabulary = {}
+    for terms in term_lists:
+        for term in terms:
+            vocabulary.setdefault(term, len(vocabulary))
+    count = len(sentences)
+    
+    if np is not None:
+        counts = _term_count_matrix(term_lists, vocabulary)
+        present = counts > 0
+        weights = counts.sum(axis=0) * np.log((1 + count) / (1 + present.sum(axis=0)))
+        if title_terms:
+            boost = np.ones(len(vocabulary))
+            boost[[index for term, index in vocabulary.items() if term in title_terms]] = TITLE_TERM_BOOST
+            weights *= boost
+        scores = (present @ weights) / np.sqrt(np.maximum(counts.sum(axis=1), 1))
+        top = scores.max() if count else 0
+        scores = scores / top if top > 0 else scores
+        lead = 1.0 / (np.arange(count) + 1)
+        return ((1 - lead_weight) * scores + lead_weight * lead).tolist()
+    
+    term_counts = {}
+    document_counts = {}
+    for terms in term_lists:
+        for term in terms:
+            term_counts[term] = term_counts.get(term, 0) + 1
+        for term in set(terms):
+            document_counts[term] = document_counts.get(term, 0) + 1
+    weights = {
+        term: term_counts[term] * math.log((1 + count) / (1 + document_counts[term]))
+              * (TITLE_TERM_BOOST if term in title_terms else 1.0)
+        for term in term_counts
+    }
+    scores = [sum(weights[term] for term in set(terms)) / math.sqrt(max(len(terms), 1)) for terms in term_lists]
+    top = max(scores, default=0)
+    return [(1 - lead_weight) * (score / top if top > 0 else score) + lead_weight / (i + 1)
+            for i, score in enumerate(scores)]
+
+def reduce_content(content, title="", token_budget=None):
+    """Chọn các câu giàu thông tin nhất vừa ngân sách token, giữ thứ tự gốc
+    
+    Trả về (nội dung rút gọn, số câu giữ lại, tổng số câu).
+    """
+    token_budget = token_budget or SUMMARY_TOKEN_BUDGET
+    sentences = split_sentences(content)
+    if not sentences:
+        return "", 0, 0
+    
+    scores = score_sentences(sentences, title)
+    chosen, used, seen = [], 0, set()
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        tokens = estimate_tokens(sentences[i])
+        if used + tokens <= token_budget and sentences[i].lower() not in seen:
+            chosen.append(i)
+            used += tokens
+            seen.add(sentences[i].lower())
+    
+    if not chosen:  # Câu nào cũng dài hơn ngân sách: cắt theo ký tự
+        return content[:token_budget * 3], 0, len(sentences)
+    return " ".join(sentences[i] for i in sorted(chosen)), len(chosen), len(sentences)
+
+def prepare_summary_content(content, title=""):
+    """Nội dung đưa vào prompt: rút gọn theo DIGEST_SUMMARY_TOKEN_BUDGET (0 = cắt ký tự như cũ)"""
+    if SUMMARY_TOKEN_BUDGET <= 0:
+        return content[:SUMMARY_CONTENT_LIMIT]
+    
+    original_tokens = estimate_tokens(content)
+    if original_tokens <= SUMMARY_TOKEN_BUDGET:
+        return content
+    
+    with telemetry.span("summary.reduce", tokens_before=original_tokens) as span:
+        reduced, kept, total = reduce_content(content, title)
+        span.update(tokens_after=estimate_tokens(reduced), sentences_kept=kept, sentences=total)
+    print(f"    ✂️ Rút gọn nội dung: ~{original_tokens} → ~{span['tokens_after']} token ({kept}/{total} câu)")
+    return reduced
+
+# Tóm tắt trích câu tại chỗ (TextRank), không cần mạng
+SUMMARY_MODE = os.getenv("DIGEST_SUMMARY_MODE", "api")  # api | local
+LOCAL_FALLBACK = os.getenv("DIGEST_LOCAL_FALLBACK", "1") != "0"  # Dùng tóm tắt tại chỗ khi API lỗi/quá thời gian
+LOCAL_FALLBACK_AFTER_FAILURES = 3  # Số lỗi API liên tiếp trước khi bỏ qua API cho phần còn lại của lần chạy
+LOCAL_SUMMARY_SENTENCES = 3
+LOCAL_SUMMARY_MAX_CHARS = 500
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_MAX_ITERATIONS = 50
+
+_api_failures = {"consecutive": 0}
+_api_failures_lock = threading.Lock()
+
+def record_api_result(ok):
+    """Ghi nhận kết quả một request tóm tắt để biết API có đang hỏng liên tục không"""
+    with _api_failures_lock:
+        _api_failures["consecutive"] = 0 if ok else _api_failures["consecutive"] + 1
+
+def api_unavailable():
+    """API lỗi liên tiếp quá ngưỡng: các bài còn lại tóm tắt tại chỗ thay vì chờ timeout"""
+    with _api_failures_lock:
+        return LOCAL_FALLBACK and _api_failures["consecutive"] >= LOCAL_FALLBACK_AFTER_FAILURES
+
+def textrank_scores(sentences):
+    """Điểm TextRank trên ma trận tương đồng cosine TF-IDF giữa các câu (cần NumPy)"""
+    term_lists = [_TERM_RE.findall(sentence.lower()) for sentence in sentences]
+    vocabulary = {}
+    for terms in term_lists:
+        for term in terms:
+            vocabulary.setdefault(term, len(vocabulary))
+    count = len(sentences)
+    
+    counts = _term_count_matrix(term_lists, vocabulary)
+    vectors = counts * (np.log((1 + count) / (1 + (counts > 0).sum(axis=0))) + 1)
+    norms = np.linalg.norm(vectors, axis=1)
+    vectors /= np.where(norms > 0, norms, 1)[:, None]
+    
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    row_sums = similarity.sum(axis=1)
+    transition = similarity / np.where(row_sums > 0, row_sums, 1)[:, None]
+    
+    scores = np.full(count, 1.0 / count)
+    for _ in range(TEXTRANK_MAX_ITERATIONS):
+        updated = (1 - TEXTRANK_DAMPING) / count + TEXTRANK_DAMPING * (transition.T @ scores)
+        converged = np.abs(updated - scores).sum() < 1e-6
+        scores = updated
+        if converged:
+            break
+    return scores
+
+def summarize_locally(content, title="", sentence_count=LOCAL_SUMMARY_SENTENCES, max_chars=LOCAL_SUMMARY_MAX_CHARS):
+    """Tóm tắt trích câu: chọn vài câu quan trọng nhất, giữ thứ tự trong bài
+    
+    Có NumPy thì dùng TextRank trộn với ưu tiên câu đầu bài; không có thì dùng
+    điểm TF-IDF + vị trí của score_sentences.
+    """
+    if not content or len(content.strip()) < 50:
+        return "⚠️ Nội dung quá ngắn để tóm tắt"
+    
+    with telemetry.span("summary.local", chars=len(content)):
+        sentences = split_sentences(content)
+        if np is not None and len(sentences) > 2:
+            ranks = textrank_scores(sentences)
+            ranks = ranks / ranks.max()
+            lead = 1.0 / (np.arange(len(sentences)) + 1)
+            scores = ((1 - SUMMARY_LEAD_WEIGHT) * ranks + SUMMARY_LEAD_WEIGHT * lead).tolist()
+        else:
+            scores = score_sentences(sentences, title)
+        
+        chosen, used, seen = [], 0, set()
+        for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            if len(chosen) >= sentence_count:
+                break
+            if used + len(sentences[i]) <= max_chars and sentences[i].lower() not in seen:
+                chosen.append(i)
+                used += len(sentences[i])
+                seen.add(sentences[i].lower())
+    
+    if not chosen:  # Câu nào cũng quá dài: lấy câu đầu, cắt theo ký tự
+        return sentences[0][:max_chars].rstrip() + "…"
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+def request_deepseek_summary(content, title, api_key):
+    """Gọi DeepSeek API để tóm tắt một bài viết (content đã qua prepare_summary_content)"""
+    try:
+        # Tạo prompt context
+        prompt_text = f"Tiêu đề: {title}\n\nNội dung: {content}"
+        summary = post_chat_completion(api_key, SUMMARY_USER_PROMPT.format(prompt_text=prompt_text))
+        return summary if summary else "⚠️ AI không trả về kết quả"
             
-            body += f"📝 Tóm tắt: {article['summary']}\n"
-            body += f"📏 Độ dài: {article['content_length']} ký tự\n"
-            body += "\n" + "·" * 40 + "\n\n"
-    
-    # Footer
-    body += f"""
-{'='*60}
-🤖 Hệ thống Daily Digest tự động
-🔄 Lần chạy tiếp theo: Ngày mai 08:00
-⚙️ Phiên bản: 2.0 (No newspaper3k)
-"""
+    except requests.exceptions.Timeout:
+        return "⚠️ Timeout khi gọi DeepSeek API"
+    except requests.exceptions.RequestException as e:
+        return f"⚠️ Lỗi API: {str(e)[:80]}"
+    except ValueError as e:
+        return f"⚠️ {e}"
+    except Exception as e:
+        return f"⚠️ Lỗi: {str(e)[:80]}"
+
+def summary_cache_key(title, content, prompt_template=SUMMARY_USER_PROMPT):
+    """Khoá cache cho một bài viết với prompt template tương ứng"""
+    return SummaryCache.make_key(
+        DEEPSEEK_MODEL, SUMMARY_SYSTEM_PROMPT, prompt_template,
+        title, content
+    )
+
+def summarize_with_deepseek(content, title=""):
+    """Tóm tắt nội dung bằng DeepSeek API (có cache kết quả thành công)
     
-    return subject, body
+    DIGEST_SUMMARY_MODE=local tóm tắt tại chỗ, không gọi API. Ở chế độ api,
+    thiếu API key, API lỗi hoặc quá DIGEST_SUMMARY_LATENCY_BUDGET thì chuyển
+    sang tóm tắt tại chỗ (trừ khi DIGEST_LOCAL_FALLBACK=0).
+    """
+    if SUMMARY_MODE == "local":
+        return summarize_locally(content, title)
+    
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        return summarize_locally(content, title) if LOCAL_FALLBACK else "⚠️ Thiếu DEEPSEEK_API_KEY"
+    
+    if not content or len(content.strip()) < 50:
+        return "⚠️ Nội dung quá ngắn để tóm tắt"
+    
+    prompt_content = prepare_summary_content(content, title)
+    cache = get_summary_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = summary_cache_key(title, prompt_content)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"    💾 Dùng tóm tắt từ cache")
+            return cached
+    
+    if api_unavailable():
+        print(f"    📄 API đang lỗi liên tục, tóm tắt tại chỗ")
+        return summarize_locally(content, title)
+    
+    summary = request_deepseek_summary(prompt_content, title, api_key)
+    record_api_result(not summary.startswith("⚠️"))
+    
+    if summary.startswith("⚠️") and LOCAL_FALLBACK:
+        print(f"    📄 {summary[2:].strip()[:60]}, chuyển sang tóm tắt tại chỗ")
+        return summarize_locally(content, title)
+    
+    # Chỉ cache tóm tắt thành công, không cache thông báo lỗi hay tóm tắt tại chỗ
+    if cache is not None and not summary.startswith("⚠️"):
+        cache.put(cache_key, summary)
+    
+    return summary
 
-def send_daily_email(news_data):
-    """Gửi email báo cáo hàng ngày"""
+# Tóm tắt gộp nhiều bài trong một request
+SUMMARY_BATCH_SIZE = int(os.getenv("DIGEST_SUMMARY_BATCH_SIZE", "1"))  # > 1 để bật chế độ gộp
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.getenv("DIGEST_SUMMARY_BATCH_TOKENS", "6000"))
+SUMMARY_BATCH_PROMPT = (
+    "Hãy tóm tắt từng tin tức dưới đây trong 2-3 câu, tập trung vào thông tin quan trọng.\n"
+    "Chỉ trả về một JSON object, khoá là số thứ tự bài (\"1\", \"2\", ...), "
+    "giá trị là bản tóm tắt của bài đó.\n\n{articles}"
+)
+
+def _format_batch_item(number, title, content):
+    return f"[{number}] Tiêu đề: {title}\nNội dung: {content}"
+
+def plan_summary_batches(items, batch_size=None, token_budget=None):
+    """Chia các bài (title, content) thành các batch theo số bài và ngân sách token
     
-    # Kiểm tra cấu hình SMTP
-    smtp_config = {
+    Trả về danh sách batch, mỗi batch là danh sách index trong items.
+    """
+    batch_size = batch_size or SUMMARY_BATCH_SIZE
+    token_budget = token_budget or SUMMARY_BATCH_TOKEN_BUDGET
+    base_tokens = estimate_tokens(SUMMARY_SYSTEM_PROMPT + SUMMARY_BATCH_PROMPT)
+    
+    batches = []
+    current, current_tokens = [], base_tokens
+    for i, (title, content) in enumerate(items):
+        item_tokens = estimate_tokens(_format_batch_item(len(current) + 1, title, content))
+        if current and (len(current) >= batch_size or current_tokens + item_tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(i)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_summaries(text, count):
+    """Đọc JSON {"1": "...", ...} từ phản hồi; trả về dict số thứ tự -> tóm tắt hợp lệ"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("Không tìm thấy JSON trong phản hồi")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("JSON không phải object")
+    
+    summaries = {}
+    for number in range(1, count + 1):
+        value = data.get(str(number))
+        if isinstance(value, str) and value.strip():
+            summaries[number] = value.strip()
+    return summaries
+
+def summarize_batch_with_deepseek(items):
+    """Tóm tắt nhiều bài (title, content) trong một request DeepSeek
+    
+    Bài nào thiếu trong phản hồi (hoặc phản hồi không đọc được) sẽ được
+    tóm tắt lại bằng request riêng qua summarize_with_deepseek.
+    """
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key or SUMMARY_MODE == "local" or api_unavailable():
+        return [summarize_with_deepseek(content, title) for title, content in items]
+    
+    summaries = [None] * len(items)
+    cache = get_summary_cache()
+    pending = []
+    for i, (title, content) in enumerate(items):
+        if not content or len(content.strip()) < 50:
+            summaries[i] = "⚠️ Nội dung quá ngắn để tóm tắt"
+            continue
+        if cache is not None:
+            cached = cache.get(summary_cache_key(title, content, SUMMARY_BATCH_PROMPT))
+            if cached is not None:
+                summaries[i] = cached
+                continue
+        pending.append(i)
+    
+    if len(pending) == 1:
+        i = pending[0]
+        summaries[i] = summarize_with_deepseek(items[i][1], items[i][0])
+        return summaries
+    
+    if pending:
+        articles_text = "\n\n".join(
+            _format_batch_item(number, items[i][0], items[i][1])
+            for number, i in enumerate(pending, 1)
+        )
+        parsed = {}
+        try:
+            print(f"    🤖 Đang tóm tắt gộp {len(pending)} bài trong một request...")
+            reply = post_chat_completion(
+                api_key,
+                SUMMARY_BATCH_PROMPT.format(articles=articles_text),
+                max_tokens=200 * len(pending)
+            )
+            record_api_result(True)
+            parsed = parse_batch_summaries(reply, len(pending))
+        except Exception as e:
+            if isinstance(e, requests.exceptions.RequestException):
+                record_api_result(False)
+            print(f"    ⚠️ Tóm tắt gộp thất bại ({str(e)[:80]}), chuyển sang tóm tắt từng bài")
+        
+        for number, i in enumerate(pending, 1):
+            title, content = items[i]
+            if number in parsed:
+                summaries[i] = parsed[number]
+                if cache is not None:
+                    cache.put(summary_cache_key(title, content, SUMMARY_BATCH_PROMPT), parsed[number])
+            else:
+                summaries[i] = summarize_with_deepseek(content, title)
+    
+    return summaries
+
+def summarize_many(items, executor=None):
+    """Tóm tắt danh sách bài (title, content) theo batch, giữ nguyên thứ tự"""
+    # Rút gọn trước khi chia batch để ước lượng token đúng với prompt thật
+    items = [
+        (title, prepare_summary_content(content, title) if content and len(content.strip()) >= 50 else content)
+        for title, content in items
+    ]
+    batches = plan_summary_batches(items)
+    batch_items = [[items[i] for i in batch] for batch in batches]
+    
+    if executor is not None:
+        batch_results = list(executor.map(summarize_batch_with_deepseek, batch_items))
+    else:
+        batch_results = [summarize_batch_with_deepseek(batch) for batch in batch_items]
+    
+    summaries = [None] * len(items)
+    for batch, results in zip(batches, batch_results):
+        for i, summary in zip(batch, results):
+            summaries[i] = summary
+    return summaries
+
+# Parser RSS/Atom dạng streaming: đọc dần, dừng khi đã đủ bài cần dùng
+FEED_PARSER = os.getenv("DIGEST_FEED_PARSER", "stream")  # stream | feedparser
+FEED_ROOT_TAGS = {"rss", "feed", "RDF"}
+FEED_ITEM_TAGS = {"item", "entry"}
+FEED_DATE_TAGS = {"pubDate", "published", "date"}  # RSS 2.0, Atom, Dublin Core (RSS 1.0)
+MEDIA_RSS_NS = "{http://search.yahoo.com/mrss/}"  # media:content, media:title... không phải nội dung bài
+
+class FeedEntry(dict):
+    """Entry nhẹ từ parser streaming, đọc được như feedparser (entry.title / entry.get("title"))"""
+    
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+def _local_name(tag):
+    """Tên thẻ bỏ namespace ("{http://www.w3.org/2005/Atom}entry" -> "entry")"""
+    return tag.rsplit("}", 1)[-1]
+
+def _set_entry_field(entry, name, element):
+    """Ghi một thẻ con trực tiếp của item/entry vào FeedEntry (giữ giá trị xuất hiện đầu tiên)"""
+    if element.tag.startswith(MEDIA_RSS_NS):
+        # Như feedparser: media:content/media:thumbnail -> media_content/media_thumbnail
+        # (danh sách thuộc tính url, type...), các thẻ media khác bỏ qua để
+        # không che title/description/content của bài
+        if name in ("content", "thumbnail"):
+            entry.setdefault(f"media_{name}", []).append(dict(element.attrib))
+        return
+    text = "".join(element.itertext()).strip()
+    if name == "link":
+        href = element.get("href")
+        if href is None:
+            entry.setdefault("link", text)
+        elif element.get("rel", "alternate") == "alternate":
+            entry.setdefault("link", href.strip())
+    elif name in ("guid", "id"):
+        entry.setdefault("id", text)
+    elif name == "title":
+        entry.setdefault("title", text)
+    elif name in FEED_DATE_TAGS:
+        entry.setdefault("published", text)
+    elif name in ("description", "summary"):
+        entry.setdefault(name, text)
+    elif name in ("encoded", "content"):  # content:encoded (RSS) hoặc content (Atom)
+        entry.setdefault("content", []).append({"value": text})
+
+def iter_feed_entries(chunks):
+    """Parse RSS/Atom từ các chunk bytes, yield từng FeedEntry ngay khi đọc xong thẻ item/entry
+    
+    Chỉ giữ các trường digest dùng (title, link, id, published, description/
+    summary/content). Ném ET.ParseError nếu XML lỗi hoặc không phải RSS/Atom.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    entry = None
+    depth = 0
+    root_checked = False
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            name = _local_name(element.tag)
+            if event == "start":
+                if not root_checked:
+                    if name not in FEED_ROOT_TAGS:
+                        raise ET.ParseError(f"không phải RSS/Atom: <{name}>")
+                    root_checked = True
+                if entry is not None:
+                    depth += 1
+                elif name in FEED_ITEM_TAGS:
+                    entry = FeedEntry()
+                    depth = 0
+                continue
+            
+            if entry is None:
+                continue
+            if depth == 0:
+                element.clear()  # Không giữ cây XML của các item đã đọc
+                yield entry
+                entry = None
+                continue
+            if depth == 1:
+                _set_entry_field(entry, name, element)
+            depth -= 1
+    parser.close()
+
+def parse_feed_stream(response, accept=None, limit=None, stats=None):
+    """Đọc body feed theo chunk và parse dần; trả về các entry đã đọc
+    
+    Dừng đọc (đóng kết nối) khi đã có `limit` entry thoả `accept` (None = mọi
+    entry). Feed lỗi XML (vd entity HTML như &nbsp;) hoặc không phải RSS/Atom
+    được tải nốt và parse lại bằng feedparser. Ghi parser, bytes và
+    stopped_early vào stats.
+    """
+    stats = stats if stats is not None else {}
+    chunks = []
+    
+    def read_chunks():
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            chunks.append(chunk)
+            yield chunk
+    
+    body = read_chunks()
+    entries = []
+    matched = 0
+    stats.update(parser="stream", stopped_early=False)
+    try:
+        for entry in iter_feed_entries(body):
+            entries.append(entry)
+            if accept is None or accept(entry):
+                matched += 1
+                if limit and matched >= limit:
+                    stats["stopped_early"] = True
+                    break
+    except ET.ParseError as e:
+        print(f"  ⚠️ Parser streaming lỗi ({str(e)[:80]}), dùng feedparser")
+        for _ in body:  # Tải nốt phần còn lại
+            pass
+        response_headers = {key.lower(): value for key, value in response.headers.items()}
+        response_headers.setdefault("content-location", response.url)
+        entries = feedparser.parse(b"".join(chunks), response_headers=response_headers).entries
+        stats["parser"] = "feedparser"
+    finally:
+        response.close()
+    
+    stats["bytes"] = sum(len(chunk) for chunk in chunks)
+    return entries
+
+def fetch_feed_entries(feed_url, accept=None, limit=None):
+    """Tải và parse RSS feed, trả về danh sách entries
+    
+    Dùng conditional GET (ETag / Last-Modified) theo trạng thái lần chạy trước;
+    trả về None nếu server báo feed không thay đổi (304). Với parser streaming,
+    dừng đọc feed khi đã có `limit` entry thoả `accept`; danh sách trả về gồm
+    mọi entry đã đọc tới lúc đó.
+    """
+    request_headers = {}
+    previous = get_feed_state(feed_url)
+    # Chế độ crawl dựng email từ chính các bài vừa tải, nên feed 304 sẽ làm mất
+    # cả chuyên mục; chỉ gửi header điều kiện khi bài cũ vẫn còn trong kho
+    if CONDITIONAL_GET and INCREMENTAL:
+        if previous.get("etag"):
+            request_headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            request_headers["If-Modified-Since"] = previous["last_modified"]
+    
+    health = get_host_health()
+    if not health.allow(feed_url):
+        print(f"  ⛔ {get_host(feed_url)} đang bị ngắt mạch, bỏ qua feed")
+        return []
+    
+    streaming = FEED_PARSER == "stream"
+    with telemetry.span("feed.fetch", url=feed_url, host=get_host(feed_url)) as span:
+        try:
+            with host_slot(feed_url):
+                response = http_get(feed_url, headers=request_headers, timeout=health.timeout_for(feed_url),
+                                    stream=streaming)
+        except requests.exceptions.RequestException:
+            health.record_failure(feed_url)
+            raise
+        span.update(status=response.status_code, retries=response.retries)
+        if not streaming:
+            span["bytes"] = len(response.content)
+    
+    # Đóng response ở mọi nhánh (304, lỗi HTTP, parse lỗi) để trả kết nối về pool
+    with response:
+        if is_host_failure_status(response.status_code):
+            health.record_failure(feed_url)
+        else:
+            health.record_success(feed_url, response.elapsed.total_seconds())
+        
+        if response.status_code == 304:
+            with _feed_state_lock:
+                _feed_state_updates[feed_url] = dict(previous, checked_at=datetime.now().isoformat(timespec="seconds"))
+            return None
+        
+        response.raise_for_status()
+        
+        with telemetry.span("feed.parse", url=feed_url) as span:
+            if streaming:
+                entries = parse_feed_stream(response, accept, limit, span)
+            else:
+                # feedparser chỉ parse nội dung đã tải, không tự mở kết nối riêng
+                response_headers = {key.lower(): value for key, value in response.headers.items()}
+                response_headers.setdefault("content-location", response.url)
+                entries = feedparser.parse(response.content, response_headers=response_headers).entries
+                span["parser"] = "feedparser"
+            span["entries"] = len(entries)
+    
+    if previous.get("entry_ids"):
+        known_ids = set(previous["entry_ids"])
+        new_count = sum(1 for entry in entries if (entry.get("id") or entry.get("link")) not in known_ids)
+        print(f"  🆕 {new_count}/{len(entries)} bài mới so với lần chạy trước")
+    
+    update_feed_state(feed_url, response, entries)
+    return entries
+
+# Khử trùng lặp bài viết giữa các feed
+TRACKING_PARAM_PREFIXES = ("utm_", "vn_", "fb_", "ga_")
+TRACKING_PARAMS = {"fbclid", "gclid", "zarsrc", "zaloapp", "gidzl", "ref", "referer", "source", "amp", "outputtype"}
+MOBILE_HOST_PREFIXES = ("www.", "m.", "amp.", "mobile.")
+MIN_TITLE_KEY_WORDS = 5  # Tiêu đề quá ngắn dễ trùng nhầm, không dùng để khử trùng lặp
+
+def canonicalize_url(url):
+    """Chuẩn hoá URL bài viết: bỏ tham số tracking, bản AMP/mobile và fragment"""
+    if not url:
+        return ""
+    
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme in ("http", "https"):
+        scheme = "https"
+    
+    host = (parts.hostname or "").lower()
+    for prefix in MOBILE_HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    
+    path = parts.path or "/"
+    if path.endswith("/amp") or path.endswith("/amp/"):
+        path = path[:path.rindex("/amp")] or "/"
+    if path.startswith("/amp/"):
+        path = path[len("/amp"):]
+    path = path.replace(".amp.", ".")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+def strip_diacritics(text):
+    """Bỏ dấu tiếng Việt (kể cả đ/Đ) để so khớp không phân biệt dấu"""
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d").replace("Đ", "D")
+
+def fold_text(text):
+    """Chuẩn hoá để so khớp: chữ thường, bỏ dấu, bỏ dấu câu và khoảng trắng thừa"""
+    text = strip_diacritics((text or "").lower())
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def accent_text(text):
+    """Như fold_text nhưng giữ dấu (NFC): dùng để kiểm tra từ khoá một âm tiết"""
+    text = unicodedata.normalize("NFC", (text or "").lower())
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def normalize_title(title):
+    """Chuẩn hoá tiêu đề để nhận ra bài trùng"""
+    return fold_text(title)
+
+class ArticleIndex:
+    """Chỉ mục trong bộ nhớ để nhận ra cùng một bài xuất hiện ở nhiều feed"""
+    
+    def __init__(self):
+        self._by_url = {}
+        self._by_title = {}
+        self.duplicates = 0
+    
+    def add(self, entry):
+        """Đăng ký một entry; trả về (key, is_new) với key là khoá của bản gốc"""
+        url_key = canonicalize_url(getattr(entry, 'link', ''))
+        title_key = normalize_title(getattr(entry, 'title', ''))
+        if len(title_key.split()) < MIN_TITLE_KEY_WORDS:
+            title_key = ""
+        
+        key = self._by_url.get(url_key) if url_key else None
+        if key is None and title_key:
+            key = self._by_title.get(title_key)
+        
+        is_new = key is None
+        if is_new:
+            key = url_key or title_key or f"entry-{id(entry)}"
+        else:
+            self.duplicates += 1
+        
+        if url_key:
+            self._by_url.setdefault(url_key, key)
+        if title_key:
+            self._by_title.setdefault(title_key, key)
+        return key, is_new
+
+# Lọc bài theo mức độ liên quan tới chủ đề trước khi tải trang
+RELEVANCE_MODE = os.getenv("DIGEST_RELEVANCE_MODE", "strict")  # strict | fill | off
+RELEVANCE_TITLE_WEIGHT = 3  # Khớp ở tiêu đề quan trọng hơn ở mô tả
+TOPIC_KEYWORDS = {
+    "PCCC": [
+        "PCCC", "phòng cháy", "chữa cháy", "cứu nạn cứu hộ", "CNCH", "hỏa hoạn", "hoả hoạn",
+        "vụ cháy", "đám cháy", "cháy nổ", "bốc cháy", "cháy lớn", "cháy nhà", "cháy rừng",
+        "cháy xưởng", "cháy chung cư", "thoát hiểm", "lính cứu hỏa", "cảnh sát PCCC",
+    ],
+    "LNG": [
+        "LNG", "khí hóa lỏng", "khí thiên nhiên", "điện khí", "nhiệt điện khí", "khí đốt",
+        "kho cảng", "PV Gas", "Thị Vải", "dầu khí", "năng lượng", "nhiệt điện", "Quy hoạch điện",
+    ],
+    "MRT": [
+        "MRT", "metro", "đường sắt đô thị", "tàu điện", "đường sắt trên cao", "ga ngầm",
+        "Bến Thành", "Suối Tiên", "Cát Linh", "ga Nhổn", "Nhổn - ga Hà Nội", "đường sắt tốc độ cao",
+    ],
+}
+# So khớp bỏ dấu chỉ an toàn với cụm nhiều âm tiết: một âm tiết có dấu dễ trùng
+# với từ khác sau khi bỏ dấu ("Nhổn" / "Quy Nhơn", "Nhơn Trạch"), nên từ khoá một
+# âm tiết có dấu phải khớp đúng dấu. Viết tắt/từ không dấu (LNG, PCCC, metro)
+# không bị ảnh hưởng vì bỏ dấu không làm chúng đổi.
+
+class KeywordMatcher:
+    """So khớp nhiều từ khoá cùng lúc (Aho-Corasick), không phân biệt dấu, theo ranh giới từ
+    
+    Từ khoá một âm tiết có dấu chỉ được nhận khi text có đúng dạng có dấu.
+    """
+    
+    def __init__(self, keywords_by_label):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        
+        added = set()
+        for label, keywords in keywords_by_label.items():
+            for keyword in keywords:
+                folded = fold_text(keyword)
+                exact = accent_text(keyword)
+                exact = exact if " " not in folded and exact != folded else None
+                # Bỏ các biến thể trùng nhau sau khi bỏ dấu (vd "hỏa hoạn" / "hoả hoạn")
+                if folded and (label, folded, exact) not in added:
+                    added.add((label, folded, exact))
+                    self._add(folded, (label, keyword, len(folded), exact))
+        self._build_failure_links()
+    
+    def _add(self, pattern, output):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(output)
+    
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+    
+    def find_folded(self, folded, accented=None):
+        """Tìm mọi từ khoá trong text đã fold; trả về danh sách (label, keyword)
+        
+        accented: text đã chuẩn hoá bằng accent_text, để kiểm tra các từ khoá
+        một âm tiết có dấu (không truyền thì các từ khoá đó không được nhận).
+        """
+        padded = f" {accented} " if accented is not None else None
+        matches = []
+        state = 0
+        length = len(folded)
+        for i, ch in enumerate(folded):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for label, keyword, size, exact in self._output[state]:
+                start = i - size + 1
+                # Chỉ nhận khi khớp trọn từ (tránh "metro" trong "metronome")
+                if (start == 0 or folded[start - 1] == " ") and (i + 1 == length or folded[i + 1] == " "):
+                    if exact is None or (padded is not None and f" {exact} " in padded):
+                        matches.append((label, keyword))
+        return matches
+    
+    def find(self, text):
+        return self.find_folded(fold_text(text), accent_text(text))
+
+_keyword_matcher = None
+_keyword_matcher_lock = threading.Lock()
+
+def get_keyword_matcher():
+    """Bộ so khớp từ khoá cho mọi chủ đề (dựng một lần)"""
+    global _keyword_matcher
+    with _keyword_matcher_lock:
+        if _keyword_matcher is None:
+            _keyword_matcher = KeywordMatcher(TOPIC_KEYWORDS)
+        return _keyword_matcher
+
+def score_entry(entry, topic):
+    """Điểm liên quan của entry với chủ đề và các từ khoá đã khớp"""
+    matcher = get_keyword_matcher()
+    title_matches = [kw for label, kw in matcher.find(getattr(entry, 'title', '')) if label == topic]
+    description_matches = [kw for label, kw in matcher.find(get_rss_description(entry)) if label == topic]
+    score = RELEVANCE_TITLE_WEIGHT * len(title_matches) + len(description_matches)
+    return score, sorted(set(title_matches + description_matches))
+
+def select_relevant_entries(entries, topic, max_articles, mode=None):
+    """Chấm điểm mọi entry theo từ khoá chủ đề, giữ top-k (theo thứ tự gốc trong feed)
+    
+    mode "strict" chỉ giữ entry có khớp; "fill" bù bằng các entry đầu feed nếu chưa đủ.
+    """
+    mode = mode or RELEVANCE_MODE
+    if mode == "off" or topic not in TOPIC_KEYWORDS:
+        return entries[:max_articles]
+    
+    scored = []
+    for position, entry in enumerate(entries):
+        score, keywords = score_entry(entry, topic)
+        entry["relevance_score"] = score
+        entry["matched_keywords"] = keywords
+        scored.append((score, position))
+    
+    ranked = sorted((item for item in scored if item[0] > 0), key=lambda item: (-item[0], item[1]))
+    chosen = {position for _, position in ranked[:max_articles]}
+    if mode == "fill":
+        for _, position in scored:
+            if len(chosen) >= max_articles:
+                break
+            chosen.add(position)
+    
+    return [entry for position, entry in enumerate(entries) if position in chosen]
+
+# Kho bài viết đã xử lý (cho chế độ chạy tăng dần)
+ARTICLE_STORE_FILE = os.path.join(STATE_DIR, "articles.sqlite")
+ARTICLE_STORE_RETENTION_DAYS = float(os.getenv("DIGEST_ARTICLE_RETENTION_DAYS", "30"))
+RUN_MODE = os.getenv("DIGEST_RUN_MODE", "crawl")  # crawl | poll | store
+INCREMENTAL = RUN_MODE in ("poll", "store")
+DIGEST_WINDOW_HOURS = float(os.getenv("DIGEST_WINDOW_HOURS", "24"))
+
+class ArticleStore:
+    """Kho SQLite các bài đã xử lý: URL chuẩn hoá, hash nội dung, tóm tắt, thời điểm"""
+    
+    def __init__(self, path, retention_days=ARTICLE_STORE_RETENTION_DAYS):
+        self.path = path
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " canonical_url TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL,"
+            " link TEXT NOT NULL,"
+            " published TEXT,"
+            " summary TEXT NOT NULL,"
+            " summary_ok INTEGER NOT NULL,"
+            " content_hash TEXT,"
+            " content_length INTEGER,"
+            " first_seen REAL NOT NULL,"
+            " last_seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS article_topics ("
+            " canonical_url TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " PRIMARY KEY (canonical_url, topic));"
+            "CREATE INDEX IF NOT EXISTS articles_first_seen ON articles (first_seen);"
+        )
+        self._conn.commit()
+        self.prune()
+    
+    def seen_urls(self, canonical_urls):
+        """Các URL đã được xử lý thành công (tóm tắt không lỗi)"""
+        canonical_urls = [url for url in canonical_urls if url]
+        if not canonical_urls:
+            return set()
+        placeholders = ", ".join("?" * len(canonical_urls))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT canonical_url FROM articles WHERE summary_ok = 1 AND canonical_url IN ({placeholders})",
+                canonical_urls
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def save(self, canonical_url, article_info, topics):
+        """Lưu (hoặc cập nhật) một bài đã xử lý cùng các chủ đề của nó"""
+        if not canonical_url:
+            return
+        now = time.time()
+        summary = article_info["summary"]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO articles (canonical_url, title, link, published, summary, summary_ok,"
+                " content_hash, content_length, first_seen, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(canonical_url) DO UPDATE SET"
+                " title = excluded.title, link = excluded.link, published = excluded.published,"
+                " summary = excluded.summary, summary_ok = excluded.summary_ok,"
+                " content_hash = excluded.content_hash, content_length = excluded.content_length,"
+                " last_seen = excluded.last_seen",
+                (canonical_url, article_info["title"], article_info["link"], article_info["published"],
+                 summary, int(not summary.startswith("⚠️")), article_info.get("content_hash"),
+                 article_info["content_length"], now, now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO article_topics (canonical_url, topic) VALUES (?, ?)",
+                [(canonical_url, topic) for topic in topics]
+            )
+            self._conn.commit()
+    
+    def load_digest(self, since, topics):
+        """Dựng news_data (theo thứ tự chủ đề) từ các bài lần đầu thấy sau thời điểm since"""
+        news_data = {topic: [] for topic in topics}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.topic, a.title, a.link, a.summary, a.published, a.content_length"
+                " FROM articles a JOIN article_topics t ON t.canonical_url = a.canonical_url"
+                " WHERE a.first_seen >= ? ORDER BY a.first_seen, a.rowid",
+                (since,)
+            ).fetchall()
+        
+        for topic, title, link, summary, published, content_length in rows:
+            if topic in news_data:
+                news_data[topic].append({
+                    "title": title,
+                    "link": link,
+                    "summary": summary,
+                    "published": published or "",
+                    "content_length": content_length or 0
+                })
+        return news_data
+    
+    def prune(self):
+        """Xoá các bài cũ hơn thời gian lưu giữ"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM article_topics WHERE canonical_url IN"
+                " (SELECT canonical_url FROM articles WHERE last_seen < ?)", (cutoff,)
+            )
+            self._conn.execute("DELETE FROM articles WHERE last_seen < ?", (cutoff,))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_article_store = None
+_article_store_lock = threading.Lock()
+
+def get_article_store():
+    """Lấy kho bài viết dùng chung (None nếu không mở được)"""
+    global _article_store
+    with _article_store_lock:
+        if _article_store is None:
+            try:
+                _article_store = ArticleStore(ARTICLE_STORE_FILE)
+            except (OSError, sqlite3.Error) as e:
+                print(f"⚠️ Không mở được kho bài viết: {e}")
+                return None
+        return _article_store
+
+def prepare_entry(entry, index, total):
+    """Lấy nội dung của một bài viết (full text, nếu không được thì RSS description)
+    
+    Trả về (nội dung, thống kê tải trang).
+    """
+    print(f"\n    📄 [{index}/{total}] {entry.get('title', '')[:60]}...")
+    
+    # Lấy nội dung full từ link
+    full_content = ""
+    fetch_stats = {}
+    started = time.perf_counter()
+    if hasattr(entry, 'link') and entry.link:
+        full_content = fetch_article_content(entry.link, stats=fetch_stats)
+    fetch_stats["duration"] = round(time.perf_counter() - started, 4)
+    
+    return with_rss_fallback(entry, full_content, fetch_stats), fetch_stats
+
+def prepare_entry_safely(entry, index, total):
+    """prepare_entry nhưng lỗi bất ngờ của một bài chỉ làm mất bài đó (trả về nội dung rỗng)"""
+    try:
+        return prepare_entry(entry, index, total)
+    except Exception as e:
+        print(f"    ❌ Lỗi xử lý bài {index}: {e}")
+        return "", {"error": type(e).__name__, "content_source": "none"}
+
+def with_rss_fallback(entry, full_content, fetch_stats):
+    """Nội dung bài; nếu không lấy được full content thì dùng description từ RSS"""
+    fetch_stats["content_source"] = "page" if full_content else "rss"
+    if not full_content:
+        full_content = get_rss_description(entry)
+        print(f"    📝 Sử dụng RSS description: {len(full_content)} ký tự")
+    
+    if not full_content:
+        fetch_stats["content_source"] = "none"
+        print(f"    ❌ Không có nội dung")
+    
+    return full_content
+
+def record_article_telemetry(entry, fetch_stats, summary=None, summary_latency=None):
+    """Ghi bản ghi thời gian/byte của một bài viết vào báo cáo lần chạy"""
+    link = getattr(entry, 'link', '')
+    telemetry.record_article(
+        url=link,
+        host=get_host(link),
+        status=fetch_stats.get("status"),
+        error=fetch_stats.get("error"),
+        bytes=fetch_stats.get("bytes_downloaded", 0),
+        bytes_used=fetch_stats.get("bytes_used", 0),
+        content_source=fetch_stats.get("content_source"),
+        extraction=fetch_stats.get("extraction"),
+        charset=fetch_stats.get("charset"),
+        charset_method=fetch_stats.get("charset_method"),
+        duration=fetch_stats.get("duration"),
+        retries=fetch_stats.get("retries", 0),
+        summary_latency=summary_latency,
+        summary_ok=None if summary is None else not summary.startswith("⚠️"),
+    )
+
+def build_article_info(entry, full_content, summary, fetch_stats=None):
+    """Tạo bản ghi bài viết cho email"""
+    fetch_stats = fetch_stats or {}
+    return {
+        "title": getattr(entry, 'title', 'Không có tiêu đề'),
+        "link": getattr(entry, 'link', ''),
+        "summary": summary,
+        "published": getattr(entry, 'published', '') or fetch_stats.get("page_published", ''),
+        "content_length": len(full_content),
+        "content_hash": hashlib.sha256(full_content.encode('utf-8')).hexdigest(),
+        "relevance_score": entry.get("relevance_score"),
+        "matched_keywords": entry.get("matched_keywords", []),
+        "bytes_downloaded": fetch_stats.get("bytes_downloaded", 0),
+        "bytes_used": fetch_stats.get("bytes_used", 0)
+    }
+
+def process_entry(entry, index, total):
+    """Lấy nội dung và tóm tắt một bài viết trong RSS feed (None nếu không có nội dung hoặc lỗi)"""
+    full_content, fetch_stats = prepare_entry_safely(entry, index, total)
+    if not full_content:
+        record_article_telemetry(entry, fetch_stats)
+        return None
+    
+    try:
+        # Tóm tắt bằng AI
+        print(f"    🤖 Đang tóm tắt...")
+        started = time.perf_counter()
+        summary = summarize_with_deepseek(full_content, entry.get('title', ''))
+        record_article_telemetry(entry, fetch_stats, summary, round(time.perf_counter() - started, 4))
+        
+        # Lưu thông tin bài viết
+        article_info = build_article_info(entry, full_content, summary, fetch_stats)
+    except Exception as e:
+        # Một bài lỗi chỉ làm mất bài đó, không làm hỏng cả bản tin
+        print(f"    ❌ Lỗi xử lý bài {index}: {e}")
+        return None
+    
+    print(f"    ✅ Hoàn thành bài {index}")
+    return article_info
+
+def select_feed_entries(feed_url, max_articles=3, topic=None):
+    """Tải một RSS feed và chọn các entry sẽ được xử lý"""
+    try:
+        print(f"  📡 Đang xử lý: {feed_url}")
+        
+        # Chạy tăng dần: bỏ các bài đã xử lý ở những lần trước
+        store = get_article_store() if INCREMENTAL else None
+        
+        def is_candidate(entry):
+            """Entry có thể được chọn: chưa xử lý và (nếu có lọc) khớp từ khoá chủ đề"""
+            if store is not None and store.seen_urls([canonicalize_url(getattr(entry, 'link', ''))]):
+                return False
+            if RELEVANCE_MODE == "off" or topic not in TOPIC_KEYWORDS:
+                return True
+            return score_entry(entry, topic)[0] > 0
+        
+        # Parse RSS (parser streaming dừng khi đã đủ max_articles bài có thể chọn)
+        entries = fetch_feed_entries(feed_url, accept=is_candidate, limit=max_articles)
+        
+        if entries is None:
+            print(f"  ♻️ Feed không thay đổi kể từ lần chạy trước (304), bỏ qua")
+            return []
+        
+        if not entries:
+            print(f"  ❌ Không có bài viết nào")
+            return []
+        
+        if store is not None:
+            seen = store.seen_urls([canonicalize_url(getattr(entry, 'link', '')) for entry in entries])
+            if seen:
+                entries = [entry for entry in entries if canonicalize_url(getattr(entry, 'link', '')) not in seen]
+                print(f"  ⏭️ Bỏ qua {len(seen)} bài đã xử lý ở lần chạy trước")
+            if not entries:
+                print(f"  ✅ Không có bài mới")
+                return []
+        
+        selected = select_relevant_entries(entries, topic, max_articles)
+        print(f"  📰 Tìm thấy {len(entries)} bài viết, xử lý {len(selected)} bài")
+        return selected
+        
+    except Exception as e:
+        print(f"  ❌ Lỗi xử lý feed: {e}")
+        return []
+
+def process_entries(entries, executor=None):
+    """Xử lý danh sách entries, trả về kết quả (article_info hoặc None) theo đúng thứ tự
+    
+    Nếu truyền executor, các bài viết được xử lý song song trên executor đó.
+    Khi DIGEST_SUMMARY_BATCH_SIZE > 1, lấy nội dung tất cả bài trước rồi tóm
+    tắt gộp theo batch.
+    """
+    total = len(entries)
+    if SUMMARY_BATCH_SIZE > 1:
+        return process_entries_batched(entries, executor)
+    
+    if executor is not None:
+        futures = [
+            executor.submit(process_entry, entry, i + 1, total)
+            for i, entry in enumerate(entries)
+        ]
+        return [future.result() for future in futures]
+    
+    results = []
+    for i, entry in enumerate(entries):
+        article_info = process_entry(entry, i + 1, total)
+        results.append(article_info)
+    return results
+
+def process_entries_batched(entries, executor=None):
+    """Lấy nội dung mọi bài rồi tóm tắt gộp theo batch"""
+    total = len(entries)
+    if executor is not None:
+        futures = [
+            executor.submit(prepare_entry_safely, entry, i + 1, total)
+            for i, entry in enumerate(entries)
+        ]
+        prepared = [future.result() for future in futures]
+    else:
+        prepared = [prepare_entry_safely(entry, i + 1, total) for i, entry in enumerate(entries)]
+    
+    ready = [(entry, content, fetch_stats) for entry, (content, fetch_stats) in zip(entries, prepared) if content]
+    summaries = summarize_many(
+        [(getattr(entry, 'title', ''), content) for entry, content, _ in ready],
+        executor
+    )
+    
+    # Tóm tắt gộp không có độ trễ riêng từng bài; xem span summary.request
+    summaries_by_entry = {id(entry): summary for (entry, _, _), summary in zip(ready, summaries)}
+    for entry, (content, fetch_stats) in zip(entries, prepared):
+        record_article_telemetry(entry, fetch_stats, summaries_by_entry.get(id(entry)))
+    articles_by_entry = {
+        id(entry): build_article_info(entry, content, summary, fetch_stats)
+        for (entry, content, fetch_stats), summary in zip(ready, summaries)
+    }
+    return [articles_by_entry.get(id(entry)) for entry in entries]
+
+def process_rss_feed(feed_url, topic, max_articles=3, executor=None):
+    """Xử lý một RSS feed"""
+    entries = select_feed_entries(feed_url, max_articles, topic)
+    return [article for article in process_entries(entries, executor) if article]
+
+# Pipeline producer/consumer: các bước chạy chồng lên nhau qua queue có giới hạn
+PIPELINE_MODE = os.getenv("DIGEST_PIPELINE", "0") == "1"
+PIPELINE_QUEUE_SIZE = int(os.getenv("DIGEST_PIPELINE_QUEUE_SIZE", "16"))  # Số bài tối đa chờ ở mỗi queue
+PIPELINE_WORKERS = os.getenv("DIGEST_PIPELINE_WORKERS", "")  # Vd: "discovery=4,fetch=8,extract=2,summarize=4"
+EXTRACT_PROCESSES = int(os.getenv("DIGEST_EXTRACT_PROCESSES", "0"))  # > 0: trích xuất HTML trong process pool
+PIPELINE_BATCH_WAIT = 0.5  # Giây chờ thêm bài để gom đủ batch tóm tắt
+PIPELINE_STAGES = ("discovery", "fetch", "extract", "summarize")
+_PIPELINE_DONE = object()
+
+def parse_pipeline_workers(spec):
+    """Đọc cấu hình "bước=số worker,..." và bổ sung giá trị mặc định"""
+    workers = {"discovery": MAX_WORKERS, "fetch": MAX_WORKERS, "extract": 2, "summarize": MAX_WORKERS}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        stage, count = item.split("=", 1)
+        try:
+            if stage.strip() not in workers:
+                raise ValueError(stage)
+            workers[stage.strip()] = max(1, int(count))
+        except ValueError:
+            print(f"⚠️ Bỏ qua cấu hình worker không hợp lệ: {item}")
+    return workers
+
+def _extract_in_process(html_text, url):
+    """Chạy trong process con: trả về cả stats vì dict không được chia sẻ giữa các process"""
+    stats = {}
+    return extract_article_text(html_text, url, stats), stats
+
+class ArticlePipeline:
+    """Tải feed -> tải trang -> trích xuất -> tóm tắt, mỗi bước một nhóm worker
+    
+    Các bước nối với nhau bằng queue có giới hạn nên việc mạng (tải trang, gọi
+    API) và việc CPU (trích xuất) chạy chồng lên nhau, còn số bài nằm trong bộ
+    nhớ không vượt quá tổng kích thước các queue. Bài trùng lặp được loại ngay
+    khi feed vừa tải xong; gom theo chủ đề vẫn làm ở collect_all_news.
+    """
+    
+    def __init__(self, feed_jobs, max_articles=3, workers=None, queue_size=None, extract_processes=None):
+        self.feed_jobs = feed_jobs
+        self.max_articles = max_articles
+        self.workers = workers or parse_pipeline_workers(PIPELINE_WORKERS)
+        self.queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.extract_processes = EXTRACT_PROCESSES if extract_processes is None else extract_processes
+        
+        self.index = ArticleIndex()
+        self.feed_keys = [[] for _ in feed_jobs]
+        self.unique_entries = []
+        self.unique_keys = []
+        self.articles_by_key = {}
+        self._lock = threading.Lock()
+        self._process_pool = None
+    
+    def run(self):
+        """Chạy hết pipeline; trả về giống collect_in_stages"""
+        inboxes = {"discovery": queue.Queue()}
+        for stage in PIPELINE_STAGES[1:]:
+            inboxes[stage] = queue.Queue(maxsize=self.queue_size)
+        handlers = {"discovery": self._discover, "fetch": self._fetch,
+                    "extract": self._extract, "summarize": self._summarize}
+        outboxes = dict(zip(PIPELINE_STAGES, [inboxes[stage] for stage in PIPELINE_STAGES[1:]] + [None]))
+        
+        print(f"⚡ Pipeline: " + ", ".join(f"{stage} x{self.workers[stage]}" for stage in PIPELINE_STAGES)
+              + f", queue {self.queue_size}" + (f", trích xuất trên {self.extract_processes} process" if self.extract_processes else ""))
+        
+        if self.extract_processes > 0:
+            # spawn: không fork process đang có nhiều luồng
+            self._process_pool = ProcessPoolExecutor(self.extract_processes, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            with telemetry.span("stage.pipeline", feeds=len(self.feed_jobs)) as span:
+                threads = {
+                    stage: [
+                        threading.Thread(target=self._work, args=(stage, inboxes[stage], handlers[stage], outboxes[stage]),
+                                         name=f"pipeline-{stage}-{i}", daemon=True)
+                        for i in range(self.workers[stage])
+                    ]
+                    for stage in PIPELINE_STAGES
+                }
+                for stage_threads in threads.values():
+                    for thread in stage_threads:
+                        thread.start()
+                
+                for i, (topic, feed_url) in enumerate(self.feed_jobs):
+                    inboxes["discovery"].put((i, topic, feed_url))
+                
+                # Bước trước xong hẳn mới báo kết thúc cho bước sau
+                for stage in PIPELINE_STAGES:
+                    for _ in threads[stage]:
+                        inboxes[stage].put(_PIPELINE_DONE)
+                    for thread in threads[stage]:
+                        thread.join()
+                span.update(unique=len(self.unique_entries), duplicates=self.index.duplicates)
+        finally:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+        
+        if self.index.duplicates:
+            print(f"\n🔁 Bỏ qua {self.index.duplicates} bài trùng lặp giữa các feed (mỗi bài chỉ xử lý một lần)")
+        return self.feed_keys, self.unique_entries, self.unique_keys, self.articles_by_key
+    
+    def _work(self, stage, inbox, handler, outbox):
+        while True:
+            item = inbox.get()
+            if item is _PIPELINE_DONE:
+                return
+            try:
+                handler(item, outbox, inbox)
+            except Exception as e:
+                print(f"  ❌ Lỗi ở bước {stage}: {e}")
+    
+    def _discover(self, job, outbox, inbox):
+        i, topic, feed_url = job
+        entries = select_feed_entries(feed_url, self.max_articles, topic)
+        keys = []
+        for entry in entries:
+            with self._lock:
+                key, is_new = self.index.add(entry)
+                if is_new:
+                    self.unique_entries.append(entry)
+                    self.unique_keys.append(key)
+                    number = len(self.unique_keys)
+            keys.append(key)
+            if is_new:
+                outbox.put((key, entry, number))  # Chặn khi bước sau đang đầy
+        self.feed_keys[i] = keys
+    
+    def _fetch(self, item, outbox, inbox):
+        key, entry, number = item
+        print(f"\n    📄 [{number}] {getattr(entry, 'title', '')[:60]}...")
+        fetch_stats = {}
+        html_text = ""
+        started = time.perf_counter()
+        if getattr(entry, 'link', ''):
+            html_text = download_article(entry.link, stats=fetch_stats)
+        fetch_stats["duration"] = round(time.perf_counter() - started, 4)
+        outbox.put((key, entry, html_text, fetch_stats))
+    
+    def _extract(self, item, outbox, inbox):
+        key, entry, html_text, fetch_stats = item
+        content = ""
+        if html_text and self._process_pool is not None:
+            url = entry.link
+            with telemetry.span("article.extract", url=url, process=True) as span:
+                content, child_stats = self._process_pool.submit(_extract_in_process, html_text, url).result()
+                span.update(chars=len(content), extraction=child_stats.get("extraction"))
+            fetch_stats.update(child_stats)
+            _record_rule_result(get_site_rule(url), child_stats.get("extraction") == "site_rule")
+        elif html_text:
+            content = extract_article_text(html_text, entry.link, fetch_stats)
+        
+        content = with_rss_fallback(entry, content, fetch_stats)
+        if content:
+            outbox.put((key, entry, content, fetch_stats))
+        else:
+            record_article_telemetry(entry, fetch_stats)
+    
+    def _summarize(self, item, outbox, inbox):
+        if SUMMARY_BATCH_SIZE <= 1:
+            key, entry, content, fetch_stats = item
+            started = time.perf_counter()
+            summary = summarize_with_deepseek(content, getattr(entry, 'title', ''))
+            record_article_telemetry(entry, fetch_stats, summary, round(time.perf_counter() - started, 4))
+            self._store(key, build_article_info(entry, content, summary, fetch_stats))
+            return
+        
+        # Gom thêm bài trong queue thành một batch, chờ tối đa PIPELINE_BATCH_WAIT giây
+        items = [item]
+        deadline = time.monotonic() + PIPELINE_BATCH_WAIT
+        while len(items) < SUMMARY_BATCH_SIZE:
+            try:
+                extra = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if extra is _PIPELINE_DONE:
+                inbox.put(extra)
+                break
+            items.append(extra)
+        
+        summaries = summarize_many([(getattr(entry, 'title', ''), content) for _, entry, content, _ in items])
+        for (key, entry, content, fetch_stats), summary in zip(items, summaries):
+            record_article_telemetry(entry, fetch_stats, summary)
+            self._store(key, build_article_info(entry, content, summary, fetch_stats))
+    
+    def _store(self, key, article_info):
+        with self._lock:
+            self.articles_by_key[key] = article_info
+
+def collect_in_stages(feed_jobs, max_articles=3):
+    """Tải hết các feed, khử trùng lặp, rồi mới lấy nội dung và tóm tắt các bài
+    
+    Trả về (khoá bài theo từng feed, các entry không trùng, khoá của chúng,
+    article_info theo khoá).
+    """
+    # Bước 1: Tải các feed
+    with telemetry.span("stage.feeds", feeds=len(feed_jobs)):
+        if CONCURRENT_MODE:
+            print(f"⚡ Chế độ song song: {MAX_WORKERS} luồng, tối đa {PER_HOST_LIMIT} request/host")
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(feed_jobs)))) as feed_pool:
+                feed_entries = list(feed_pool.map(
+                    lambda job: select_feed_entries(job[1], max_articles, job[0]), feed_jobs
+                ))
+        else:
+            feed_entries = []
+            for topic, feed_url in feed_jobs:
+                feed_entries.append(select_feed_entries(feed_url, max_articles, topic))
+    
+    # Bước 2: Khử trùng lặp giữa các feed trước khi tải bài
+    with telemetry.span("stage.dedup") as span:
+        index = ArticleIndex()
+        unique_entries = []
+        unique_keys = []
+        feed_keys = []
+        for entries in feed_entries:
+            keys = []
+            for entry in entries:
+                key, is_new = index.add(entry)
+                if is_new:
+                    unique_entries.append(entry)
+                    unique_keys.append(key)
+                keys.append(key)
+            feed_keys.append(keys)
+        span.update(unique=len(unique_entries), duplicates=index.duplicates)
+    
+    if index.duplicates:
+        print(f"\n🔁 Bỏ qua {index.duplicates} bài trùng lặp giữa các feed (mỗi bài chỉ xử lý một lần)")
+    
+    # Bước 3: Lấy nội dung và tóm tắt
+    with telemetry.span("stage.articles", articles=len(unique_entries)):
+        if CONCURRENT_MODE:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as article_pool:
+                results = process_entries(unique_entries, article_pool)
+        else:
+            results = process_entries(unique_entries)
+    articles_by_key = dict(zip(unique_keys, results))
+    return feed_keys, unique_entries, unique_keys, articles_by_key
+
+def collect_all_news(max_articles=3):
+    """Thu thập tin tức từ tất cả RSS feeds
+    
+    Các bước: tải feeds -> khử trùng lặp giữa các feed -> lấy nội dung và
+    tóm tắt mỗi bài một lần -> gom kết quả theo chủ đề, giữ thứ tự RSS_FEEDS.
+    Với DIGEST_PIPELINE=1 các bước chạy chồng lên nhau (ArticlePipeline).
+    """
+    all_news = {topic: [] for topic in RSS_FEEDS}
+    feed_jobs = [(topic, feed_url) for topic, feed_urls in RSS_FEEDS.items() for feed_url in feed_urls]
+    
+    print(f"\n🔄 Bắt đầu thu thập tin tức từ {len(RSS_FEEDS)} chủ đề...")
+    
+    if PIPELINE_MODE:
+        feed_keys, unique_entries, unique_keys, articles_by_key = ArticlePipeline(feed_jobs, max_articles).run()
+    else:
+        feed_keys, unique_entries, unique_keys, articles_by_key = collect_in_stages(feed_jobs, max_articles)
+    
+    # Bước 4: Gom kết quả theo chủ đề (bài trùng được gán cho mọi chủ đề chứa nó)
+    added_keys = {topic: set() for topic in RSS_FEEDS}
+    for (topic, feed_url), keys in zip(feed_jobs, feed_keys):
+        for key in keys:
+            article_info = articles_by_key.get(key)
+            if not article_info or key in added_keys[topic]:
+                continue
+            added_keys[topic].add(key)
+            article_info.setdefault("topics", [])
+            if topic not in article_info["topics"]:
+                article_info["topics"].append(topic)
+            all_news[topic].append(article_info)
+    
+    # Ghi các bài vừa xử lý vào kho để lần chạy sau bỏ qua (chỉ ở chế độ poll/store)
+    store = get_article_store() if INCREMENTAL else None
+    if store is not None:
+        with telemetry.span("stage.store"):
+            for entry, key in zip(unique_entries, unique_keys):
+                article_info = articles_by_key.get(key)
+                if article_info:
+                    store.save(canonicalize_url(article_info["link"]), article_info, article_info.get("topics", []))
+    
+    total_articles = 0
+    for topic, articles in all_news.items():
+        print(f"  📊 Tổng {topic}: {len(articles)} bài")
+        total_articles += len(articles)
+    
+    print(f"\n📈 TỔNG KẾT: {total_articles} bài viết từ {len(RSS_FEEDS)} chuyên mục")
+    open_hosts = get_host_health().open_hosts()
+    if open_hosts:
+        print(f"⛔ Host bị ngắt mạch (thử lại ở lần chạy sau): {', '.join(open_hosts)}")
+    save_host_health()
+    return all_news
+
+# Dựng email: phần chung dùng template str.format dựng sẵn, từng bài ghép các đoạn vào list rồi join một lần
+EMAIL_HTML = os.getenv("DIGEST_EMAIL_HTML", "1") != "0"  # Gửi kèm bản HTML (multipart/alternative)
+EMAIL_CSS = {
+    "body": "margin:0;padding:0;background:#f4f5f7;",
+    "container": "max-width:720px;margin:0 auto;padding:24px;background:#ffffff;"
+                 "font-family:Arial,Helvetica,sans-serif;color:#222222;line-height:1.5;",
+    "heading": "margin:0 0 4px;font-size:22px;",
+    "meta": "margin:0 0 16px;color:#666666;font-size:13px;",
+    "topic": "margin:24px 0 8px;padding-bottom:4px;border-bottom:2px solid #d0342c;font-size:18px;",
+    "count": "color:#666666;font-weight:normal;font-size:14px;",
+    "articles": "margin:0;padding-left:20px;",
+    "article": "margin:0 0 14px;",
+    "title": "color:#1a0dab;font-weight:bold;text-decoration:none;",
+    "published": "color:#666666;font-size:12px;",
+    "summary": "margin:4px 0;",
+    "length": "color:#999999;font-size:12px;",
+    "footer": "margin-top:24px;padding-top:8px;border-top:1px solid #dddddd;color:#999999;font-size:12px;",
+}
+CSS_CLASS_RE = re.compile(r'class="([\w-]+)"')
+
+def inline_css(source, styles=EMAIL_CSS):
+    """Thay class="x" bằng style="..." tương ứng (nhiều trình đọc email bỏ thẻ <style>)"""
+    return CSS_CLASS_RE.sub(lambda match: f'style="{styles[match.group(1)]}"', source)
+
+def _compile_email_templates():
+    """Dựng sẵn template str.format cho phần đầu, chuyên mục, phần cuối email và các đoạn markup của một bài
+    
+    Mọi markup HTML đi qua inline_css một lần ở đây. Giá trị đưa vào bản
+    HTML được escape tường minh ở nơi dùng (escape_email_field, html.escape).
+    """
+    text = {
+        "header": "📰 BẢN TIN TỰ ĐỘNG HÀNG NGÀY\n📅 Ngày: {date}\n⏰ Tạo lúc: {time}\n"
+                  "📊 Tổng số: {total} tin tức\n" + "=" * 60 + "\n\n",
+        "section": "\n🏷️  {topic} ({count} tin)\n" + "─" * 50 + "\n\n",
+        "section_end": "",
+        "footer": "\n" + "=" * 60 + "\n🤖 Hệ thống Daily Digest tự động\n"
+                  "🔄 Lần chạy tiếp theo: Ngày mai 08:00\n⚙️ Phiên bản: 2.0 (No newspaper3k)\n",
+    }
+    html_sources = {
+        "header": '<!DOCTYPE html><html lang="vi"><head><meta charset="utf-8"><title>{subject}</title></head>'
+                  '<body class="body"><div class="container"><h1 class="heading">📰 Bản tin tự động hàng ngày</h1>'
+                  '<p class="meta">📅 Ngày: {date} · ⏰ Tạo lúc: {time} · 📊 Tổng số: {total} tin tức</p>',
+        "section": '<h2 class="topic">🏷️ {topic} <span class="count">({count} tin)</span></h2><ol class="articles">',
+        "section_end": '</ol>',
+        "footer": '<p class="footer">🤖 Hệ thống Daily Digest tự động<br>🔄 Lần chạy tiếp theo: Ngày mai 08:00<br>'
+                  '⚙️ Phiên bản: 2.0 (No newspaper3k)</p></div></body></html>',
+    }
+    # Các đoạn markup ghép quanh giá trị của một bài (không dùng format để dựng nhanh hàng nghìn bài)
+    article_sources = {
+        "link": '<li class="article"><a class="title" href="',
+        "link_title": '">',
+        "link_end": '</a>',
+        "title": '<li class="article"><span class="title">',
+        "title_end": '</span>',
+        "published": '<div class="published">📅 ',
+        "published_end": '</div>',
+        "summary": '<p class="summary">',
+        "length": '</p><div class="length">📏 ',
+        "end": ' ký tự</div></li>',
+    }
+    html_templates = {name: inline_css(source) for name, source in html_sources.items()}
+    html_templates["article"] = {name: inline_css(source) for name, source in article_sources.items()}
+    return {"text": text, "html": html_templates}
+
+EMAIL_TEMPLATES = _compile_email_templates()
+ARTICLE_SEPARATOR = "\n" + "·" * 40 + "\n\n"
+
+def escape_email_field(value, fmt):
+    """Giá trị trường đưa vào template: escape HTML với bản html, giữ nguyên với bản text"""
+    return html.escape(str(value)) if fmt == "html" else value
+
+def render_articles_text(parts, articles):
+    """Thêm các bài của một chuyên mục (bản text) vào list parts"""
+    extend = parts.extend
+    for number, article in enumerate(articles, 1):
+        extend((str(number), ". ", article['title'], "\n"))
+        if article['link']:
+            extend(("🔗 ", article['link'], "\n"))
+        if article['published']:
+            extend(("📅 ", article['published'], "\n"))
+        extend(("📝 Tóm tắt: ", article['summary'], "\n📏 Độ dài: ", str(article['content_length']),
+                " ký tự\n", ARTICLE_SEPARATOR))
+
+def render_articles_html(parts, articles):
+    """Thêm các bài của một chuyên mục (bản HTML) vào list parts; mọi giá trị lấy từ feed đều được escape"""
+    markup = EMAIL_TEMPLATES["html"]["article"]
+    escape = html.escape
+    extend = parts.extend
+    for article in articles:
+        title = escape(article['title'])
+        link = article['link']
+        if link and link.startswith(("http://", "https://")):  # Không đặt href javascript:/data: lấy từ feed
+            extend((markup["link"], escape(link), markup["link_title"], title, markup["link_end"]))
+        else:
+            extend((markup["title"], title, markup["title_end"]))
+        if article['published']:
+            extend((markup["published"], escape(article['published']), markup["published_end"]))
+        extend((markup["summary"], escape(article['summary']), markup["length"],
+                str(article['content_length']), markup["end"]))
+
+def render_topic_section(topic, articles, fmt="text"):
+    """Các đoạn nội dung của một chuyên mục (dùng lại cho mọi người nhận); fmt: text hoặc html
+    
+    Trả về list chưa join: render_email ghép mọi chuyên mục rồi join một lần,
+    tránh dựng thêm một chuỗi lớn cho từng chuyên mục.
+    """
+    templates = EMAIL_TEMPLATES[fmt]
+    parts = [templates["section"].format(topic=escape_email_field(topic, fmt), count=len(articles))]
+    (render_articles_html if fmt == "html" else render_articles_text)(parts, articles)
+    parts.append(templates["section_end"])
+    return parts
+
+def render_email(news_data, sections=None, with_html=EMAIL_HTML):
+    """Dựng email; trả về (subject, body text, body HTML hoặc None nếu with_html=False)
+    
+    sections: dict (fmt, chủ đề) -> các đoạn đã dựng sẵn (render_topic_section);
+    chủ đề chưa có được dựng rồi lưu lại để các email sau dùng lại.
+    """
+    sections = sections if sections is not None else {}
+    today = datetime.now()
+    total_count = sum(len(articles) for articles in news_data.values())
+    fields = {
+        "date": today.strftime("%Y-%m-%d"),
+        "time": today.strftime("%H:%M:%S"),
+        "total": total_count,
+    }
+    fields["subject"] = f"[BẢN TIN] {'·'.join(news_data)} — {fields['date']} ({total_count} tin)"
+    
+    bodies = []
+    for fmt in ("text", "html") if with_html else ("text",):
+        templates = EMAIL_TEMPLATES[fmt]
+        header_fields = {name: escape_email_field(value, fmt) for name, value in fields.items()}
+        out = [templates["header"].format_map(header_fields)]
+        for topic, articles in news_data.items():
+            if not articles:
+                continue
+            if (fmt, topic) not in sections:
+                sections[fmt, topic] = render_topic_section(topic, articles, fmt)
+            out.extend(sections[fmt, topic])
+        out.append(templates["footer"])
+        bodies.append("".join(out))
+    
+    return fields["subject"], bodies[0], bodies[1] if with_html else None
+
+def generate_email_content(news_data, sections=None):
+    """Tạo nội dung email dạng text; trả về (subject, body)"""
+    subject, body, _ = render_email(news_data, sections, with_html=False)
+    return subject, body
+
+# Gửi bản tin cho nhiều người nhận theo chủ đề đăng ký
+SUBSCRIBERS_FILE = os.getenv("DIGEST_SUBSCRIBERS", "")  # File JSON danh sách người nhận; rỗng = chỉ gửi EMAIL_TO
+SMTP_SEND_ATTEMPTS = 2  # Số lần gửi một email (kết nối lại giữa các lần) khi phiên SMTP bị lỗi
+
+def get_smtp_config():
+    """Cấu hình SMTP từ biến môi trường"""
+    return {
         'host': os.getenv("SMTP_HOST", "smtp.gmail.com"),
         'port': int(os.getenv("SMTP_PORT", "587")),
         'user': os.getenv("SMTP_USER"),
         'pass': os.getenv("SMTP_PASS"),
-        'to': os.getenv("EMAIL_TO")
+        'to': os.getenv("EMAIL_TO"),
+        'starttls': os.getenv("SMTP_STARTTLS", "1") != "0"
     }
+
+def load_subscribers(path, topics):
+    """Đọc danh sách người nhận: [{"email": ..., "topics": [...]}, ...]
+    
+    Thiếu "topics" (hoặc rỗng) nghĩa là nhận mọi chủ đề. Chủ đề không có trong
+    `topics` bị bỏ qua kèm cảnh báo; mục không có email bị bỏ qua.
+    """
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    
+    subscribers = []
+    for item in items:
+        email = (item.get("email") or "").strip()
+        if not email:
+            print(f"⚠️ Bỏ qua người nhận không có email: {item}")
+            continue
+        wanted = item.get("topics") or list(topics)
+        unknown = [topic for topic in wanted if topic not in topics]
+        if unknown:
+            print(f"⚠️ {email}: bỏ qua chủ đề không tồn tại {unknown}")
+        subscribers.append({"email": email, "topics": [topic for topic in topics if topic in wanted]})
+    return subscribers
+
+def build_email_message(sender, to, subject, body, html_body=None):
+    """Tạo message email dạng text, kèm bản HTML (multipart/alternative) nếu có"""
+    msg = MIMEMultipart('alternative') if html_body else MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return msg
+
+class SMTPSession:
+    """Một kết nối SMTP đã xác thực dùng để gửi nhiều email, tự kết nối lại khi phiên bị lỗi"""
+    
+    def __init__(self, smtp_config):
+        self.config = smtp_config
+        self.server = None
+        self.connects = 0
+        self.latencies = []
+    
+    def connect(self):
+        self.close()
+        server = smtplib.SMTP(self.config['host'], self.config['port'], timeout=DEFAULT_FETCH_TIMEOUT * 2)
+        try:
+            if self.config['starttls']:
+                server.starttls()
+            server.login(self.config['user'], self.config['pass'])
+        except BaseException:
+            server.close()
+            raise
+        self.server = server
+        self.connects += 1
+    
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                self.server.close()
+            self.server = None
+    
+    def send(self, msg):
+        """Gửi một email; phiên bị ngắt/lỗi thì kết nối lại và gửi lại (tối đa SMTP_SEND_ATTEMPTS lần)
+        
+        Lỗi của riêng email (người nhận bị từ chối...) và lỗi xác thực được ném
+        ra ngay, không kết nối lại.
+        """
+        data = msg.as_bytes()
+        for attempt in range(SMTP_SEND_ATTEMPTS):
+            try:
+                if self.server is None:
+                    self.connect()
+                with telemetry.span("email.send", host=self.config['host'], to=msg['To'], bytes=len(data)) as span:
+                    started = time.perf_counter()
+                    self.server.send_message(msg)
+                    latency = time.perf_counter() - started
+                    span["attempt"] = attempt + 1
+                self.latencies.append(latency)
+                return latency
+            except (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                    smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"  ⚠️ Phiên SMTP lỗi ({str(e)[:80]}), kết nối lại...")
+                self.server = None
+                if attempt == SMTP_SEND_ATTEMPTS - 1:
+                    raise
     
-    missing_config = [k for k, v in smtp_config.items() if k != 'host' and k != 'port' and not v]
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def send_to_subscribers(news_data, subscribers, smtp_config):
+    """Gửi bản tin cho từng người nhận qua một phiên SMTP; trả về True nếu mọi email đều gửi được
+    
+    Mỗi chuyên mục chỉ được dựng một lần rồi ghép lại theo chủ đề đăng ký của
+    từng người; người không có tin nào trong các chủ đề của mình được bỏ qua.
+    """
+    sections = {}
+    sent = failed = skipped = 0
+    print(f"📧 Gửi bản tin cho {len(subscribers)} người nhận qua một phiên SMTP...")
+    with SMTPSession(smtp_config) as session:
+        for subscriber in subscribers:
+            own_news = {topic: news_data.get(topic, []) for topic in subscriber["topics"]}
+            if not any(own_news.values()):
+                skipped += 1
+                print(f"  ⏭️ {subscriber['email']}: không có tin mới trong {', '.join(subscriber['topics'])}")
+                continue
+            
+            with telemetry.span("email.render", to=subscriber["email"]):
+                subject, body, html_body = render_email(own_news, sections)
+            msg = build_email_message(smtp_config['user'], subscriber["email"], subject, body, html_body)
+            try:
+                latency = session.send(msg)
+            except smtplib.SMTPAuthenticationError:
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                failed += 1
+                print(f"  ❌ {subscriber['email']}: {str(e)[:100]}")
+                continue
+            sent += 1
+            print(f"  ✉️ {subscriber['email']} ({', '.join(subscriber['topics'])}): {latency * 1000:.0f} ms")
+        
+        latencies = sorted(session.latencies)
+        connects = session.connects
+    
+    summary = f"📮 Đã gửi {sent}/{len(subscribers) - skipped} email qua {connects} lần kết nối"
+    if latencies:
+        summary += (f", độ trễ gửi p50 {latencies[len(latencies) // 2] * 1000:.0f} ms"
+                    f" / max {latencies[-1] * 1000:.0f} ms")
+    if skipped:
+        summary += f", bỏ qua {skipped} người không có tin"
+    print(summary)
+    return failed == 0
+
+def send_daily_email(news_data):
+    """Gửi email báo cáo hàng ngày
+    
+    Nếu đặt DIGEST_SUBSCRIBERS, gửi cho từng người trong danh sách theo chủ đề
+    đăng ký thay vì chỉ gửi một email tới EMAIL_TO.
+    """
+    
+    # Kiểm tra cấu hình SMTP
+    smtp_config = get_smtp_config()
+    
+    optional = ('host', 'port', 'starttls', 'to') if SUBSCRIBERS_FILE else ('host', 'port', 'starttls')
+    missing_config = [k for k, v in smtp_config.items() if k not in optional and not v]
     if missing_config:
         print(f"❌ Thiếu cấu hình email: {missing_config}")
         return False
     
     try:
+        if SUBSCRIBERS_FILE:
+            subscribers = load_subscribers(SUBSCRIBERS_FILE, list(news_data))
+            return send_to_subscribers(news_data, subscribers, smtp_config)
+        
         # Tạo nội dung email
-        subject, body = generate_email_content(news_data)
+        with telemetry.span("email.render"):
+            subject, body, html_body = render_email(news_data)
         
         # Tạo message
-        msg = MIMEMultipart()
-        msg['From'] = smtp_config['user']
-        msg['To'] = smtp_config['to']
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        msg = build_email_message(smtp_config['user'], smtp_config['to'], subject, body, html_body)
         
         # Gửi email
         print("📧 Đang kết nối SMTP server...")
-        with smtplib.SMTP(smtp_config['host'], smtp_config['port']) as server:
-            server.starttls()
-            server.login(smtp_config['user'], smtp_config['pass'])
-            server.send_message(msg)
+        with SMTPSession(smtp_config) as session:
+            session.send(msg)
         
         print("✅ Email đã được gửi thành công!")
         print(f"📬 Gửi tới: {smtp_config['to']}")
@@ -416,17 +3400,53 @@ def send_daily_email(news_data):
         print(f"❌ Lỗi gửi email: {e}")
         return False
 
+def load_digest_from_store(window_hours=DIGEST_WINDOW_HOURS):
+    """Dựng news_data từ kho bài viết cho các bài thu thập trong window_hours giờ gần nhất"""
+    store = get_article_store()
+    if store is None:
+        return {topic: [] for topic in RSS_FEEDS}
+    return store.load_digest(time.time() - window_hours * 3600, list(RSS_FEEDS))
+
 def main():
-    """Hàm chính của chương trình"""
+    """Hàm chính của chương trình
+    
+    DIGEST_RUN_MODE: "crawl" (mặc định) thu thập rồi gửi email như cũ; "poll"
+    chỉ thu thập bài mới vào kho; "store" thu thập bài mới rồi gửi email dựng
+    từ kho cho DIGEST_WINDOW_HOURS giờ gần nhất.
+    """
     print("🚀 DAILY NEWS DIGEST SYSTEM v2.0")
     print(f"⏰ Khởi động: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("🔧 Không sử dụng newspaper3k")
+    print(f"🗂️ Chế độ chạy: {RUN_MODE}")
     print("="*60)
     
     try:
         # Bước 1: Thu thập tin tức
         print("\n📡 BƯỚC 1: THU THẬP TIN TỨC")
-        news_data = collect_all_news()
+        with telemetry.span("stage.collect"):
+            news_data = collect_all_news()
+        
+        http_stats = get_http_stats()
+        print(f"🔌 HTTP: {http_stats['requests']} request, "
+              f"{http_stats['connections_opened']} kết nối mới, "
+              f"{http_stats['connections_reused']} lần tái sử dụng kết nối")
+        print_site_rule_report()
+        
+        cache = get_summary_cache()
+        if cache is not None:
+            print(f"💾 Cache tóm tắt: {cache.stats['hits']} hit, {cache.stats['misses']} miss, "
+                  f"{cache.stats['stores']} lưu mới, {cache.stats['evictions']} bị xoá")
+        print_llm_report()
+        
+        if RUN_MODE == "poll":
+            new_count = sum(len(articles) for articles in news_data.values())
+            print(f"\n✅ Đã lưu {new_count} bài mới vào kho, không gửi email ở chế độ poll")
+            save_feed_state()
+            return True
+        
+        if RUN_MODE == "store":
+            news_data = load_digest_from_store()
+            print(f"\n🗂️ Dựng bản tin từ kho: {DIGEST_WINDOW_HOURS:g} giờ gần nhất")
         
         # Bước 2: Kiểm tra kết quả
         total_news = sum(len(articles) for articles in news_data.values())
@@ -447,6 +3467,8 @@ def main():
         success = send_daily_email(news_data)
         
         if success:
+            # Chỉ lưu ETag/Last-Modified khi bản tin đã gửi xong, để lần chạy lại sau lỗi gửi vẫn tải đủ feed
+            save_feed_state()
             print("\n🎉 HOÀN THÀNH THÀNH CÔNG!")
             print(f"📊 Đã xử lý: {total_news} tin tức")
             print(f"⏰ Thời gian thực hiện: {datetime.now()}")
@@ -463,6 +3485,10 @@ def main():
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        telemetry.print_summary()
+        if RUN_REPORT_FILE:
+            telemetry.write_report(RUN_REPORT_FILE)
 
 if __name__ == "__main__":
     success = main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra tóm tắt gộp: đọc phản hồi (parse_batch_summaries) và chia batch (plan_summary_batches)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+class ParseBatchSummariesTest(unittest.TestCase):
+    def test_plain_json(self):
+        self.assertEqual(digest.parse_batch_summaries('{"1": "Một", "2": "Hai"}', 2), {1: "Một", 2: "Hai"})
+
+    def test_json_wrapped_in_prose_and_code_fence(self):
+        text = 'Đây là kết quả:\n```json\n{"1": " Một ", "2": "Hai {ngoặc}"}\n```\nHết.'
+        self.assertEqual(digest.parse_batch_summaries(text, 2), {1: "Một", 2: "Hai {ngoặc}"})
+
+    def test_missing_empty_and_invalid_values_are_left_out(self):
+        text = '{"1": "Một", "2": "  ", "3": 3, "4": null, "5": "Thừa"}'
+        self.assertEqual(digest.parse_batch_summaries(text, 4), {1: "Một"})
+
+    def test_unreadable_responses_raise_value_error(self):
+        for text in ("Xin lỗi, tôi không thể tóm tắt.", "} ngược {", '{"1": "Một",}', '{"1" "Một"}'):
+            with self.assertRaises(ValueError, msg=text):
+                digest.parse_batch_summaries(text, 1)
+
+class PlanSummaryBatchesTest(unittest.TestCase):
+    def test_splits_by_batch_size(self):
+        items = [("Tiêu đề", "Nội dung ngắn")] * 5
+        self.assertEqual(digest.plan_summary_batches(items, batch_size=2, token_budget=10_000), [[0, 1], [2, 3], [4]])
+
+    def test_splits_by_token_budget_but_never_leaves_an_item_out(self):
+        items = [("A", "x" * 3000), ("B", "x" * 3000), ("C", "x" * 30000)]
+        self.assertEqual(digest.plan_summary_batches(items, batch_size=10, token_budget=2500), [[0, 1], [2]])
+
+if __name__ == "__main__":
+    unittest.main()
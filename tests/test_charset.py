@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra xác định charset trang HTML (resolve_charset), mỗi nhánh một trường hợp
+
+Chạy: python -m unittest discover tests
+"""
+
+import codecs
+import os
+import sys
+import unicodedata
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+TEXT = ("Cháy lớn tại xưởng gỗ, hàng trăm mét vuông bị thiêu rụi. "
+        "Lực lượng Cảnh sát PCCC đã điều động xe chữa cháy đến hiện trường. ")
+PAGE = f"<html><head><title>Tin</title></head><body><p>{TEXT * 3}</p></body></html>"
+LATIN1 = "text/html; charset=ISO-8859-1"
+
+def to_cp1258(text):
+    """Mã hoá tiếng Việt sang cp1258: nguyên âm có sẵn trong bảng mã + dấu thanh tổ hợp"""
+    out = []
+    for char in unicodedata.normalize("NFC", text):
+        try:
+            out.append(char.encode("cp1258"))
+            continue
+        except UnicodeEncodeError:
+            pass
+        base, *marks = unicodedata.normalize("NFD", char)
+        for i, mark in enumerate(marks):
+            try:
+                out.append((unicodedata.normalize("NFC", base + mark) + "".join(marks[:i] + marks[i + 1:])).encode("cp1258"))
+                break
+            except UnicodeEncodeError:
+                continue
+        else:
+            out.append((base + "".join(marks)).encode("cp1258"))
+    return b"".join(out)
+
+class ResolveCharsetTest(unittest.TestCase):
+    def test_bom_wins_over_header(self):
+        body = codecs.BOM_UTF8 + PAGE.encode("utf-8")
+        self.assertEqual(digest.resolve_charset(body, "text/html; charset=windows-1258"), ("utf-8-sig", "bom"))
+
+    def test_strong_header(self):
+        self.assertEqual(digest.resolve_charset(to_cp1258(PAGE), "text/html; charset=windows-1258"), ("cp1258", "header"))
+
+    def test_meta(self):
+        body = b'<html><head><meta charset="windows-1258"></head>' + to_cp1258(PAGE)
+        self.assertEqual(digest.resolve_charset(body, LATIN1), ("cp1258", "meta"))
+
+    def test_utf16_meta_is_ignored(self):
+        body = b'<html><head><meta charset="utf-16"></head>' + PAGE.encode("utf-8")
+        self.assertEqual(digest.resolve_charset(body), ("utf-8", "utf-8"))
+
+    def test_utf8_over_weak_header(self):
+        self.assertEqual(digest.resolve_charset(PAGE.encode("utf-8"), LATIN1), ("utf-8", "utf-8"))
+
+    def test_truncated_utf8_only_when_truncated(self):
+        body = PAGE.encode("utf-8")
+        cut = body[:body.index("ớ".encode("utf-8")) + 1]  # Cắt giữa một ký tự nhiều byte
+        self.assertEqual(digest.resolve_charset(cut, truncated=True), ("utf-8", "utf-8"))
+        self.assertNotEqual(digest.resolve_charset(cut, truncated=False)[1], "utf-8")
+
+    def test_detection_runs_before_weak_header(self):
+        body = to_cp1258(PAGE)
+        self.assertEqual(digest.resolve_charset(body, LATIN1), ("cp1258", "detect"))
+        self.assertEqual(digest.resolve_charset(body), ("cp1258", "detect"))
+        self.assertEqual(unicodedata.normalize("NFC", digest.decode_html(body, LATIN1)), PAGE)
+
+    def test_weak_header_is_last_fallback(self):
+        body = "café".encode("latin-1")
+        with mock.patch.object(digest.chardet, "detect", return_value={"encoding": None}):
+            self.assertEqual(digest.resolve_charset(body, LATIN1), ("iso8859-1", "header"))
+            self.assertEqual(digest.resolve_charset(body), ("utf-8", "default"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra khử trùng lặp bài giữa các feed (canonicalize_url, ArticleIndex)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+class CanonicalizeUrlTest(unittest.TestCase):
+    def check(self, url, expected):
+        self.assertEqual(digest.canonicalize_url(url), expected, url)
+
+    def test_scheme_host_and_fragment(self):
+        self.check("http://www.vnexpress.net/tin-1.html#top", "https://vnexpress.net/tin-1.html")
+        self.check("  https://VNEXPRESS.net/A.html  ", "https://vnexpress.net/A.html")  # Path giữ hoa/thường
+        self.check("ftp://example.vn/a", "ftp://example.vn/a")
+
+    def test_mobile_and_amp_variants(self):
+        self.check("https://m.vnexpress.net/tin-1.html", "https://vnexpress.net/tin-1.html")
+        self.check("https://amp.tuoitre.vn/bai.amp.htm", "https://tuoitre.vn/bai.htm")
+        self.check("https://tuoitre.vn/bai-viet/amp/", "https://tuoitre.vn/bai-viet")
+        self.check("https://tuoitre.vn/amp/bai-viet", "https://tuoitre.vn/bai-viet")
+
+    def test_tracking_params_dropped_and_rest_sorted(self):
+        self.check("https://vnexpress.net/tin-1.html?utm_source=rss&id=2&fbclid=x", "https://vnexpress.net/tin-1.html?id=2")
+        self.check("https://example.vn/?zarsrc=1&gidzl=2&vn_source=3", "https://example.vn/")
+        self.check("https://example.vn/a/?b=2&a=1", "https://example.vn/a?a=1&b=2")
+
+    def test_ports(self):
+        self.check("https://example.vn:443/a", "https://example.vn/a")
+        self.check("https://example.vn:8080/a", "https://example.vn:8080/a")
+
+    def test_empty(self):
+        self.check("", "")
+        self.check(None, "")
+
+class ArticleIndexTest(unittest.TestCase):
+    TITLE = "Cháy lớn tại xưởng gỗ, hàng trăm mét vuông bị thiêu rụi"
+
+    def entry(self, link="", title=""):
+        return digest.feedparser.FeedParserDict(link=link, title=title)
+
+    def test_same_url_across_feeds(self):
+        index = digest.ArticleIndex()
+        key, is_new = index.add(self.entry("https://vnexpress.net/tin-1.html?utm_source=rss", "A"))
+        self.assertTrue(is_new)
+        self.assertEqual(index.add(self.entry("https://m.vnexpress.net/tin-1.html", "B")), (key, False))
+        self.assertEqual(index.duplicates, 1)
+
+    def test_same_title_different_url(self):
+        index = digest.ArticleIndex()
+        key, _ = index.add(self.entry("https://vnexpress.net/a.html", self.TITLE))
+        other, is_new = index.add(self.entry("https://baomoi.com/b.html", self.TITLE.upper().replace(",", "")))
+        self.assertEqual((other, is_new), (key, False))
+
+    def test_short_titles_are_not_matched(self):
+        index = digest.ArticleIndex()
+        index.add(self.entry("https://vnexpress.net/a.html", "Tin nóng"))
+        self.assertTrue(index.add(self.entry("https://tuoitre.vn/b.html", "Tin nóng"))[1])
+
+    def test_entry_without_link_or_title(self):
+        index = digest.ArticleIndex()
+        entries = [digest.FeedEntry(), digest.FeedEntry()]  # Giữ tham chiếu như danh sách entry thật
+        first, _ = index.add(entries[0])
+        second, is_new = index.add(entries[1])
+        self.assertTrue(is_new)
+        self.assertNotEqual(first, second)
+
+if __name__ == "__main__":
+    unittest.main()
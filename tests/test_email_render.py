@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra dựng email text/HTML (render_email)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+def article(**fields):
+    return dict({"title": "Tin", "link": "https://example.vn/a.html", "published": "",
+                 "summary": "Tóm tắt", "content_length": 1200}, **fields)
+
+class RenderEmailTest(unittest.TestCase):
+    def test_text_article_lines(self):
+        news = {"PCCC": [article(published="Mon, 06 Jan 2025"), article(link="")]}
+        _, text, _ = digest.render_email(news, with_html=False)
+        self.assertIn("1. Tin\n🔗 https://example.vn/a.html\n📅 Mon, 06 Jan 2025\n📝 Tóm tắt: Tóm tắt\n"
+                      "📏 Độ dài: 1200 ký tự\n\n" + "·" * 40 + "\n\n2. Tin\n📝 Tóm tắt:", text)
+
+    def test_html_escapes_feed_values_and_drops_unsafe_links(self):
+        news = {"A&B": [article(title='<b>"x"</b>', summary="1 < 2", link="javascript:alert(1)")]}
+        _, _, html_body = digest.render_email(news, with_html=True)
+        self.assertIn("A&amp;B", html_body)
+        self.assertIn("&lt;b&gt;&quot;x&quot;&lt;/b&gt;", html_body)
+        self.assertIn("1 &lt; 2", html_body)
+        self.assertNotIn("javascript:", html_body)
+        self.assertNotIn('class="', html_body)  # CSS đã được inline
+
+    def test_sections_are_reused_across_emails(self):
+        news = {"PCCC": [article()], "LNG": []}
+        sections = {}
+        _, first, _ = digest.render_email(news, sections, with_html=False)
+        self.assertEqual(list(sections), [("text", "PCCC")])
+        _, second, _ = digest.render_email(news, sections, with_html=False)
+        self.assertEqual(first.split("\n", 3)[3], second.split("\n", 3)[3])
+
+if __name__ == "__main__":
+    unittest.main()
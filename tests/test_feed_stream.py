@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra parser feed streaming (iter_feed_entries)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+MEDIA_RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"
+     xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel><title>Feed</title>
+<item>
+  <media:title>Anh minh hoa</media:title>
+  <media:content url="https://cdn.example.vn/anh.jpg" type="image/jpeg"/>
+  <title>Khai truong ga Nhon</title>
+  <link>https://example.vn/bai-1.html</link>
+  <description>Mo ta ngan</description>
+  <content:encoded><![CDATA[<p>Noi dung day du</p>]]></content:encoded>
+</item>
+</channel></rss>"""
+
+class IterFeedEntriesMediaTest(unittest.TestCase):
+    def setUp(self):
+        entries = list(digest.iter_feed_entries([MEDIA_RSS[:200], MEDIA_RSS[200:]]))
+        self.assertEqual(len(entries), 1)
+        self.entry = entries[0]
+
+    def test_media_content_does_not_shadow_content_encoded(self):
+        self.assertEqual(self.entry["content"], [{"value": "<p>Noi dung day du</p>"}])
+
+    def test_media_content_kept_as_url(self):
+        self.assertEqual(self.entry["media_content"][0]["url"], "https://cdn.example.vn/anh.jpg")
+
+    def test_media_title_does_not_shadow_title(self):
+        self.assertEqual(self.entry["title"], "Khai truong ga Nhon")
+        self.assertEqual(self.entry["description"], "Mo ta ngan")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra ngắt mạch theo host (HostHealth)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+URL = "https://cham.example.vn/bai-1.html"
+OTHER_URL = "https://cham.example.vn/bai-2.html"
+
+@unittest.skipIf(digest.BREAKER_FAILURES <= 0, "ngắt mạch đang tắt")
+class HalfOpenProbeTest(unittest.TestCase):
+    def setUp(self):
+        # Host bị ngắt ở lần chạy trước -> half-open
+        self.health = digest.HostHealth({"cham.example.vn": {"state": "open", "consecutive_failures": 3}})
+
+    def test_only_one_probe_in_flight(self):
+        self.assertTrue(self.health.allow(URL))
+        self.assertFalse(self.health.allow(OTHER_URL))
+        self.assertFalse(self.health.allow(URL))
+
+    def test_successful_probe_closes_breaker(self):
+        self.assertTrue(self.health.allow(URL))
+        self.health.record_success(URL, 0.2)
+        self.assertTrue(self.health.allow(OTHER_URL))
+        self.assertTrue(self.health.allow(URL))
+
+    def test_failed_probe_reopens_breaker(self):
+        self.assertTrue(self.health.allow(URL))
+        self.health.record_failure(URL)
+        self.assertFalse(self.health.allow(OTHER_URL))
+        self.assertEqual(self.health.open_hosts(), ["cham.example.vn"])
+
+    def test_released_probe_lets_next_request_try(self):
+        self.assertTrue(self.health.allow(URL))
+        self.health.release_probe(URL)
+        self.assertTrue(self.health.allow(OTHER_URL))
+        self.assertFalse(self.health.allow(URL))
+
+if __name__ == "__main__":
+    unittest.main()
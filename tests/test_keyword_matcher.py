@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra so khớp từ khoá chủ đề (KeywordMatcher)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+class KeywordMatcherFoldCollisionTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = digest.KeywordMatcher(digest.TOPIC_KEYWORDS)
+
+    def test_place_names_folding_to_nhon_do_not_match_mrt(self):
+        # "Nhơn" và "Nhổn" cùng thành "nhon" sau khi bỏ dấu
+        self.assertEqual(self.matcher.find("Quy Nhơn đón khách du lịch"), [])
+        self.assertNotIn("MRT", [label for label, _ in self.matcher.find("Nhà máy điện khí Nhơn Trạch 3 vận hành")])
+
+    def test_qualified_nhon_phrases_still_match(self):
+        self.assertIn(("MRT", "ga Nhổn"), self.matcher.find("Khánh thành ga Nhổn"))
+        self.assertIn(("MRT", "Nhổn - ga Hà Nội"), self.matcher.find("Tuyến Nhổn – ga Hà Nội chạy thử"))
+
+    def test_single_syllable_keyword_requires_accents(self):
+        matcher = digest.KeywordMatcher({"X": ["Nhổn"]})
+        self.assertEqual(matcher.find("Quy Nhơn"), [])
+        self.assertEqual(matcher.find("phố NHỔN"), [("X", "Nhổn")])
+
+    def test_multi_syllable_keywords_match_without_accents(self):
+        self.assertIn(("PCCC", "phòng cháy"), self.matcher.find("Tap huan phong chay cho cu dan"))
+
+if __name__ == "__main__":
+    unittest.main()
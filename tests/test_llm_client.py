@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra client LLM (LLMClient): thử lại, backoff, Retry-After, rate limit và hedging
+
+Không gọi mạng: session HTTP được thay bằng một session giả trả lời theo kịch bản.
+
+Chạy: python -m unittest discover tests
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+URL = "https://llm.example.vn/v1/chat/completions"
+PAYLOAD = {"model": "test", "messages": []}
+
+def make_response(status, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "test"
+    response.url = URL
+    response.raw = io.BytesIO()
+    response._content = json.dumps(body if body is not None else {}).encode("utf-8")
+    response.headers.update(headers or {})
+    return response
+
+class ScriptedSession:
+    """Session giả: mỗi lần post lấy bước tiếp theo trong kịch bản (response, exception hoặc hàm)"""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+            step = self.steps.pop(0)
+        if callable(step):
+            step = step()
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+class LLMClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        for patcher in (
+            mock.patch.object(digest.time, "sleep", self.sleeps.append),
+            mock.patch.object(digest.random, "uniform", lambda low, high: high),  # Backoff lớn nhất, dễ kiểm tra
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_session(self, session):
+        patcher = mock.patch.object(digest, "get_http_session", lambda: session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return session
+
+class RetryTest(LLMClientTestCase):
+    def test_rate_limited_then_success_honours_retry_after_and_halves_concurrency(self):
+        session = self.use_session(ScriptedSession(
+            make_response(429, headers={"Retry-After": "7"}),
+            make_response(200, {"usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}),
+        ))
+        client = digest.LLMClient(URL, max_concurrency=4, max_retries=3)
+        response = client.complete(PAYLOAD, "key")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 1)
+        self.assertEqual(session.calls, 2)
+        self.assertEqual(self.sleeps, [7.0])  # Retry-After dài hơn backoff 1 giây
+        self.assertEqual(client.limit, 2)
+        report = client.report()
+        self.assertEqual((report["rate_limited"], report["retries"], report["failures"]), (1, 1, 0))
+        self.assertEqual(report["total_tokens"], 15)
+
+    def test_retry_after_is_capped(self):
+        self.use_session(ScriptedSession(make_response(503, headers={"Retry-After": "3600"}), make_response(200)))
+        digest.LLMClient(URL, max_retries=1).complete(PAYLOAD, "key")
+        self.assertEqual(self.sleeps, [digest.LLM_BACKOFF_MAX])
+
+    def test_server_errors_back_off_exponentially_then_raise(self):
+        session = self.use_session(ScriptedSession(*(make_response(503) for _ in range(3))))
+        client = digest.LLMClient(URL, max_retries=2)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.complete(PAYLOAD, "key")
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(self.sleeps, [digest.LLM_BACKOFF_BASE, digest.LLM_BACKOFF_BASE * 2])
+        self.assertEqual((client.stats["server_errors"], client.stats["failures"]), (3, 1))
+
+    def test_client_errors_are_not_retried(self):
+        session = self.use_session(ScriptedSession(make_response(400)))
+        client = digest.LLMClient(URL, max_retries=3)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.complete(PAYLOAD, "key")
+        self.assertEqual((session.calls, self.sleeps, client.stats["failures"]), (1, [], 1))
+
+    def test_connection_error_is_retried(self):
+        self.use_session(ScriptedSession(requests.exceptions.ConnectionError("reset"), make_response(200)))
+        response = digest.LLMClient(URL, max_retries=2).complete(PAYLOAD, "key")
+        self.assertEqual((response.retries, self.sleeps), (1, [digest.LLM_BACKOFF_BASE]))
+
+    def test_timeouts_are_not_retried(self):
+        for error in (requests.exceptions.ReadTimeout("slow"), requests.exceptions.ConnectTimeout("slow")):
+            session = self.use_session(ScriptedSession(error, make_response(200)))
+            client = digest.LLMClient(URL, max_retries=2)
+            with self.assertRaises(requests.exceptions.Timeout):
+                client.complete(PAYLOAD, "key")
+            self.assertEqual((session.calls, self.sleeps, client.stats["failures"]), (1, [], 1))
+
+    def test_concurrency_grows_back_after_successes(self):
+        self.use_session(ScriptedSession(make_response(429), *(make_response(200) for _ in range(3))))
+        client = digest.LLMClient(URL, max_concurrency=4, max_retries=1)
+        client.complete(PAYLOAD, "key")  # 429 -> giới hạn 2, rồi 1 lần thành công
+        self.assertEqual(client.limit, 2)
+        client.complete(PAYLOAD, "key")  # Đủ 2 lần thành công liên tiếp -> tăng lên 3
+        self.assertEqual(client.limit, 3)
+
+class HedgeTest(LLMClientTestCase):
+    def make_client(self, max_concurrency):
+        client = digest.LLMClient(URL, max_concurrency=max_concurrency, max_retries=0, hedge=True)
+        client._latencies = [0.01] * digest.LLM_HEDGE_MIN_SAMPLES  # p95 đã đo = 10 ms
+        return client
+
+    def slow_primary(self, body, release_after=None):
+        """Request đầu chỉ trả lời khi được thả (hết test, hoặc sau release_after giây)"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        if release_after is not None:
+            timer = threading.Timer(release_after, release.set)
+            timer.start()
+            self.addCleanup(timer.cancel)
+
+        def step():
+            release.wait(5)
+            return make_response(200, body)
+        return step
+
+    def test_hedge_wins_when_primary_is_slower_than_p95(self):
+        self.use_session(ScriptedSession(self.slow_primary({"id": "primary"}), make_response(200, {"id": "hedge"})))
+        client = self.make_client(max_concurrency=2)
+        response = client.complete(PAYLOAD, "key")
+        self.assertEqual(response.json()["id"], "hedge")
+        self.assertEqual((client.stats["hedges"], client.stats["hedge_wins"], client.stats["requests"]), (1, 1, 2))
+
+    def test_no_hedge_without_a_free_slot(self):
+        session = self.use_session(ScriptedSession(self.slow_primary({"id": "primary"}, release_after=0.2)))
+        client = self.make_client(max_concurrency=1)
+        response = client.complete(PAYLOAD, "key")
+        self.assertEqual(response.json()["id"], "primary")
+        self.assertEqual((client.stats["hedges"], session.calls), (0, 1))
+
+    def test_no_hedge_before_enough_latency_samples(self):
+        session = self.use_session(ScriptedSession(make_response(200)))
+        client = digest.LLMClient(URL, max_concurrency=2, max_retries=0, hedge=True)
+        client.complete(PAYLOAD, "key")
+        self.assertEqual((client.stats["hedges"], session.calls), (0, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra xử lý từng bài (process_entries): một bài lỗi chỉ làm mất bài đó
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Feed</title>
+<item><link>https://example.vn/khong-tieu-de.html</link><description>Bai khong co tieu de</description></item>
+<item><title>Chay lon tai xuong go</title><link>https://example.vn/loi.html</link></item>
+<item><title>Tau dien Nhon - ga Ha Noi</title><link>https://example.vn/binh-thuong.html</link></item>
+</channel></rss>"""
+
+def fake_fetch(url, stats=None):
+    if url.endswith("/loi.html"):
+        raise RuntimeError("lỗi bất ngờ khi tải trang")
+    return f"Nội dung đầy đủ của {url}"
+
+def fake_summarize(content, title):
+    return f"Tóm tắt: {title}"
+
+@mock.patch.object(digest, "summarize_with_deepseek", fake_summarize)
+@mock.patch.object(digest, "fetch_article_content", fake_fetch)
+class ProcessEntriesIsolationTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = digest.feedparser.parse(FEED).entries
+        self.assertEqual(len(self.entries), 3)
+
+    def check(self, results):
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["link"], "https://example.vn/khong-tieu-de.html")
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2]["title"], "Tau dien Nhon - ga Ha Noi")
+
+    def test_sequential(self):
+        self.check(digest.process_entries(self.entries))
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self.check(digest.process_entries(self.entries, executor))
+
+    def test_batched(self):
+        with mock.patch.object(digest, "SUMMARY_BATCH_SIZE", 4), \
+                mock.patch.object(digest, "summarize_many",
+                                  lambda items, executor=None: [fake_summarize(c, t) for t, c in items]):
+            self.check(digest.process_entries(self.entries))
+
+    def test_stream_entry_without_title(self):
+        entries = list(digest.iter_feed_entries([FEED.encode("utf-8")]))
+        self.check(digest.process_entries(entries))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Kiểm tra cache tóm tắt (SummaryCache)
+
+Chạy: python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_news_digest as digest
+
+class SummaryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "state", "summary_cache.sqlite")
+        self.now = 1_700_000_000.0
+        patcher = mock.patch.object(digest.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self, **kwargs):
+        cache = digest.SummaryCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_key_covers_every_input(self):
+        args = ["deepseek-chat", "system", "user", "Tiêu đề", "Nội dung"]
+        key = digest.SummaryCache.make_key(*args)
+        self.assertEqual(key, digest.SummaryCache.make_key(*args))
+        for i in range(len(args)):
+            changed = list(args)
+            changed[i] += "!"
+            self.assertNotEqual(key, digest.SummaryCache.make_key(*changed))
+
+    def test_round_trip_survives_reopen(self):
+        cache = self.open()
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", "Tóm tắt")
+        cache.close()
+        cache = self.open()
+        self.assertEqual(cache.get("k"), "Tóm tắt")
+        self.assertEqual((cache.stats["hits"], cache.stats["misses"]), (1, 0))
+
+    def test_expired_entry_is_a_miss_and_deleted(self):
+        cache = self.open(ttl=60)
+        cache.put("k", "Tóm tắt")
+        self.now += 61
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats["evictions"], 1)
+        self.now -= 61
+        self.assertIsNone(cache.get("k"))
+
+    def test_evicts_least_recently_used_over_max_entries(self):
+        cache = self.open(max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, key.upper())
+            self.now += 1
+        cache.get("a")  # "b" giờ là mục ít dùng nhất
+        cache.evict()
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("c"), "C")
+
+if __name__ == "__main__":
+    unittest.main()